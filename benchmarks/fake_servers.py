@@ -0,0 +1,331 @@
+"""
+Локальные заглушки внешних сервисов для офлайн-бенчмарка агентов.
+
+FakeLLMServer — OpenAI-совместимый /chat/completions, воспроизводящий
+записанный транскрипт с заданной задержкой. FakeGitHubServer — минимальное
+подмножество REST API GitHub, которое используют DeveloperAgent и ReviewerAgent.
+Модуль не импортирует src: заглушки поднимаются до загрузки конфигурации агента.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+from urllib.parse import parse_qs, unquote, urlparse
+
+ServerT = TypeVar("ServerT", bound="_Server")
+
+
+class _Server:
+    handler_class: type
+
+    def __init__(self):
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self.handler_class)
+        self._httpd.daemon_threads = True
+        self._httpd.owner = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._httpd.server_port}"
+
+    def start(self: ServerT) -> ServerT:
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def owner(self):
+        return self.server.owner
+
+    def _body(self) -> Any:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        return json.loads(raw) if raw else None
+
+    def _send(self, status: int, payload: Any = None, headers: Optional[Dict[str, str]] = None):
+        body = b"" if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if payload is not None:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+# --- LLM ---
+
+class _LLMHandler(_Handler):
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        request = self._body() or {}
+        entry = self.owner.next_response(request.get("messages", []))
+        if entry is None:
+            self._send(500, {"error": {"message": "transcript exhausted"}})
+            return
+
+        usage = {
+            "prompt_tokens": entry["usage"].get("prompt_tokens", _estimate(json.dumps(request.get("messages", [])))),
+            "completion_tokens": entry["usage"].get("completion_tokens", _estimate(entry["content"])),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        time.sleep(self.owner.latency + self.owner.seconds_per_token * usage["completion_tokens"])
+
+        if request.get("stream"):
+            self._stream(entry["content"], request.get("model", ""))
+            return
+        self._send(200, {
+            "id": "chatcmpl-replay",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", ""),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": entry["content"]}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _stream(self, content: str, model: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for start in range(0, len(content), 32):
+            chunk = {
+                "id": "chatcmpl-replay", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": content[start:start + 32]}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+def _estimate(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class FakeLLMServer(_Server):
+    """
+    Отвечает записями транскрипта: сначала по ключу сообщений (точное совпадение
+    запроса), иначе следующей неиспользованной записью по порядку — так сценарий
+    переживает мелкие изменения промптов.
+    """
+
+    handler_class = _LLMHandler
+
+    def __init__(self, key_fn: Callable[[List[Dict[str, str]]], str]):
+        super().__init__()
+        self.key_fn = key_fn
+        self.latency = 0.0
+        self.seconds_per_token = 0.0
+        self._entries: List[Dict[str, Any]] = []
+        self._used: List[bool] = []
+        self.requests = 0
+
+    def load(self, entries: List[Dict[str, Any]], latency_ms: float = 0, ms_per_token: float = 0):
+        with self.lock:
+            self._entries = [{"key": e.get("key"), "content": e["content"], "usage": e.get("usage") or {}} for e in entries]
+            self._used = [False] * len(self._entries)
+            self.latency = latency_ms / 1000
+            self.seconds_per_token = ms_per_token / 1000
+            self.requests = 0
+
+    def next_response(self, messages: List[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+        key = self.key_fn(messages)
+        with self.lock:
+            self.requests += 1
+            candidates = [n for n, e in enumerate(self._entries) if not self._used[n] and e["key"] == key]
+            if not candidates:
+                candidates = [n for n, used in enumerate(self._used) if not used]
+            if not candidates:
+                return None
+            self._used[candidates[0]] = True
+            return self._entries[candidates[0]]
+
+
+# --- GitHub ---
+
+class _GitHubHandler(_Handler):
+    def _dispatch(self, method: str):
+        parsed = urlparse(self.path)
+        body = self._body() if method in {"POST", "PATCH"} else None
+        status, payload = self.owner.handle(method, parsed.path, parse_qs(parsed.query), body)
+        headers = {
+            "X-RateLimit-Limit": "5000",
+            "X-RateLimit-Remaining": str(max(0, 5000 - self.owner.counted_requests)),
+            "X-RateLimit-Reset": str(int(time.time()) + 3600),
+        }
+        if method == "GET" and status == 200:
+            etag = '"' + hashlib.sha1(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest() + '"'
+            headers["ETag"] = etag
+            if self.headers.get("If-None-Match") == etag:
+                with self.owner.lock:
+                    self.owner.not_modified += 1
+                self._send(304, None, headers)
+                return
+        with self.owner.lock:
+            self.owner.counted_requests += 1
+        self._send(status, payload, headers)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+
+class FakeGitHubServer(_Server):
+    """
+    Репозиторий с Issue и PR в памяти. Запросы, ушедшие в «лимит» (без 304),
+    считаются в counted_requests; опубликованные комментарии и PR доступны для проверок.
+    """
+
+    handler_class = _GitHubHandler
+
+    def __init__(self, repo_name: str, login: str = "replay-bot"):
+        super().__init__()
+        self.repo_name = repo_name
+        self.login = login  # владелец токена: автор всех комментариев, созданных через API
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.issues: Dict[int, Dict[str, Any]] = {}
+            self.pulls: Dict[int, Dict[str, Any]] = {}
+            self.files: Dict[int, List[Dict[str, Any]]] = {}
+            self.comments: Dict[int, List[Dict[str, Any]]] = {}
+            self.labels: Dict[int, List[str]] = {}
+            self.counted_requests = 0
+            self.not_modified = 0
+            self._next_number = 100
+
+    def _repo_url(self) -> str:
+        return f"{self.url}/repos/{self.repo_name}"
+
+    def add_issue(self, number: int, title: str, body: str):
+        with self.lock:
+            self.issues[number] = {"number": number, "title": title, "body": body}
+
+    def add_pull(self, number: int, title: str, body: str, head_sha: str, files: List[Dict[str, str]]):
+        with self.lock:
+            self.pulls[number] = {"number": number, "title": title, "body": body, "head_sha": head_sha, "head_ref": f"pr-{number}"}
+            self.files[number] = [dict(f) for f in files]
+
+    def _issue_json(self, number: int) -> Dict[str, Any]:
+        issue = self.issues.get(number) or self.pulls[number]
+        return {
+            "number": number,
+            "title": issue["title"],
+            "body": issue["body"],
+            "state": "open",
+            "url": f"{self._repo_url()}/issues/{number}",
+            "html_url": f"https://github.com/{self.repo_name}/issues/{number}",
+            "labels": [{"name": name} for name in self.labels.get(number, [])],
+        }
+
+    def _pull_json(self, number: int) -> Dict[str, Any]:
+        pull = self.pulls[number]
+        return {
+            "number": number,
+            "title": pull["title"],
+            "body": pull["body"],
+            "state": "open",
+            "url": f"{self._repo_url()}/pulls/{number}",
+            "issue_url": f"{self._repo_url()}/issues/{number}",
+            "html_url": f"https://github.com/{self.repo_name}/pull/{number}",
+            "head": {"sha": pull["head_sha"], "ref": pull["head_ref"], "label": f"owner:{pull['head_ref']}"},
+            "base": {"ref": "main", "sha": "0" * 40},
+            "labels": [{"name": name} for name in self.labels.get(number, [])],
+        }
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]], body: Any):
+        if path == "/user" and method == "GET":
+            return 200, {"login": self.login, "url": f"{self.url}/user"}
+        prefix = f"/repos/{self.repo_name}"
+        if not path.startswith(prefix):
+            return 404, {"message": "Not Found"}
+        route = path[len(prefix):]
+
+        with self.lock:
+            if route in ("", "/") and method == "GET":
+                return 200, {"full_name": self.repo_name, "name": self.repo_name.split("/")[-1], "url": self._repo_url()}
+
+            if route == "/pulls" and method == "GET":
+                head = (query.get("head") or [""])[0].split(":")[-1]
+                found = [self._pull_json(n) for n, p in self.pulls.items() if not head or p["head_ref"] == head]
+                return 200, found
+            if route == "/pulls" and method == "POST":
+                number = self._next_number
+                self._next_number += 1
+                self.pulls[number] = {
+                    "number": number, "title": body["title"], "body": body.get("body", ""),
+                    "head_sha": "f" * 40, "head_ref": body["head"],
+                }
+                self.files[number] = []
+                return 201, self._pull_json(number)
+
+            match = re.fullmatch(r"/pulls/(\d+)(/files)?", route)
+            if match and method == "GET":
+                number = int(match.group(1))
+                if number not in self.pulls:
+                    return 404, {"message": "Not Found"}
+                if match.group(2):
+                    return 200, [{"filename": f["filename"], "patch": f.get("patch"), "status": "modified", "sha": "0" * 40}
+                                 for f in self.files[number]]
+                return 200, self._pull_json(number)
+
+            # Предков заглушка не хранит: пуши сценария идут друг за другом, старый head — всегда предок
+            match = re.fullmatch(r"/compare/([^.]+)\.\.\.(.+)", route)
+            if match and method == "GET":
+                base, head = match.groups()
+                return 200, {"status": "identical" if base == head else "ahead",
+                             "url": f"{self._repo_url()}/compare/{base}...{head}"}
+
+            match = re.fullmatch(r"/issues/(\d+)(/comments|/labels(?:/(.+))?)?", route)
+            if match:
+                number = int(match.group(1))
+                if number not in self.issues and number not in self.pulls:
+                    return 404, {"message": "Not Found"}
+                sub = match.group(2) or ""
+                if not sub and method == "GET":
+                    return 200, self._issue_json(number)
+                if sub == "/comments" and method == "GET":
+                    return 200, self.comments.get(number, [])
+                if sub == "/comments" and method == "POST":
+                    comment = {"id": len(self.comments.get(number, [])) + 1, "body": body["body"],
+                               "user": {"login": self.login},
+                               "url": f"{self._repo_url()}/issues/comments/{number}"}
+                    self.comments.setdefault(number, []).append(comment)
+                    return 201, comment
+                if sub == "/labels" and method == "POST":
+                    names = body if isinstance(body, list) else body.get("labels", [])
+                    current = self.labels.setdefault(number, [])
+                    current.extend(name for name in names if name not in current)
+                    return 200, [{"name": name} for name in current]
+                if sub.startswith("/labels/") and method == "DELETE":
+                    name = unquote(match.group(3))
+                    self.labels[number] = [n for n in self.labels.get(number, []) if n != name]
+                    return 200, [{"name": n} for n in self.labels[number]]
+
+        return 404, {"message": f"Not Found: {method} {route}"}
@@ -0,0 +1,342 @@
+"""
+Бенчмарк PaymentProcessor: поштучные методы против пакетных (NumPy).
+
+    python -m benchmarks.payments                 # 1 000 000 транзакций
+    python -m benchmarks.payments -n 200000 --json payments.json
+    python -m benchmarks.payments --memory        # байт на транзакцию
+    python -m benchmarks.payments --queries       # отчетные запросы: проход по dict против индексов
+    python -m benchmarks.payments --durability    # цена журнала, снимок и время перезапуска
+    python -m benchmarks.payments --refunds       # возвраты: потоки и секции против process_refunds
+
+Каждая операция меряется дважды: циклом по поштучному методу и одним
+вызовом пакетного; в таблице время и ускорение. Режим --memory сравнивает
+прежнее хранение (dict идентификаторов на dataclass с datetime) с таблицей
+PaymentProcessor по tracemalloc, включая сами строки идентификаторов.
+Режим --queries загружает месяц транзакций с 1% возвратов и сравнивает
+фильтры и агрегаты проходом по dict с запросами через индексы.
+Режим --durability пишет те же транзакции без хранилища и с журналом
+(sync="interval" и "always"), затем снимает снимок и меряет перезапуск:
+загрузку снимка с хвостом журнала.
+Режим --refunds оформляет возвраты по всем транзакциям (10% id повторяются)
+циклом process_refund, из нескольких потоков над секционированным
+хранилищем и пакетным process_refunds.
+"""
+import argparse
+import json
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.project_to_modify.transaction_service import PaymentProcessor
+from src.project_to_modify.transaction_store import TransactionStore
+
+CURRENCIES = ("USD", "EUR", "GBP", "RUB")
+
+
+@dataclass
+class LegacyTransaction:
+    """Запись в том виде, в каком PaymentProcessor хранил ее до таблицы."""
+    id: str
+    amount: float
+    currency: str
+    status: str
+    timestamp: datetime
+
+
+def _timed(fn: Callable[[], Any]) -> float:
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+def make_dataset(n: int, seed: int = 7) -> Dict[str, Any]:
+    rng = np.random.default_rng(seed)
+    return {
+        "ids": [f"tx{i}" for i in range(n)],
+        "amounts": np.round(rng.uniform(0, 5000, n), 2),
+        "currencies": np.array(CURRENCIES, dtype=object)[rng.integers(0, len(CURRENCIES), n)],
+        "discounts": rng.uniform(0, 100, n),
+        "exempt": rng.random(n) < 0.1,
+    }
+
+
+def bench_throughput(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Загрузка и расчет цен: цикл по поштучным методам против пакетных."""
+    n = len(data["ids"])
+    amounts, discounts, exempt = data["amounts"], data["discounts"], data["exempt"]
+    amount_list, discount_list, exempt_list = amounts.tolist(), discounts.tolist(), exempt.tolist()
+    currency_list = data["currencies"].tolist()
+
+    def scalar_ingest():
+        processor = PaymentProcessor()
+        for t_id, amount, currency in zip(data["ids"], amount_list, currency_list, strict=True):
+            processor.add_transaction(t_id, amount, currency)
+
+    def batch_ingest():
+        PaymentProcessor().add_transactions(data["ids"], amounts, data["currencies"])
+
+    processor = PaymentProcessor()
+    cases = [
+        ("ingest", scalar_ingest, batch_ingest),
+        ("total_with_tax",
+         lambda: [processor.calculate_total_with_tax(a) for a in amount_list],
+         lambda: processor.calculate_totals_with_tax(amounts)),
+        ("apply_discount",
+         lambda: [processor.apply_discount(a, d) for a, d in zip(amount_list, discount_list, strict=True)],
+         lambda: processor.apply_discounts(amounts, discounts)),
+        ("final_amount",
+         lambda: [processor.calculate_final_amount(a, e) for a, e in zip(amount_list, exempt_list, strict=True)],
+         lambda: processor.calculate_final_amounts(amounts, exempt)),
+    ]
+    rows = []
+    for name, scalar, batch in cases:
+        scalar_s, batch_s = _timed(scalar), _timed(batch)
+        rows.append({
+            "operation": name,
+            "rows": n,
+            "scalar_s": round(scalar_s, 4),
+            "batch_s": round(batch_s, 4),
+            "speedup": round(scalar_s / batch_s, 1) if batch_s else float("inf"),
+        })
+    return rows
+
+
+def _allocated(build: Callable[[], Any]) -> int:
+    """Сколько байт удерживает результат build() после его завершения."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def bench_memory(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Байт на транзакцию: dict dataclass-ов против таблицы, идентификаторы строятся внутри замера."""
+    n = len(data["ids"])
+    amount_list, currency_list = data["amounts"].tolist(), data["currencies"].tolist()
+
+    def legacy():
+        transactions = {}
+        for i, amount, currency in zip(range(n), amount_list, currency_list, strict=True):
+            t_id = f"tx{i}"
+            transactions[t_id] = LegacyTransaction(t_id, amount, currency, "PENDING", datetime.now())
+        return transactions
+
+    def scalar():
+        processor = PaymentProcessor()
+        for i, amount, currency in zip(range(n), amount_list, currency_list, strict=True):
+            processor.add_transaction(f"tx{i}", amount, currency)
+        return processor
+
+    def batch():
+        processor = PaymentProcessor()
+        processor.add_transactions([f"tx{i}" for i in range(n)], data["amounts"], data["currencies"])
+        return processor
+
+    legacy_bytes = _allocated(legacy)
+    rows = [{"storage": "dict[str, dataclass]", "rows": n, "bytes_per_tx": round(legacy_bytes / n, 1), "reduction": 1.0}]
+    for name, build in (("table, add_transaction", scalar), ("table, add_transactions", batch)):
+        used = _allocated(build)
+        rows.append({"storage": name, "rows": n, "bytes_per_tx": round(used / n, 1),
+                     "reduction": round(legacy_bytes / used, 1)})
+    return rows
+
+
+def bench_queries(data: Dict[str, Any], repeat: int = 5) -> List[Dict[str, Any]]:
+    """Отчетные запросы: генератор по dict dataclass-ов против индексов PaymentProcessor (лучшее из repeat)."""
+    n = len(data["ids"])
+    end = datetime(2026, 1, 31)
+    # Месяц транзакций по возрастанию времени, как при обычной работе
+    offsets = np.sort(np.random.default_rng(11).uniform(0, 30 * 24 * 3600 * 1e6, n)).astype(np.int64)
+    stamps = np.datetime64(end - timedelta(days=30), "us") + offsets.astype("timedelta64[us]")
+    refunded = data["ids"][::100]
+
+    processor = PaymentProcessor()
+    processor.add_transactions(data["ids"], data["amounts"], data["currencies"], timestamps=stamps)
+    legacy = {
+        t_id: LegacyTransaction(t_id, amount, currency, "PENDING", moment)
+        for t_id, amount, currency, moment in zip(data["ids"], data["amounts"].tolist(),
+                                                  data["currencies"].tolist(), stamps.tolist(), strict=True)
+    }
+    for t_id in refunded:
+        processor.process_refund(t_id, 1)
+        legacy[t_id].status = "REFUNDED"
+
+    hour_ago, today = end - timedelta(hours=1), end - timedelta(days=1)
+
+    def legacy_totals(status: Optional[str] = None) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        for tx in legacy.values():
+            if status is None or tx.status == status:
+                totals[tx.currency] = totals.get(tx.currency, 0.0) + tx.amount
+        return totals
+
+    cases: List[Tuple[str, Callable[[], Any], Callable[[], Any]]] = [
+        ("count PENDING EUR",
+         lambda: sum(1 for tx in legacy.values() if tx.status == "PENDING" and tx.currency == "EUR"),
+         lambda: processor.count_transactions("PENDING", "EUR")),
+        ("ids last hour",
+         lambda: [tx.id for tx in legacy.values() if tx.timestamp >= hour_ago],
+         lambda: processor.find_transactions(since=hour_ago)),
+        ("ids REFUNDED today",
+         lambda: [tx.id for tx in legacy.values() if tx.status == "REFUNDED" and tx.timestamp >= today],
+         lambda: processor.find_transactions("REFUNDED", since=today)),
+        ("totals REFUNDED", lambda: legacy_totals("REFUNDED"), lambda: processor.totals_by_currency("REFUNDED")),
+        ("totals all", legacy_totals, processor.totals_by_currency),
+        ("counts by status",
+         lambda: {s: sum(1 for tx in legacy.values() if tx.status == s) for s in ("PENDING", "REFUNDED")},
+         processor.counts_by_status),
+    ]
+    rows = []
+    for name, scan, indexed in cases:
+        result = indexed()
+        scan_s = min(_timed(scan) for _ in range(2))
+        indexed_s = min(_timed(indexed) for _ in range(repeat))
+        rows.append({
+            "query": name,
+            "rows": result if isinstance(result, int) else len(result),
+            "scan_ms": round(scan_s * 1000, 2),
+            "indexed_ms": round(indexed_s * 1000, 3),
+            "speedup": round(scan_s / indexed_s) if indexed_s else float("inf"),
+        })
+    return rows
+
+
+def bench_durability(data: Dict[str, Any], always_ops: int = 2000) -> List[Dict[str, Any]]:
+    """Запись без хранилища и с журналом, снимок и восстановление после перезапуска."""
+    n = len(data["ids"])
+    ids, amounts, currencies = data["ids"], data["amounts"], data["currencies"]
+    amount_list, currency_list = amounts.tolist(), currencies.tolist()
+    refunded = ids[::10]
+    rows = []
+
+    def row(operation: str, count: int, seconds: float):
+        rows.append({"operation": operation, "rows": count, "s": round(seconds, 3),
+                     "us_per_tx": round(seconds / count * 1e6, 2)})
+
+    def scalar_ingest(processor: PaymentProcessor, count: int):
+        for t_id, amount, currency in zip(ids[:count], amount_list[:count], currency_list[:count], strict=True):
+            processor.add_transaction(t_id, amount, currency)
+
+    def reopen(directory: str) -> PaymentProcessor:
+        return PaymentProcessor(store=TransactionStore(directory, snapshot_bytes=None))
+
+    def refunds(processor: PaymentProcessor) -> float:
+        return _timed(lambda: [processor.process_refund(t_id, 1) for t_id in refunded])
+
+    row("add_transaction, memory", n, _timed(lambda: scalar_ingest(PaymentProcessor(), n)))
+    processor = PaymentProcessor()
+    row("add_transactions, memory", n, _timed(lambda: processor.add_transactions(ids, amounts, currencies)))
+    row("process_refund, memory", len(refunded), refunds(processor))
+
+    with tempfile.TemporaryDirectory() as directory:
+        count = min(always_ops, n)
+        with PaymentProcessor(store=TransactionStore(directory, sync="always", snapshot_bytes=None)) as processor:
+            row("add_transaction, sync=always", count, _timed(lambda: scalar_ingest(processor, count)))
+    with tempfile.TemporaryDirectory() as directory:
+        with reopen(directory) as processor:
+            row("add_transaction, journal", n, _timed(lambda: scalar_ingest(processor, n)))
+        started = time.perf_counter()
+        with reopen(directory):
+            row("restart: journal replay", n, time.perf_counter() - started)
+    with tempfile.TemporaryDirectory() as directory:
+        with reopen(directory) as processor:
+            row("add_transactions, journal", n, _timed(lambda: processor.add_transactions(ids, amounts, currencies)))
+            row("snapshot", n, _timed(processor.snapshot))
+            # Хвост журнала после снимка: возвраты по 10% транзакций
+            row("process_refund, journal", len(refunded), refunds(processor))
+        started = time.perf_counter()
+        with reopen(directory):
+            row("restart: snapshot + tail", n, time.perf_counter() - started)
+    return rows
+
+
+def bench_refunds(data: Dict[str, Any], threads: int = 4) -> List[Dict[str, Any]]:
+    """Возвраты: цикл, потоки над секциями и пакет; в каждом случае проверяется, что двойных возвратов нет."""
+    n = len(data["ids"])
+    ids = data["ids"] + data["ids"][::10]
+    rows = []
+
+    def run(name: str, shards: int, refund: Callable[[PaymentProcessor], List[str]]):
+        processor = PaymentProcessor(shards=shards)
+        processor.add_transactions(data["ids"], data["amounts"] + 1, data["currencies"])
+        started = time.perf_counter()
+        results = refund(processor)
+        seconds = time.perf_counter() - started
+        processor.close()
+        succeeded = sum(result.startswith("SUCCESS") for result in results)
+        if succeeded != n or processor.count_transactions("REFUNDED") != n:
+            raise AssertionError(f"{name}: {succeeded} успешных возвратов на {n} транзакций")
+        rows.append({"mode": name, "shards": shards, "refunds": len(ids), "s": round(seconds, 3),
+                     "refunds_per_s": round(len(ids) / seconds)})
+
+    def in_threads(processor: PaymentProcessor) -> List[str]:
+        results: List[List[str]] = [[] for _ in range(threads)]
+
+        def worker(k: int):
+            results[k] = [processor.process_refund(t_id, 1.0) for t_id in ids[k::threads]]
+
+        workers = [threading.Thread(target=worker, args=(k,)) for k in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return [result for part in results for result in part]
+
+    run("process_refund, loop", 1, lambda processor: [processor.process_refund(t_id, 1.0) for t_id in ids])
+    run(f"process_refund, {threads} threads", threads, in_threads)
+    run("process_refunds", 1, lambda processor: processor.process_refunds(ids, 1.0))
+    run("process_refunds", threads, lambda processor: processor.process_refunds(ids, 1.0))
+    return rows
+
+
+def print_table(rows: List[Dict[str, Any]]):
+    columns = list(rows[0])
+    widths = [max(len(c), *(len(str(row[c])) for row in rows)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths, strict=True)))
+    for row in rows:
+        print("  ".join(str(row[c]).ljust(w) for c, w in zip(columns, widths, strict=True)))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Пропускная способность PaymentProcessor")
+    parser.add_argument("-n", "--rows", type=int, default=1_000_000, help="Число транзакций")
+    parser.add_argument("--json", help="Сохранить отчет в JSON")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--memory", action="store_true", help="Память на транзакцию вместо скорости")
+    mode.add_argument("--queries", action="store_true", help="Отчетные запросы: проход по dict против индексов")
+    mode.add_argument("--durability", action="store_true", help="Журнал, снимки и время перезапуска")
+    mode.add_argument("--refunds", action="store_true", help="Возвраты: потоки и секции против пакетного API")
+    args = parser.parse_args(argv)
+
+    data = make_dataset(args.rows)
+    if args.memory:
+        report = bench_memory(data)
+    elif args.queries:
+        report = bench_queries(data)
+    elif args.durability:
+        report = bench_durability(data)
+    elif args.refunds:
+        report = bench_refunds(data)
+    else:
+        report = bench_throughput(data)
+    print_table(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
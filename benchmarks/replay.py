@@ -0,0 +1,266 @@
+"""
+Офлайн-бенчмарк агентов: DeveloperAgent и ReviewerAgent прогоняются end-to-end
+против локальных заглушек LLM и GitHub (benchmarks/fake_servers.py) по
+сценариям из benchmarks/scenarios.
+
+    python -m benchmarks.replay                          # все сценарии, таблица
+    python -m benchmarks.replay -s developer_fix_bug --json report.json
+    python -m benchmarks.replay --baseline benchmarks/baseline.json   # CI: код 1 при регрессии
+    python -m benchmarks.replay --update-baseline
+
+Транскрипт сценария — список ответов LLM; его можно записать с живой модели,
+запустив агента с LLM_RECORD_PATH=... и указав файл в "transcript_file".
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+BENCH_DIR = Path(__file__).resolve().parent
+SCENARIOS_DIR = BENCH_DIR / "scenarios"
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+REPO_NAME = "bench/replay"
+
+# Метрики, которые сравниваются с baseline: детерминированные (строго с допуском) и время
+COUNT_METRICS = ("iterations", "llm_calls", "prompt_tokens", "completion_tokens", "github_requests")
+TIME_METRICS = ("wall_s",)
+
+
+def load_scenarios(names: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    scenarios = []
+    for path in sorted(SCENARIOS_DIR.glob("*.json")):
+        scenario = json.loads(path.read_text(encoding="utf-8"))
+        scenario.setdefault("name", path.stem)
+        if not names or scenario["name"] in names:
+            scenarios.append(scenario)
+    missing = set(names or ()) - {s["name"] for s in scenarios}
+    if missing:
+        sys.exit(f"Неизвестные сценарии: {', '.join(sorted(missing))}")
+    return scenarios
+
+
+def load_transcript(scenario: Dict[str, Any], key: str = "transcript") -> List[Dict[str, Any]]:
+    """Ответы LLM сценария: inline-список или записанный LLM_RECORD_PATH файл (JSONL)."""
+    if f"{key}_file" in scenario:
+        path = SCENARIOS_DIR / scenario[f"{key}_file"]
+        return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+    entries = []
+    for item in scenario.get(key, []):
+        content = item.get("content", item)
+        entries.append({
+            "key": item.get("key") if "content" in item else None,
+            "content": content if isinstance(content, str) else json.dumps(content, ensure_ascii=False),
+            "usage": item.get("usage", {}) if "content" in item else {},
+        })
+    return entries
+
+
+def _git(args: List[str], cwd: Path):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+
+def _make_workspace(root: Path, files: Dict[str, str]) -> Path:
+    root.mkdir(parents=True)
+    for rel_path, content in files.items():
+        target = root / rel_path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(content, encoding="utf-8")
+    _git(["init", "-q", "-b", "main"], root)
+    _git(["add", "."], root)
+    _git(["-c", "user.name=bench", "-c", "user.email=bench@local", "commit", "-q", "-m", "init"], root)
+    return root
+
+
+class Harness:
+    """Поднимает заглушки, настраивает окружение агента и прогоняет сценарии."""
+
+    def __init__(self, workdir: Path, trace_path: Optional[str] = None, verbose: bool = False):
+        from benchmarks.fake_servers import FakeGitHubServer, FakeLLMServer
+
+        self.workdir = workdir
+        self.github = FakeGitHubServer(REPO_NAME).start()
+        # Ключ транскрипта берется из llm_client после настройки окружения
+        self.llm = FakeLLMServer(key_fn=lambda messages: self._transcript_key(messages)).start()
+        self.remote = workdir / "remote.git"
+        _git(["init", "-q", "--bare", str(self.remote)], workdir)
+
+        defaults = {
+            "GH_TOKEN": "replay-token",
+            "API_KEY": "replay-key",
+            "REPO_NAME": REPO_NAME,
+            "BASE_URL": f"{self.llm.url}/v1",
+            "MODEL_NAME": "replay-model",
+            "GITHUB_API_URL": self.github.url,
+            "GIT_REMOTE_URL": str(self.remote),
+            "GITHUB_CACHE_PATH": str(workdir / "github-cache.db"),
+            "LLM_HTTP2": "false",
+            "LLM_CACHE_PATH": "",
+            "LLM_RECORD_PATH": "",
+            "REVIEW_CHUNK_TOKENS": "1500",
+            "REVIEW_BOT_LOGIN": self.github.login,
+            "TRACE_PATH": trace_path or "",
+        }
+        os.environ.update(defaults)
+
+        from src.llm_client import transcript_key
+        from src.logger import log
+        from src.tracing import metrics
+
+        if not verbose:
+            log.setLevel(logging.WARNING)
+
+        self._transcript_key = transcript_key
+        self.metrics = metrics
+
+    def close(self):
+        self.llm.stop()
+        self.github.stop()
+
+    def run(self, scenario: Dict[str, Any]) -> Dict[str, Any]:
+        self.github.reset()
+        self.metrics.drain()
+        self.llm.load(load_transcript(scenario), scenario.get("latency_ms", 0), scenario.get("ms_per_token", 0))
+
+        started = time.perf_counter()
+        if scenario["agent"] == "developer":
+            outcome = self._run_developer(scenario)
+        elif scenario["agent"] == "reviewer":
+            outcome = self._run_reviewer(scenario)
+        else:
+            raise ValueError(f"Неизвестный агент: {scenario['agent']}")
+        wall = time.perf_counter() - started
+
+        return {"scenario": scenario["name"], "agent": scenario["agent"], "outcome": outcome, "wall_s": round(wall, 3),
+                **self._collect(self.metrics.drain())}
+
+    def _run_developer(self, scenario: Dict[str, Any]) -> str:
+        from src.agents.code_agent import DeveloperAgent
+
+        workspace = _make_workspace(self.workdir / scenario["name"], scenario.get("files", {}))
+        issue = scenario["issue"]
+        self.github.add_issue(issue["number"], issue["title"], issue.get("body", ""))
+
+        DeveloperAgent(workspace=str(workspace)).run(issue["number"])
+        runs = {labels: value for (name, labels), value in self._counters().items() if name == "agent_runs_total"}
+        return str(next((dict(labels).get("outcome") for labels in runs), "unknown"))
+
+    def _run_reviewer(self, scenario: Dict[str, Any]) -> str:
+        from src.agents.ai_reviewer import ReviewerAgent
+
+        pr = scenario["pr"]
+        cwd = os.getcwd()
+        review_dir = self.workdir / scenario["name"]
+        review_dir.mkdir(parents=True)
+        (review_dir / "ci_results.txt").write_text(scenario.get("ci_results", "All checks passed."), encoding="utf-8")
+
+        # Каждый push — отдельный запуск ревьюера (synchronize), как в ai_reviewer.yml
+        os.chdir(review_dir)
+        try:
+            for push in pr["pushes"]:
+                self.github.add_pull(pr["number"], pr["title"], pr.get("body", ""), push["head_sha"], push["files"])
+                ReviewerAgent(pr["number"]).run()
+        finally:
+            os.chdir(cwd)
+
+        comments = self.github.comments.get(pr["number"], [])
+        return "reviewed" if len(comments) == len(pr["pushes"]) else f"comments={len(comments)}"
+
+    def _counters(self) -> Dict:
+        snapshot = self.metrics.snapshot()
+        return {(name, tuple(map(tuple, labels))): value for name, labels, value in snapshot["counters"]}
+
+    def _collect(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        counters = {(name, tuple(map(tuple, labels))): value for name, labels, value in data["counters"]}
+        histograms = {(name, tuple(map(tuple, labels))): hist for name, labels, hist in data["histograms"]}
+
+        def spans(prefix: str) -> float:
+            return float(sum(v for (name, labels), v in counters.items()
+                             if name == "agent_spans_total" and dict(labels)["span"].startswith(prefix)))
+
+        def seconds(prefix: str) -> float:
+            return float(sum(hist[-2] for (name, labels), hist in histograms.items()
+                             if name == "agent_span_duration_seconds" and dict(labels)["span"].startswith(prefix)))
+
+        def tokens(kind: str) -> float:
+            return float(sum(v for (name, labels), v in counters.items()
+                             if name == "agent_llm_tokens_total" and dict(labels)["kind"] == kind))
+
+        return {
+            "iterations": int(spans("agent.iteration")),
+            "llm_calls": self.llm.requests,
+            "prompt_tokens": int(tokens("prompt")),
+            "completion_tokens": int(tokens("completion")),
+            "llm_s": round(seconds("llm."), 3),
+            "tool_s": round(seconds("tool."), 3),
+            "github_requests": self.github.counted_requests,
+            "github_304": self.github.not_modified,
+        }
+
+
+def compare(report: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float, wall_tolerance: float) -> List[str]:
+    """Регрессии относительно baseline: счетчики — с допуском tolerance, время — wall_tolerance."""
+    regressions = []
+    for row in report:
+        base = baseline.get(row["scenario"])
+        if base is None:
+            continue
+        if row["outcome"] != base.get("outcome"):
+            regressions.append(f"{row['scenario']}: исход {row['outcome']!r}, ожидался {base.get('outcome')!r}")
+        for metric, allowed in [(m, tolerance) for m in COUNT_METRICS] + [(m, wall_tolerance) for m in TIME_METRICS]:
+            if metric in base and row[metric] > base[metric] * (1 + allowed):
+                regressions.append(f"{row['scenario']}: {metric} {row[metric]} > {base[metric]} (+{allowed:.0%})")
+    return regressions
+
+
+def print_table(report: List[Dict[str, Any]]):
+    columns = ["scenario", "outcome", "wall_s", "iterations", "llm_calls", "prompt_tokens",
+               "completion_tokens", "llm_s", "tool_s", "github_requests", "github_304"]
+    widths = [max(len(c), *(len(str(row[c])) for row in report)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths, strict=True)))
+    for row in report:
+        print("  ".join(str(row[c]).ljust(w) for c, w in zip(columns, widths, strict=True)))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк агентов на записанных транскриптах")
+    parser.add_argument("-s", "--scenario", action="append", help="Имя сценария (можно несколько)")
+    parser.add_argument("--json", help="Сохранить отчет в JSON")
+    parser.add_argument("--trace", help="Записать спаны в JSONL")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Показывать лог агентов")
+    parser.add_argument("--baseline", help="Сравнить с baseline и вернуть код 1 при регрессии")
+    parser.add_argument("--update-baseline", action="store_true", help=f"Перезаписать {DEFAULT_BASELINE.name}")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Допуск для итераций/токенов/запросов")
+    parser.add_argument("--wall-tolerance", type=float, default=1.0, help="Допуск для времени выполнения")
+    args = parser.parse_args(argv)
+
+    scenarios = load_scenarios(args.scenario)
+    with tempfile.TemporaryDirectory(prefix="agent-bench-") as tmp:
+        harness = Harness(Path(tmp), trace_path=args.trace, verbose=args.verbose)
+        try:
+            report = [harness.run(scenario) for scenario in scenarios]
+        finally:
+            harness.close()
+
+    print_table(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.update_baseline:
+        baseline = {row["scenario"]: {k: row[k] for k in ("outcome", *COUNT_METRICS, *TIME_METRICS)} for row in report}
+        DEFAULT_BASELINE.write_text(json.dumps(baseline, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+
+    if args.baseline:
+        regressions = compare(report, json.loads(Path(args.baseline).read_text(encoding="utf-8")), args.tolerance, args.wall_tolerance)
+        for line in regressions:
+            print(f"РЕГРЕССИЯ: {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+Бенчмарк холодного старта: сколько стоит импорт точек входа агентов и
+webhook-сервера и какие тяжелые зависимости при этом загружаются.
+
+    python -m benchmarks.startup                  # таблица, медиана по 5 запускам
+    python -m benchmarks.startup -n 10 --json startup.json
+    python -m benchmarks.startup --check          # код 1, если импорт тянет лишнее
+
+Каждый замер — отдельный процесс без GH_TOKEN/API_KEY/REPO_NAME: импорт
+модулей src не должен ни читать конфигурацию, ни завершать процесс.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Зависимости, которые загружаются только при первом обращении к клиентам
+HEAVY_MODULES = ("openai", "httpx", "github", "requests", "rich")
+
+# (имя, аргументы python)
+TARGETS = [
+    ("import code_agent", ["-c", "import src.agents.code_agent"]),
+    ("import ai_reviewer", ["-c", "import src.agents.ai_reviewer"]),
+    ("import webhook_server", ["-c", "import src.webhook_server"]),
+    ("code_agent --help", ["-m", "src.agents.code_agent", "--help"]),
+    ("ai_reviewer --help", ["-m", "src.agents.ai_reviewer", "--help"]),
+]
+
+_PROBE = (
+    "import atexit, json, sys\n"
+    "atexit.register(lambda: sys.__stderr__.write('\\n@@' + json.dumps("
+    "[m for m in {heavy!r} if m in sys.modules]) + '\\n'))\n"
+)
+
+
+def _env() -> Dict[str, str]:
+    env = {k: v for k, v in os.environ.items() if k not in {"GH_TOKEN", "API_KEY", "REPO_NAME"}}
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def measure(args: List[str], runs: int) -> Dict[str, Any]:
+    """Медиана и минимум времени запуска и список загруженных тяжелых модулей."""
+    # Время меряется на чистом запуске, список модулей — отдельным запуском с зондом
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, *args], cwd=ROOT, env=_env(), capture_output=True, text=True)
+        times.append(time.perf_counter() - started)
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(args)}: код {result.returncode}\n{result.stderr}")
+
+    probe = _PROBE.format(heavy=HEAVY_MODULES)
+    if args[0] == "-c":
+        probe_args = ["-c", probe + args[1]]
+    else:
+        probe_args = ["-c", probe + f"import runpy, sys; sys.argv = {[args[1], *args[2:]]!r}; "
+                                    f"runpy.run_module({args[1]!r}, run_name='__main__')"]
+    result = subprocess.run([sys.executable, *probe_args], cwd=ROOT, env=_env(), capture_output=True, text=True)
+    marker = [line for line in result.stderr.splitlines() if line.startswith("@@")]
+    return {
+        "median_ms": round(statistics.median(times) * 1000, 1),
+        "min_ms": round(min(times) * 1000, 1),
+        "heavy": json.loads(marker[-1][2:]) if marker else None,
+    }
+
+
+def baseline_interpreter(runs: int) -> float:
+    """Старт пустого интерпретатора: нижняя граница для всех замеров."""
+    median_ms: float = measure(["-c", "pass"], runs)["median_ms"]
+    return median_ms
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Время холодного старта точек входа агентов")
+    parser.add_argument("-n", "--runs", type=int, default=5, help="Запусков на точку входа")
+    parser.add_argument("--json", help="Сохранить отчет в JSON")
+    parser.add_argument("--check", action="store_true", help="Код 1, если импорт загружает тяжелые зависимости")
+    args = parser.parse_args(argv)
+
+    interpreter_ms = baseline_interpreter(args.runs)
+    report = []
+    for name, target_args in TARGETS:
+        row = {"target": name, **measure(target_args, args.runs)}
+        row["overhead_ms"] = round(row["median_ms"] - interpreter_ms, 1)
+        report.append(row)
+
+    width = max(len(row["target"]) for row in report)
+    print(f"{'target'.ljust(width)}  median_ms  overhead_ms  heavy")
+    print(f"{'python -c pass'.ljust(width)}  {interpreter_ms:>9}  {0:>11}  -")
+    for row in report:
+        heavy = ", ".join(row["heavy"] or []) or "-"
+        print(f"{row['target'].ljust(width)}  {row['median_ms']:>9}  {row['overhead_ms']:>11}  {heavy}")
+
+    if args.json:
+        Path(args.json).write_text(
+            json.dumps({"interpreter_ms": interpreter_ms, "targets": report}, ensure_ascii=False, indent=2),
+            encoding="utf-8"
+        )
+    if args.check:
+        failed = [row for row in report if row["heavy"] is None or row["heavy"]]
+        for row in failed:
+            print(f"РЕГРЕССИЯ: {row['target']} загружает {', '.join(row['heavy'] or ['?'])}")
+        return 1 if failed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,18 +2,39 @@ import os
 import sys
 import argparse
 import re
-from typing import Dict, Any
-
-from github import Auth, Github, Repository, PullRequest
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
 from src.config import settings
+from src.diff_chunks import DiffChunk, DiffPiece, hunk_pieces, pack
 from src.llm_client import LLMService
-from src.logger import log, configure_logging
+from src.review_cache import ReviewState, attribute_details, restore_details
+from src.logger import configure_logging, log, log_context
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 if BASE_DIR not in sys.path:
     sys.path.append(BASE_DIR)
 
+if TYPE_CHECKING:
+    from github import PullRequest, Repository
+
+
+def get_repository() -> "Repository.Repository":
+    """Репозиторий из общего клиента GitHub; PyGithub и requests импортируются только здесь."""
+    from src.github_client import get_repository as shared_repository
+
+    return shared_repository()
+
+
+def get_bot_login() -> str:
+    """Логин, от имени которого бот пишет комментарии: REVIEW_BOT_LOGIN или владелец токена."""
+    bot_login: str = settings.REVIEW_BOT_LOGIN
+    if bot_login:
+        return bot_login
+    from src.github_client import get_github
+
+    return get_github().get_user().login
+
+
 class ReviewerAgent:
     SYSTEM_PROMPT = """
     Ты — Senior Python Developer. Проведи Code Review PR.
@@ -30,52 +51,176 @@ class ReviewerAgent:
     }
     """
 
+    CHUNK_PROMPT = """
+    Ты — Senior Python Developer. Проверь ЧАСТЬ diff большого PR (остальные части смотрят другие ревьюеры).
+
+    1. Ищи баги, проблемы безопасности и "плохой код" только в показанных файлах.
+    2. Не делай выводов о коде, которого не видишь.
+
+    Ответ строго JSON:
+    {
+      "status": "APPROVED" | "CHANGES_REQUESTED",
+      "summary": "Краткое резюме этой части на русском",
+      "review_details": [{"file_path": "...", "line_number": int, "comment": "..."}]
+    }
+    """
+
+    AGGREGATE_PROMPT = """
+    Ты — Senior Python Developer. Несколько ревьюеров проверили части одного PR.
+    Сведи их выводы в итоговое ревью.
+
+    1. Если хотя бы одна часть требует исправлений или тесты (pytest) в CI упали — статус CHANGES_REQUESTED.
+    2. Резюме — общее для всего PR, без повторов, на русском.
+
+    Ответ строго JSON:
+    {"status": "APPROVED" | "CHANGES_REQUESTED", "summary": "Резюме на русском"}
+    """
+
     def __init__(self, pr_number: int):
-        auth = Auth.Token(settings.GH_TOKEN)
-        self.gh = Github(auth=auth)
-        self.repo: Repository.Repository = self.gh.get_repo(settings.REPO_NAME)
-        self.pr: PullRequest.PullRequest = self.repo.get_pull(pr_number)
+        self.repo: "Repository.Repository" = get_repository()
+        self.pr: "PullRequest.PullRequest" = self.repo.get_pull(pr_number)
         self.llm = LLMService()
+        try:
+            self.login: Optional[str] = get_bot_login()
+        except Exception as e:
+            # Без своего логина чужой маркер не отличить от своего — состояние не используется
+            log.warning(f"Не удалось определить логин бота, ревью будет полным: {e}")
+            self.login = None
 
-    def _get_context(self) -> str:
-        """Агрегирует данные для промпта."""
-        log.info(f"Сбор данных для PR #{self.pr.number}...")
-        
-        diff = ""
-        for file in self.pr.get_files():
-            patch = file.patch or "[Binary/Large]"
-            diff += f"File: {file.filename}\n```diff\n{patch}\n```\n\n"
-
-        ci_status = "CI Results: Not found."
+    @staticmethod
+    def _read_ci_status() -> str:
         # Нужна бы проверка статусов GitHub Actions
         # Для совместимости с исходным кодом читаем файл
         try:
             with open("ci_results.txt", "r", encoding="utf-8") as f:
-                ci_status = f.read()
+                return f.read()
         except FileNotFoundError:
-            pass
+            return "CI Results: Not found."
 
+    def _header(self, ci_status: str) -> str:
         return f"""
         TITLE: {self.pr.title}
         BODY: {self.pr.body}
         CI STATUS: {ci_status}
-        
-        DIFF:
-        {diff[:20000]} 
-        """ # Лимит токенов — это разумно, не правда ли?)
+        """
+
+    def _get_pieces(self) -> List[DiffPiece]:
+        """Делит diff PR на хунки (единицы кэша ревью) — весь PR, без обрезки."""
+        log.info(f"Сбор данных для PR #{self.pr.number}...")
+        pieces: List[DiffPiece] = []
+        for file in self.pr.get_files():
+            pieces.extend(hunk_pieces(file.filename, file.patch or "[Binary/Large]", settings.REVIEW_CHUNK_TOKENS))
+        return pieces
+
+    def _load_state(self, head_sha: str) -> Optional[ReviewState]:
+        """
+        Состояние прошлого ревью из скрытого маркера в комментариях PR. Маркеры
+        принимаются только из комментариев самого бота и только для коммита-предка
+        head_sha: иначе подделанный или устаревший маркер скрыл бы код от ревью.
+        """
+        if not self.login:
+            return None
+        state = ReviewState.from_comments(
+            comment.body for comment in self.pr.get_issue_comments()
+            if comment.user is not None and comment.user.login == self.login
+        )
+        if state is None or state.head_sha == head_sha:
+            return state
+        try:
+            status = self.repo.compare(state.head_sha, head_sha).status
+        except Exception as e:
+            log.warning(f"PR #{self.pr.number}: не удалось сравнить {state.head_sha[:8]} с {head_sha[:8]}: {e}")
+            return None
+        if status not in ("ahead", "identical"):
+            log.info(f"PR #{self.pr.number}: коммит {state.head_sha[:8]} не предок {head_sha[:8]} ({status}), ревью полное.")
+            return None
+        return state
+
+    def _review_chunks(
+        self,
+        chunks: List[DiffChunk],
+        ci_status: str,
+        carried: Optional[List[Dict[str, Any]]] = None,
+        previous_summary: str = ""
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Map: чанки ревьюятся параллельно; reduce: один короткий вызов сводит статусы и резюме,
+        учитывая замечания по неизмененным хункам из прошлого ревью.
+        В review_details возвращаются только новые замечания, в reviewed — ключи проверенных хунков.
+        """
+        carried = carried or []
+        header = self._header(ci_status)
+        batch = [
+            [
+                {"role": "system", "content": self.CHUNK_PROMPT},
+                {"role": "user", "content": f"{header}\n        ЧАСТЬ {n} ИЗ {len(chunks)}:\n{chunk.render()}"}
+            ]
+            for n, chunk in enumerate(chunks, start=1)
+        ]
+        partial: List[Dict[str, Any]] = []
+        if batch:
+            log.info(f"PR #{self.pr.number}: {len(chunks)} частей, параллельное ревью...")
+            results = self.llm.generate_many(batch)
+            missing = [i for i, r in enumerate(results) if not r or "error" in r]
+            if missing:
+                # Части без ответа повторяются один раз: вердикт по части diff не публикуется
+                log.warning(f"PR #{self.pr.number}: {len(missing)} частей без ответа, повтор...")
+                retried = self.llm.generate_many([batch[i] for i in missing])
+                for i, result in zip(missing, retried, strict=True):
+                    results[i] = result
+            partial = [r for r in results if r and "error" not in r]
+            if len(partial) < len(batch):
+                log.error(f"PR #{self.pr.number}: {len(batch) - len(partial)} частей не проверены, ревью отменено.")
+                return None
+
+        details: List[Dict[str, Any]] = []
+        seen = set()
+        for result in partial:
+            for item in result.get("review_details") or []:
+                if not isinstance(item, dict):
+                    continue
+                key = (item.get("file_path"), item.get("line_number"), item.get("comment"))
+                if key not in seen:
+                    seen.add(key)
+                    details.append(item)
+
+        findings = "\n".join(
+            f"- Часть {n}: {r.get('status')} — {r.get('summary')}" for n, r in enumerate(partial, start=1)
+        )
+        if previous_summary or carried:
+            findings += f"\n- Без изменений с прошлого ревью: {previous_summary}"
+            findings += "".join(f"\n  - `{d['file_path']}`: {d['comment']}" for d in carried)
+        merged = self.llm.generate_json([
+            {"role": "system", "content": self.AGGREGATE_PROMPT},
+            {"role": "user", "content": f"{header}\n        ВЫВОДЫ ПО ЧАСТЯМ:\n{findings}"}
+        ])
+        if not merged or "error" in merged:
+            # Сводка не удалась — собираем итог без LLM
+            failed = bool(carried) or any(r.get("status") != "APPROVED" for r in partial)
+            merged = {"status": "CHANGES_REQUESTED" if failed else "APPROVED", "summary": findings}
+
+        reviewed = [piece.key for chunk in chunks for piece in chunk.pieces]
+        return {
+            "status": merged.get("status"), "summary": merged.get("summary"),
+            "review_details": details, "reviewed": reviewed
+        }
 
-    def _publish_review(self, review: Dict[str, Any]):
-        """Публикует комментарий и ставит лейблы."""
+    def _publish_review(self, review: Dict[str, Any], state: Optional[ReviewState] = None):
+        """Публикует комментарий (со скрытым состоянием для следующего ревью) и ставит лейблы."""
         body = f"## AI Review\n\n{review.get('summary')}\n\n"
         
         for item in review.get("review_details", []):
             line_info = f" (line {item['line_number']})" if item.get('line_number') else ""
             body += f"- `{item.get('file_path')}`{line_info}: {item['comment']}\n"
 
+        if state is not None:
+            body += f"\n{state.to_marker()}\n"
+
         self.pr.create_issue_comment(body)
         
         status = review.get("status")
-        labels = {l.name for l in self.pr.get_labels()}
+        # Лейблы уже пришли вместе с PR — отдельный запрос не нужен
+        labels = {l.name for l in self.pr.labels}
         
         if status == "APPROVED":
             if "changes-needed" in labels: self.pr.remove_from_labels("changes-needed")
@@ -87,24 +232,53 @@ class ReviewerAgent:
         log.info(f"Ревью опубликовано. Статус: {status}")
 
     def run(self):
-        context = self._get_context()
-        messages = [
-            {"role": "system", "content": self.SYSTEM_PROMPT},
-            {"role": "user", "content": context}
-        ]
-        
-        result = self.llm.generate_json(messages)
+        with log_context(pr=self.pr.number):
+            self._review()
+
+    def _review(self):
+        head_sha = self.pr.head.sha
+        previous = self._load_state(head_sha)
+        if previous is not None and previous.head_sha == head_sha:
+            log.info(f"PR #{self.pr.number}: коммит {head_sha[:8]} уже проверен, ревью пропущено.")
+            return
+
+        ci_status = self._read_ci_status()
+        pieces = self._get_pieces()
+        # Хунки, не изменившиеся с прошлого ревью, в LLM не отправляются — их замечания переносятся
+        cached = previous.findings if previous is not None else {}
+        fresh = [piece for piece in pieces if piece.key not in cached]
+        carried = [d for piece in pieces if piece.key in cached for d in restore_details(piece, cached[piece.key])]
+        chunks = pack(fresh, settings.REVIEW_CHUNK_TOKENS)
+        log.info(f"PR #{self.pr.number}: новых хунков {len(fresh)} из {len(pieces)}")
+
+        if previous is None and len(chunks) <= 1:
+            diff = chunks[0].render() if chunks else ""
+            messages = [
+                {"role": "system", "content": self.SYSTEM_PROMPT},
+                {"role": "user", "content": f"{self._header(ci_status)}\n        DIFF:\n{diff}"}
+            ]
+            result = self.llm.generate_json(messages)
+        else:
+            result = self._review_chunks(chunks, ci_status, carried, previous.summary if previous else "")
+
         if not result or "error" in result:
             log.error("Не удалось получить ревью от LLM.")
             return
 
-        self._publish_review(result)
+        new_details = [d for d in result.get("review_details") or [] if isinstance(d, dict)]
+        # В состояние попадают только проверенные хунки: остальные уйдут в LLM при следующем ревью
+        reviewed = set(result.pop("reviewed", [piece.key for piece in fresh]))
+        findings = {piece.key: cached[piece.key] for piece in pieces if piece.key in cached}
+        findings.update(attribute_details([piece for piece in fresh if piece.key in reviewed], new_details))
+        state = ReviewState(head_sha=head_sha, summary=result.get("summary") or "", findings=findings)
+
+        self._publish_review({**result, "review_details": new_details + carried}, state)
 
 if __name__ == "__main__":
-    configure_logging()
     parser = argparse.ArgumentParser()
     parser.add_argument("--pr-number", type=int, required=True)
     args = parser.parse_args()
+    configure_logging()
     
     agent = ReviewerAgent(args.pr_number)
     agent.run()
@@ -1,9 +1,16 @@
 import os
 import sys
+import threading
 from dataclasses import dataclass
-from dotenv import load_dotenv
+from typing import Optional
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
 
-load_dotenv()
 
 @dataclass(frozen=True)
 class AppConfig:
@@ -13,12 +20,60 @@ class AppConfig:
     BASE_URL: str
     MODEL_NAME: str
     MAX_ITERATIONS: int
+    # Бюджет контекста DeveloperAgent
+    CONTEXT_TOKEN_BUDGET: int
+    CONTEXT_KEEP_RECENT: int
+    # Потоки для параллельного выполнения read-only инструментов
+    TOOL_WORKERS: int
+    # Полный прогон тестов перед create_pr
+    FULL_TESTS_BEFORE_PR: bool
+    # Очередь задач webhook-сервера
+    JOB_WORKERS: int
+    JOB_QUEUE_SIZE: int
+    JOB_RETRY_AFTER: int
+    # Пул git worktree для параллельных запусков (пустой путь — работа в cwd)
+    WORKTREE_POOL_DIR: str
+    WORKTREE_POOL_SIZE: int
+    WORKTREE_BASE_REF: str
+    # Пул HTTP-соединений к LLM (общий на процесс)
+    LLM_MAX_CONNECTIONS: int
+    LLM_MAX_KEEPALIVE: int
+    LLM_HTTP2: bool
+    LLM_CONCURRENCY: int
+    LLM_STREAM: bool
+    # Кэш ответов LLM на диске (пустой путь — кэш выключен)
+    LLM_CACHE_PATH: str
+    LLM_CACHE_MAX_MB: int
+    LLM_CACHE_TTL_HOURS: float
+
+    # Общий клиент GitHub: пул соединений, ETag-кэш и запас лимита API
+    GITHUB_API_URL: str
+    GITHUB_POOL_SIZE: int
+    GITHUB_CACHE_PATH: str
+    GITHUB_CACHE_MAX_MB: int
+    GITHUB_RATE_RESERVE: int
+
+    # Ревью больших PR по частям: бюджет одной части (токены)
+    REVIEW_CHUNK_TOKENS: int
+    # Логин бота: состояние ревью читается только из его комментариев (пусто — владелец GH_TOKEN)
+    REVIEW_BOT_LOGIN: str
+
+    # Трассировка: JSONL-файл спанов (пусто — только метрики в памяти)
+    TRACE_PATH: str
+
+    # Адрес для git push (пусто — https://github.com/<REPO_NAME>.git с токеном)
+    GIT_REMOTE_URL: str
+    # Запись ответов LLM в JSONL для офлайн-бенчмарка (пусто — выключено)
+    LLM_RECORD_PATH: str
 
     @classmethod
     def load(cls) -> "AppConfig":
+        from dotenv import load_dotenv
+
+        load_dotenv()
         required_vars = ["GH_TOKEN", "API_KEY", "REPO_NAME"]
         missing = [var for var in required_vars if not os.getenv(var)]
-        
+
         if missing:
             sys.exit(f"CRITICAL: Отсутствуют обязательные переменные окружения: {', '.join(missing)}")
 
@@ -28,7 +83,64 @@ class AppConfig:
             REPO_NAME=os.getenv("REPO_NAME"),
             BASE_URL=os.getenv("BASE_URL", "https://api.openai.com/v1"),
             MODEL_NAME=os.getenv("MODEL_NAME", "gpt-4o-mini"),
-            MAX_ITERATIONS=int(os.getenv("MAX_ITERATIONS", 12))
+            MAX_ITERATIONS=int(os.getenv("MAX_ITERATIONS", 12)),
+            CONTEXT_TOKEN_BUDGET=int(os.getenv("CONTEXT_TOKEN_BUDGET", 24000)),
+            CONTEXT_KEEP_RECENT=int(os.getenv("CONTEXT_KEEP_RECENT", 3)),
+            TOOL_WORKERS=int(os.getenv("TOOL_WORKERS", 8)),
+            FULL_TESTS_BEFORE_PR=_env_bool("FULL_TESTS_BEFORE_PR", True),
+            JOB_WORKERS=int(os.getenv("JOB_WORKERS", 1)),
+            JOB_QUEUE_SIZE=int(os.getenv("JOB_QUEUE_SIZE", 20)),
+            JOB_RETRY_AFTER=int(os.getenv("JOB_RETRY_AFTER", 60)),
+            WORKTREE_POOL_DIR=os.getenv("WORKTREE_POOL_DIR", ""),
+            WORKTREE_POOL_SIZE=int(os.getenv("WORKTREE_POOL_SIZE", os.getenv("JOB_WORKERS", 1))),
+            WORKTREE_BASE_REF=os.getenv("WORKTREE_BASE_REF", "HEAD"),
+            LLM_MAX_CONNECTIONS=int(os.getenv("LLM_MAX_CONNECTIONS", 20)),
+            LLM_MAX_KEEPALIVE=int(os.getenv("LLM_MAX_KEEPALIVE", 10)),
+            LLM_HTTP2=_env_bool("LLM_HTTP2", True),
+            LLM_CONCURRENCY=int(os.getenv("LLM_CONCURRENCY", 4)),
+            LLM_STREAM=_env_bool("LLM_STREAM", False),
+            LLM_CACHE_PATH=os.getenv("LLM_CACHE_PATH", ""),
+            LLM_CACHE_MAX_MB=int(os.getenv("LLM_CACHE_MAX_MB", 256)),
+            LLM_CACHE_TTL_HOURS=float(os.getenv("LLM_CACHE_TTL_HOURS", 168)),
+            GITHUB_API_URL=os.getenv("GITHUB_API_URL", "https://api.github.com"),
+            GITHUB_POOL_SIZE=int(os.getenv("GITHUB_POOL_SIZE", 10)),
+            GITHUB_CACHE_PATH=os.getenv("GITHUB_CACHE_PATH", ""),
+            GITHUB_CACHE_MAX_MB=int(os.getenv("GITHUB_CACHE_MAX_MB", 64)),
+            GITHUB_RATE_RESERVE=int(os.getenv("GITHUB_RATE_RESERVE", 50)),
+            REVIEW_CHUNK_TOKENS=int(os.getenv("REVIEW_CHUNK_TOKENS", 6000)),
+            REVIEW_BOT_LOGIN=os.getenv("REVIEW_BOT_LOGIN", ""),
+            TRACE_PATH=os.getenv("TRACE_PATH", ""),
+            GIT_REMOTE_URL=os.getenv("GIT_REMOTE_URL", ""),
+            LLM_RECORD_PATH=os.getenv("LLM_RECORD_PATH", "")
         )
 
-settings = AppConfig.load()
+
+_settings: Optional[AppConfig] = None
+_settings_lock = threading.Lock()
+
+
+def get_settings() -> AppConfig:
+    """Конфигурация процесса; окружение читается при первом обращении, а не при импорте."""
+    global _settings
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = AppConfig.load()
+    return _settings
+
+
+class _LazySettings:
+    """
+    `from src.config import settings` не загружает конфигурацию: модули можно
+    импортировать без переменных окружения, а проверка обязательных переменных
+    (и sys.exit) происходит при первом чтении настройки.
+    """
+
+    def __getattr__(self, name: str):
+        return getattr(get_settings(), name)
+
+    def __repr__(self) -> str:
+        return repr(_settings) if _settings is not None else "<settings: не загружены>"
+
+
+settings = _LazySettings()
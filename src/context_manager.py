@@ -0,0 +1,182 @@
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from src.logger import log
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """tiktoken опционален: без него считаем токены по оценке."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = None
+    return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    """Число токенов в тексте: точно через tiktoken или ~4 байта UTF-8 на токен."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text.encode("utf-8")) // 4 + 1
+
+
+ToolCall = Tuple[str, Dict[str, Any]]
+
+# Аргументы read_file, задающие читаемый фрагмент файла
+READ_RANGE_ARGS = ("start_line", "end_line", "offset", "length")
+
+
+def format_observation(calls: List[ToolCall], results: List[str]) -> str:
+    """Наблюдение по результатам вызовов: одиночный результат или нумерованный список."""
+    if len(calls) == 1:
+        return f"Наблюдение: {results[0]}"
+    parts = [
+        f"[{n}] {tool_name}({json.dumps(tool_args, ensure_ascii=False)[:200]}):\n{result}"
+        for n, ((tool_name, tool_args), result) in enumerate(zip(calls, results, strict=True), start=1)
+    ]
+    return "Наблюдение:\n" + "\n\n".join(parts)
+
+
+@dataclass
+class Turn:
+    """Один шаг агента: ответ модели, вызванные инструменты и их результаты."""
+    assistant: str
+    calls: List[ToolCall] = field(default_factory=list)
+    results: List[str] = field(default_factory=list)
+    observation: str = ""
+    compacted: bool = False
+    _tokens: Optional[int] = None
+
+    def __post_init__(self):
+        if not self.observation:
+            self.observation = format_observation(self.calls, self.results)
+
+    @property
+    def tokens(self) -> int:
+        if self._tokens is None:
+            self._tokens = estimate_tokens(self.assistant) + estimate_tokens(self.observation) + 8
+        return self._tokens
+
+    def replace_observation(self, text: str):
+        self.observation = text
+        self.compacted = True
+        self._tokens = None
+
+    def replace_result(self, index: int, text: str):
+        """Заменяет результат одного вызова, не трогая остальные результаты шага."""
+        self.results[index] = text
+        self.observation = format_observation(self.calls, self.results)
+        self._tokens = None
+
+
+class ContextManager:
+    """
+    Управляет историей сообщений DeveloperAgent в рамках бюджета токенов.
+
+    Системный промпт и постановка задачи — стабильный префикс, он не меняется.
+    При превышении бюджета:
+      1. результаты чтений, после которых файл перезаписан или тот же фрагмент
+         перечитан, заменяются заглушкой (остальные результаты шага не трогаются);
+      2. старые наблюдения сокращаются до короткого начала;
+      3. самые старые шаги удаляются целиком.
+    Сжатие необратимо, поэтому уже отправленная часть истории между итерациями
+    не «прыгает», и провайдер может переиспользовать кэш префикса.
+    """
+
+    COMPACT_PREVIEW_CHARS = 300
+
+    def __init__(self, system_prompt: str, task: str, budget_tokens: int, keep_recent: int = 3):
+        self.prefix: List[Dict[str, str]] = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": task}
+        ]
+        self.budget_tokens = budget_tokens
+        self.keep_recent = keep_recent
+        self.turns: List[Turn] = []
+        self.dropped_turns = 0
+        self._prefix_tokens = sum(estimate_tokens(m["content"]) for m in self.prefix)
+
+    def add_turn(self, assistant: Any, calls: List[ToolCall], results: List[str]):
+        if not isinstance(assistant, str):
+            assistant = json.dumps(assistant, ensure_ascii=False)
+        self.turns.append(Turn(assistant=assistant, calls=list(calls), results=list(results)))
+
+    @property
+    def total_tokens(self) -> int:
+        notice = 40 if self.dropped_turns else 0
+        return self._prefix_tokens + notice + sum(t.tokens for t in self.turns)
+
+    @staticmethod
+    def _read_key(args: Dict[str, Any]) -> Tuple[Any, ...]:
+        return (str(args.get("path")),) + tuple(args.get(name) for name in READ_RANGE_ARGS)
+
+    def _elide_superseded(self):
+        """
+        Заменяет заглушкой результаты чтений, устаревшие из-за более поздней
+        записи в тот же файл или повторного чтения того же фрагмента.
+        Соседние страницы одного файла друг друга не вытесняют.
+        """
+        written_later: Set[str] = set()
+        read_later: Set[Tuple[Any, ...]] = set()
+        for turn in reversed(self.turns):
+            for index in reversed(range(len(turn.calls))):
+                name, args = turn.calls[index]
+                if not isinstance(args, dict) or not args.get("path"):
+                    continue
+                path = str(args["path"])
+                if name == "write_file":
+                    written_later.add(path)
+                elif name == "read_file":
+                    key = self._read_key(args)
+                    stale = path in written_later or key in read_later
+                    if stale and not turn.compacted and not turn.results[index].startswith("[устарело]"):
+                        reason = "изменено" if path in written_later else "перечитано"
+                        turn.replace_result(index, f"[устарело] содержимое {path} {reason} позже.")
+                    read_later.add(key)
+
+    def _compact_old(self):
+        """Сокращает наблюдения старых шагов, пока история не влезет в бюджет."""
+        for turn in self.turns[:-self.keep_recent] if self.keep_recent else self.turns:
+            if self.total_tokens <= self.budget_tokens:
+                return
+            if turn.compacted or len(turn.observation) <= self.COMPACT_PREVIEW_CHARS:
+                continue
+            cut = len(turn.observation) - self.COMPACT_PREVIEW_CHARS
+            turn.replace_observation(
+                f"{turn.observation[:self.COMPACT_PREVIEW_CHARS]}\n... [сокращено {cut} символов старого наблюдения]"
+            )
+
+    def _drop_oldest(self):
+        while len(self.turns) > self.keep_recent and self.total_tokens > self.budget_tokens:
+            self.turns.pop(0)
+            self.dropped_turns += 1
+
+    def build(self) -> List[Dict[str, str]]:
+        """Возвращает список сообщений для LLM, уложенный в бюджет токенов."""
+        if self.total_tokens > self.budget_tokens:
+            before = self.total_tokens
+            self._elide_superseded()
+            self._compact_old()
+            self._drop_oldest()
+            log.info(f"Контекст сжат: ~{before} -> ~{self.total_tokens} токенов.")
+
+        messages = list(self.prefix)
+        if self.dropped_turns:
+            messages.append({"role": "assistant", "content": json.dumps(
+                {"thought": f"Ранние шаги ({self.dropped_turns}) удалены из истории для экономии контекста."},
+                ensure_ascii=False
+            )})
+            messages.append({"role": "user", "content": "Продолжай работу."})
+        for turn in self.turns:
+            messages.append({"role": "assistant", "content": turn.assistant})
+            messages.append({"role": "user", "content": turn.observation})
+        return messages
@@ -0,0 +1,124 @@
+import hashlib
+import re
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Tuple
+
+from src.context_manager import estimate_tokens
+
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,\d+)? @@", re.MULTILINE)
+
+
+@dataclass
+class DiffPiece:
+    """Фрагмент diff одного файла: хунк или часть большого хунка."""
+    filename: str
+    patch: str
+    start_line: Optional[int] = None
+
+    def render(self) -> str:
+        return f"File: {self.filename}\n```diff\n{self.patch}\n```\n"
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.render())
+
+    @property
+    def new_lines(self) -> int:
+        """Сколько строк новой версии файла покрывает фрагмент."""
+        return sum(1 for line in self.patch.splitlines() if _is_new_side(line))
+
+    @property
+    def key(self) -> str:
+        """
+        Хэш содержимого без номеров строк из заголовков @@: хунк, который только
+        сдвинулся из-за правок выше по файлу, сохраняет ключ.
+        """
+        body = HUNK_HEADER.sub("@@", self.patch)
+        return hashlib.sha256(f"{self.filename}\0{body}".encode("utf-8")).hexdigest()[:32]
+
+    def covers(self, line: int) -> bool:
+        return self.start_line is not None and self.start_line <= line < self.start_line + self.new_lines
+
+
+@dataclass
+class DiffChunk:
+    pieces: List[DiffPiece] = field(default_factory=list)
+    tokens: int = 0
+
+    def render(self) -> str:
+        """Соседние фрагменты одного файла выводятся одним блоком diff."""
+        blocks: List[DiffPiece] = []
+        for piece in self.pieces:
+            if blocks and blocks[-1].filename == piece.filename:
+                blocks[-1] = DiffPiece(piece.filename, f"{blocks[-1].patch}\n{piece.patch}", blocks[-1].start_line)
+            else:
+                blocks.append(piece)
+        return "\n".join(block.render() for block in blocks)
+
+    @property
+    def filenames(self) -> List[str]:
+        return list(dict.fromkeys(piece.filename for piece in self.pieces))
+
+
+def _is_new_side(line: str) -> bool:
+    return not line.startswith(("-", "@@", "\\"))
+
+
+def split_hunks(patch: str) -> List[Tuple[Optional[int], str]]:
+    """Делит patch на хунки по заголовкам @@; возвращает (первая строка в новой версии, текст)."""
+    starts = [m.start() for m in HUNK_HEADER.finditer(patch)]
+    if not starts:
+        return [(None, patch)]
+    if starts[0] != 0:
+        starts.insert(0, 0)
+    hunks = []
+    for begin, end in zip(starts, starts[1:] + [len(patch)], strict=True):
+        text = patch[begin:end].rstrip("\n")
+        match = HUNK_HEADER.match(text)
+        hunks.append((int(match.group(1)) if match else None, text))
+    return hunks
+
+
+def _split_lines(piece: DiffPiece, budget: int) -> List[DiffPiece]:
+    """Режет хунк, не влезающий в бюджет, по строкам."""
+    parts: List[DiffPiece] = []
+    lines: List[str] = []
+    used = 0
+    start = next_line = piece.start_line
+    for line in piece.patch.splitlines():
+        cost = estimate_tokens(line) + 1
+        if lines and used + cost > budget:
+            parts.append(DiffPiece(piece.filename, "\n".join(lines), start))
+            lines, used, start = [], 0, next_line
+        lines.append(line)
+        used += cost
+        if next_line is not None and _is_new_side(line):
+            next_line += 1
+    if lines:
+        parts.append(DiffPiece(piece.filename, "\n".join(lines), start))
+    return parts
+
+
+def hunk_pieces(filename: str, patch: str, budget: int) -> List[DiffPiece]:
+    """Каждый хунк — отдельный фрагмент (единица кэша ревью); большие режутся по строкам."""
+    pieces: List[DiffPiece] = []
+    for start_line, text in split_hunks(patch):
+        hunk = DiffPiece(filename, text, start_line)
+        pieces.extend(_split_lines(hunk, budget) if hunk.tokens > budget else [hunk])
+    return pieces
+
+
+def pack(pieces: Iterable[DiffPiece], budget: int) -> List[DiffChunk]:
+    """Жадно упаковывает фрагменты в чанки не больше budget токенов, сохраняя порядок."""
+    chunks: List[DiffChunk] = []
+    current = DiffChunk()
+    for piece in pieces:
+        cost = piece.tokens
+        if current.pieces and current.tokens + cost > budget:
+            chunks.append(current)
+            current = DiffChunk()
+        current.pieces.append(piece)
+        current.tokens += cost
+    if current.pieces:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,219 @@
+import bisect
+import fnmatch
+import mmap
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import pathspec
+except ImportError:  # .gitignore просто не учитывается
+    pathspec = None  # type: ignore[assignment]
+
+# Директории, в которые обходчик не спускается вовсе
+IGNORED_DIRS = {"__pycache__", "venv", "env", "node_modules", "dist"}
+
+
+@dataclass
+class _DirEntry:
+    """Закэшированное содержимое одной директории."""
+    stamp: Tuple[int, int]
+    files: List[str]
+    dirs: List[str]
+    spec: Optional["pathspec.GitIgnoreSpec"]
+
+
+class RepoWalker:
+    """
+    Обходчик репозитория с отсечением игнорируемых директорий до спуска в них.
+
+    Учитывает .gitignore на каждом уровне и держит индекс содержимого директорий
+    в памяти. Запись индекса инвалидируется по mtime директории и ее .gitignore,
+    поэтому повторный обход неизменного дерева стоит лишь stat по директориям.
+    """
+
+    def __init__(self):
+        self._cache: Dict[str, _DirEntry] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _is_hidden_or_ignored(name: str) -> bool:
+        return name.startswith(".") or name in IGNORED_DIRS
+
+    @staticmethod
+    def _stamp(path: str) -> Tuple[int, int]:
+        dir_mtime = os.stat(path).st_mtime_ns
+        try:
+            gitignore_mtime = os.stat(os.path.join(path, ".gitignore")).st_mtime_ns
+        except OSError:
+            gitignore_mtime = 0
+        return dir_mtime, gitignore_mtime
+
+    @staticmethod
+    def _load_gitignore(path: str) -> Optional["pathspec.GitIgnoreSpec"]:
+        if pathspec is None:
+            return None
+        try:
+            with open(os.path.join(path, ".gitignore"), encoding="utf-8", errors="replace") as f:
+                return pathspec.GitIgnoreSpec.from_lines(f)
+        except OSError:
+            return None
+
+    def _scan(self, path: str) -> _DirEntry:
+        stamp = self._stamp(path)
+        cached = self._cache.get(path)
+        if cached is not None and cached.stamp == stamp:
+            return cached
+
+        files, dirs = [], []
+        with os.scandir(path) as it:
+            for entry in it:
+                if self._is_hidden_or_ignored(entry.name):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry.name)
+                    elif entry.is_file():
+                        files.append(entry.name)
+                except OSError:
+                    continue
+
+        scanned = _DirEntry(stamp=stamp, files=sorted(files), dirs=sorted(dirs), spec=self._load_gitignore(path))
+        with self._lock:
+            self._cache[path] = scanned
+        return scanned
+
+    @staticmethod
+    def _ignored(specs: List[Tuple[str, "pathspec.GitIgnoreSpec"]], rel_path: str, is_dir: bool) -> bool:
+        for base, spec in specs:
+            local = rel_path[len(base) + 1:] if base else rel_path
+            if spec.match_file(local + "/" if is_dir else local):
+                return True
+        return False
+
+    def walk(self, root: str, max_depth: Optional[int] = None) -> Iterator[str]:
+        """Отдает пути файлов относительно root (через '/') в детерминированном порядке."""
+        root = os.path.abspath(root)
+        stack: List[Tuple[str, int, List[Tuple[str, "pathspec.GitIgnoreSpec"]]]] = [("", 0, [])]
+
+        while stack:
+            rel_dir, depth, specs = stack.pop()
+            abs_dir = os.path.join(root, rel_dir) if rel_dir else root
+            try:
+                entry = self._scan(abs_dir)
+            except OSError:
+                continue
+
+            if entry.spec is not None:
+                specs = specs + [(rel_dir, entry.spec)]
+
+            for name in entry.files:
+                rel_path = f"{rel_dir}/{name}" if rel_dir else name
+                if not self._ignored(specs, rel_path, is_dir=False):
+                    yield rel_path
+
+            if max_depth is not None and depth + 1 >= max_depth:
+                continue
+            for name in reversed(entry.dirs):
+                rel_path = f"{rel_dir}/{name}" if rel_dir else name
+                if not self._ignored(specs, rel_path, is_dir=True):
+                    stack.append((rel_path, depth + 1, specs))
+
+    def list_files(self, root: str, max_depth: Optional[int] = None, pattern: Optional[str] = None) -> Iterator[str]:
+        """walk с фильтром по glob (сопоставляется с относительным путем или именем файла)."""
+        for rel_path in self.walk(root, max_depth=max_depth):
+            if pattern and not (
+                fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(rel_path.rsplit("/", 1)[-1], pattern)
+            ):
+                continue
+            yield rel_path
+
+    def invalidate(self, path: Optional[str] = None):
+        with self._lock:
+            if path is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(os.path.abspath(path), None)
+
+
+repo_walker = RepoWalker()
+
+
+class LineIndex:
+    """
+    Разреженный индекс строк файла для чтения окон через mmap.
+
+    Для каждого блока BLOCK байт хранится число переводов строки до его начала.
+    Индекс строится подсчетом b"\\n" по блокам (в C, без разбора строк в Python),
+    а переход к строке N — это bisect по блокам и поиск внутри одного блока.
+    """
+
+    BLOCK = 1 << 16
+
+    def __init__(self, path: str):
+        self.path = path
+        stat = os.stat(path)
+        self.stamp = (stat.st_mtime_ns, stat.st_size)
+        self.size = stat.st_size
+        self.block_lines: List[int] = []
+        self.line_count = 0
+        if self.size:
+            self._build()
+
+    def _build(self):
+        newlines = 0
+        with open(self.path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for pos in range(0, self.size, self.BLOCK):
+                    self.block_lines.append(newlines)
+                    newlines += mm[pos:pos + self.BLOCK].count(b"\n")
+                last_byte = mm[self.size - 1:self.size]
+        self.line_count = newlines + (0 if last_byte == b"\n" else 1)
+
+    def line_offset(self, mm: "mmap.mmap", line: int) -> int:
+        """Байтовое смещение начала строки line (с нуля)."""
+        if line <= 0:
+            return 0
+        if line >= self.line_count:
+            return self.size
+        # Строка line начинается после line-го перевода строки
+        block = bisect.bisect_left(self.block_lines, line) - 1
+        cursor = block * self.BLOCK
+        for _ in range(line - self.block_lines[block]):
+            cursor = mm.find(b"\n", cursor) + 1
+        return cursor
+
+    def read_lines(self, start: int, end: int) -> bytes:
+        """Строки [start, end) с нуля, без чтения остального файла."""
+        if not self.size or start >= end:
+            return b""
+        with open(self.path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                begin = self.line_offset(mm, start)
+                finish = self.line_offset(mm, end)
+                return mm[begin:finish]
+
+    def read_bytes(self, offset: int, length: int) -> bytes:
+        if not self.size or offset >= self.size:
+            return b""
+        with open(self.path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm[max(offset, 0):max(offset, 0) + length]
+
+
+_line_indexes: Dict[str, LineIndex] = {}
+_line_indexes_lock = threading.Lock()
+
+
+def get_line_index(path: str) -> LineIndex:
+    """Индекс строк из кэша; перестраивается при изменении mtime или размера файла."""
+    key = os.path.abspath(path)
+    stat = os.stat(key)
+    cached = _line_indexes.get(key)
+    if cached is not None and cached.stamp == (stat.st_mtime_ns, stat.st_size):
+        return cached
+    index = LineIndex(key)
+    with _line_indexes_lock:
+        _line_indexes[key] = index
+    return index
@@ -0,0 +1,90 @@
+import os
+import subprocess
+import time
+from typing import Iterable, List, Optional
+
+AGENT_NAME = "AI Developer Agent"
+AGENT_EMAIL = "agent@bot.local"
+
+
+class GitError(Exception):
+    pass
+
+
+def _git(args: List[str], cwd: str, stdin: Optional[bytes] = None, secret: Optional[str] = None) -> str:
+    result = subprocess.run(["git", *args], cwd=cwd, input=stdin, capture_output=True)
+    if result.returncode != 0:
+        message = (result.stderr or result.stdout).decode("utf-8", errors="replace").strip()
+        if secret:
+            message = message.replace(secret, "***")
+        raise GitError(message)
+    return result.stdout.decode("utf-8", errors="replace").strip()
+
+
+def resolve_parent(repo_dir: str, branch: str) -> str:
+    """
+    Вершина существующей ветки: локальная ветка, затем origin/<branch>, иначе HEAD.
+    Подходит, только если рабочая копия построена от этой вершины, а не от базы.
+    """
+    refs = _git(
+        ["for-each-ref", "--format=%(refname) %(objectname)", f"refs/heads/{branch}", f"refs/remotes/origin/{branch}"],
+        repo_dir
+    )
+    found = dict(line.split(" ", 1) for line in refs.splitlines() if line)
+    for ref in (f"refs/heads/{branch}", f"refs/remotes/origin/{branch}"):
+        if ref in found:
+            return found[ref]
+    return _git(["rev-parse", "HEAD"], repo_dir)
+
+
+def _quote_path(path: str) -> str:
+    if any(c in path for c in ('"', "\\", "\n")) or path.startswith(" "):
+        escaped = path.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return f'"{escaped}"'
+    return path
+
+
+def commit_files(repo_dir: str, branch: str, paths: Iterable[str], message: str, reuse_branch: bool = False) -> str:
+    """
+    Создает коммит на ветке branch из указанных файлов рабочей копии одним
+    вызовом `git fast-import`: без checkout, без изменения индекса и git config.
+    Остальные файлы берутся из родительского коммита. Возвращает sha коммита.
+
+    Родитель — HEAD, как у прежнего `checkout -B`: рабочая копия сброшена на
+    базу, и смешивать ее правки с деревом старой ветки нельзя. reuse_branch=True
+    дописывает историю существующей ветки (см. resolve_parent).
+    """
+    parent = resolve_parent(repo_dir, branch) if reuse_branch else _git(["rev-parse", "HEAD"], repo_dir)
+    now = int(time.time())
+    offset = time.strftime("%z")
+    message_bytes = message.encode("utf-8")
+
+    stream = [
+        f"commit refs/heads/{branch}\n".encode(),
+        b"mark :1\n",
+        f"author {AGENT_NAME} <{AGENT_EMAIL}> {now} {offset}\n".encode(),
+        f"committer {AGENT_NAME} <{AGENT_EMAIL}> {now} {offset}\n".encode(),
+        f"data {len(message_bytes)}\n".encode(), message_bytes, b"\n",
+        f"from {parent}\n".encode(),
+    ]
+    for rel_path in sorted(set(paths)):
+        git_path = rel_path.replace(os.sep, "/")
+        full_path = os.path.join(repo_dir, rel_path)
+        if not os.path.isfile(full_path):
+            stream.append(f"D {_quote_path(git_path)}\n".encode("utf-8"))
+            continue
+        with open(full_path, "rb") as f:
+            content = f.read()
+        mode = "100755" if os.access(full_path, os.X_OK) else "100644"
+        stream.append(f"M {mode} inline {_quote_path(git_path)}\n".encode("utf-8"))
+        stream.append(f"data {len(content)}\n".encode())
+        stream.append(content)
+        stream.append(b"\n")
+    stream.append(b"get-mark :1\n")
+
+    output = _git(["fast-import", "--quiet", "--force", "--done"], repo_dir, stdin=b"".join(stream) + b"done\n")
+    return output.splitlines()[-1].strip() if output else _git(["rev-parse", f"refs/heads/{branch}"], repo_dir)
+
+
+def push_branch(repo_dir: str, remote_url: str, branch: str, secret: Optional[str] = None):
+    _git(["push", "--force", "--quiet", remote_url, f"refs/heads/{branch}:refs/heads/{branch}"], repo_dir, secret=secret)
@@ -0,0 +1,259 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Mapping, Optional
+
+import requests
+from github import Auth, Github, GithubRetry
+from github.Repository import Repository
+from github.Requester import HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass, Requester
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from src.config import settings
+from src.llm_cache import CompletionCache
+from src.logger import log
+
+# Заголовки ответа, которые сохраняются вместе с телом для ответов из кэша
+CACHED_HEADERS = ("content-type", "etag", "last-modified", "link")
+
+
+@dataclass
+class GitHubStats:
+    requests: int = 0
+    not_modified: int = 0
+    throttled_seconds: float = 0.0
+
+
+class RateLimitScheduler:
+    """
+    Распределяет запросы по остатку лимита GitHub (заголовки X-RateLimit-*).
+
+    Пока израсходовано меньше pace_below доли лимита, запросы идут без задержек.
+    Дальше интервал между запросами растягивается так, чтобы остатка хватило
+    до сброса окна, а при остатке не больше reserve — ждем сброса вместо ошибки 403.
+    """
+
+    def __init__(
+        self,
+        reserve: int = 50,
+        pace_below: float = 0.2,
+        max_wait: float = 3600,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        self.reserve = reserve
+        self.pace_below = pace_below
+        self.max_wait = max_wait
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+        self._next_slot = 0.0
+
+    def update(self, headers: Mapping[str, str]):
+        try:
+            limit = int(headers["X-RateLimit-Limit"])
+            remaining = int(headers["X-RateLimit-Remaining"])
+            reset_at = float(headers["X-RateLimit-Reset"])
+        except (KeyError, ValueError):
+            return
+        with self._lock:
+            # Ответы параллельных запросов приходят не по порядку: берем самый свежий остаток
+            if reset_at != self.reset_at or self.remaining is None or remaining < self.remaining:
+                self.limit, self.remaining, self.reset_at = limit, remaining, reset_at
+
+    def delay(self) -> float:
+        """Сколько ждать перед следующим запросом; резервирует слот."""
+        with self._lock:
+            now = self._clock()
+            if self.remaining is None or self.limit is None or now >= self.reset_at:
+                return 0.0
+            window = self.reset_at - now
+            if self.remaining <= self.reserve:
+                return min(window, self.max_wait)
+            if self.remaining > self.limit * self.pace_below:
+                return 0.0
+            interval = window / (self.remaining - self.reserve)
+            start = max(now, self._next_slot)
+            self._next_slot = start + interval
+            self.remaining -= 1
+            return start - now
+
+    def wait(self) -> float:
+        seconds = self.delay()
+        if seconds > 0:
+            log.info(f"[GitHub] Лимит API: осталось {self.remaining}, пауза {seconds:.1f} с")
+            self._sleep(seconds)
+        return seconds
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    HTTP-адаптер requests с условными запросами: GET получает If-None-Match /
+    If-Modified-Since из кэша, ответ 304 (не расходует лимит) подменяется телом
+    из кэша. Перед каждым запросом учитывается планировщик лимита.
+    """
+
+    def __init__(self, cache: Optional[CompletionCache], scheduler: RateLimitScheduler, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.cache = cache
+        self.scheduler = scheduler
+        self.stats = GitHubStats()
+        self._stats_lock = threading.Lock()
+
+    def _cache_key(self, request: requests.PreparedRequest) -> str:
+        # Ответ зависит от токена: в ключ идет хэш заголовка Authorization, а не сам токен
+        auth = hashlib.sha256(request.headers.get("Authorization", "").encode("utf-8")).hexdigest()
+        return CompletionCache.make_key({"url": request.url, "accept": request.headers.get("Accept", ""), "auth": auth})
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        key = entry = None
+        if self.cache is not None and request.method == "GET":
+            key = self._cache_key(request)
+            entry = self.cache.get(key)
+            if entry is not None:
+                if entry.get("etag"):
+                    request.headers["If-None-Match"] = entry["etag"]
+                if entry.get("last_modified"):
+                    request.headers["If-Modified-Since"] = entry["last_modified"]
+
+        waited = self.scheduler.wait()
+        response = super().send(request, **kwargs)
+        self.scheduler.update(response.headers)
+
+        with self._stats_lock:
+            self.stats.requests += 1
+            self.stats.throttled_seconds += waited
+            if entry is not None and response.status_code == 304:
+                self.stats.not_modified += 1
+
+        if entry is not None and response.status_code == 304:
+            return self._from_cache(entry, request, response)
+
+        if self.cache is not None and key is not None and response.status_code == 200:
+            headers = response.headers
+            if headers.get("ETag") or headers.get("Last-Modified"):
+                self.cache.put(key, {
+                    "etag": headers.get("ETag"),
+                    "last_modified": headers.get("Last-Modified"),
+                    "headers": {name: headers[name] for name in CACHED_HEADERS if name in headers},
+                    "body": response.text,
+                })
+        return response
+
+    @staticmethod
+    def _from_cache(entry: Dict[str, Any], request: requests.PreparedRequest, not_modified: requests.Response) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK (cached)"
+        response.url = request.url
+        response.request = request
+        response.encoding = "utf-8"
+        response._content = entry["body"].encode("utf-8")
+        # Кэшированные заголовки + свежие служебные из 304 (лимиты, дата)
+        response.headers = CaseInsensitiveDict(entry.get("headers") or {})
+        response.headers.update(not_modified.headers)
+        response.connection = not_modified.connection
+        return response
+
+
+_lock = threading.RLock()
+_session: Optional[requests.Session] = None
+_adapter: Optional[CachingAdapter] = None
+_github: Optional[Github] = None
+_repos: Dict[str, Repository] = {}
+
+
+def _open_cache() -> Optional[CompletionCache]:
+    if not settings.GITHUB_CACHE_PATH:
+        return None
+    try:
+        cache = CompletionCache(settings.GITHUB_CACHE_PATH, max_bytes=settings.GITHUB_CACHE_MAX_MB * 1024 * 1024, ttl_seconds=0)
+        log.info(f"Кэш ответов GitHub API: {settings.GITHUB_CACHE_PATH}")
+        return cache
+    except (OSError, sqlite3.Error) as e:
+        log.warning(f"Не удалось открыть кэш GitHub, работаем без него: {e}")
+        return None
+
+
+def get_session() -> requests.Session:
+    """Общая на процесс сессия requests с пулом соединений и кэширующим адаптером."""
+    global _session, _adapter
+    with _lock:
+        if _session is None:
+            _adapter = CachingAdapter(
+                _open_cache(),
+                RateLimitScheduler(reserve=settings.GITHUB_RATE_RESERVE),
+                pool_connections=settings.GITHUB_POOL_SIZE,
+                pool_maxsize=settings.GITHUB_POOL_SIZE,
+                max_retries=GithubRetry(),
+            )
+            session = requests.Session()
+            session.auth = Requester.noopAuth
+            session.mount("https://", _adapter)
+            session.mount("http://", _adapter)
+            _session = session
+        return _session
+
+
+def github_stats() -> GitHubStats:
+    get_session()
+    assert _adapter is not None
+    return _adapter.stats
+
+
+class _SharedConnectionMixin:
+    """Подменяет собственную сессию соединения PyGithub на общую."""
+
+    default_port: int
+
+    def __init__(self, host: str, port: Optional[int] = None, strict: bool = False, timeout: Optional[int] = None, **kwargs: Any):
+        self.host = host
+        self.port = port if port else self.default_port
+        self.timeout = timeout
+        self.verify = kwargs.get("verify", True)
+        self.session = get_session()
+
+    def close(self):
+        pass  # сессия общая и живет до конца процесса
+
+
+class SharedHTTPSConnection(_SharedConnectionMixin, HTTPSRequestsConnectionClass):
+    protocol = "https"
+    default_port = 443
+
+
+class SharedHTTPConnection(_SharedConnectionMixin, HTTPRequestsConnectionClass):
+    protocol = "http"
+    default_port = 80
+
+
+def get_github() -> Github:
+    """Общий на процесс клиент GitHub поверх пула соединений, ETag-кэша и планировщика лимита."""
+    global _github
+    with _lock:
+        if _github is None:
+            Requester.injectConnectionClasses(SharedHTTPConnection, SharedHTTPSConnection)
+            # Повторы делает общий адаптер; паузы между запросами задает планировщик лимита
+            _github = Github(
+                auth=Auth.Token(settings.GH_TOKEN),
+                base_url=settings.GITHUB_API_URL,
+                retry=None,
+                seconds_between_requests=None
+            )
+        return _github
+
+
+def get_repository(full_name: Optional[str] = None) -> Repository:
+    """Ленивый объект репозитория (без запроса к API), один на процесс."""
+    name = full_name or settings.REPO_NAME
+    gh = get_github()
+    with _lock:
+        if name not in _repos:
+            _repos[name] = gh.get_repo(name, lazy=True)
+        return _repos[name]
@@ -0,0 +1,239 @@
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from src.logger import configure_logging, forward_logs, log, log_context
+from src.tracing import metrics
+
+# Сколько завершенных задач хранить для /jobs
+JOB_HISTORY_SIZE = 200
+
+
+class QueueFullError(Exception):
+    """Очередь заполнена — вызывающий должен повторить позже (HTTP 429)."""
+
+
+class QueueClosedError(Exception):
+    """Очередь остановлена или пул процессов сломан (HTTP 503)."""
+
+
+@dataclass
+class Job:
+    id: str
+    issue_number: int
+    status: str  # QUEUED, RUNNING, DONE, FAILED
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def run_issue_job(issue_number: int):
+    """
+    Точка входа задачи в процессе пула: агент импортируется уже внутри воркера.
+    Если задан WORKTREE_POOL_DIR, агент получает изолированную рабочую копию.
+    Возвращает приращение метрик процесса-исполнителя для /metrics сервера.
+    """
+    from src.agents.code_agent import DeveloperAgent
+    from src.config import settings
+
+    if not settings.WORKTREE_POOL_DIR:
+        DeveloperAgent().run(issue_number)
+        return {"metrics": metrics.drain()}
+
+    from src.workspace_pool import WorktreePool
+
+    pool = WorktreePool(".", settings.WORKTREE_POOL_DIR, settings.WORKTREE_POOL_SIZE, settings.WORKTREE_BASE_REF)
+    with pool.lease() as workspace:
+        DeveloperAgent(workspace=workspace.path).run(issue_number)
+    return {"metrics": metrics.drain()}
+
+
+def _init_worker(log_queue: Any):
+    """Процесс пула пишет лог в очередь сервера, а не в свои обработчики и файл."""
+    configure_logging(log_queue=log_queue)
+
+
+def _run_tagged(job_fn: Callable[[int], Any], job_id: str, issue_number: int):
+    """Выполняет задачу с метками job_id и issue во всех записях лога."""
+    with log_context(job_id=job_id, issue=issue_number):
+        return job_fn(issue_number)
+
+
+class JobQueue:
+    """
+    Ограниченная очередь задач агента с пулом процессов-исполнителей.
+
+    Диспетчерские потоки (по одному на процесс пула) берут задачи из очереди,
+    поэтому состояние RUNNING отражает реальный запуск. Повторная доставка
+    webhook для Issue, задача по которому уже в очереди или выполняется,
+    не создает новую задачу, а возвращает существующую.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        max_queued: Optional[int] = None,
+        job_fn: Callable[[int], Any] = run_issue_job,
+        executor_factory: Optional[Callable[[int], Executor]] = None
+    ):
+        # Без явных значений лимиты берутся из JOB_WORKERS/JOB_QUEUE_SIZE при первом обращении
+        self._workers = workers
+        self._max_queued = max_queued
+        self.job_fn = job_fn
+        self._executor_factory = executor_factory or self._default_executor
+        self._executor: Optional[Executor] = None
+        self._queue: "queue.Queue[Optional[Job]]" = queue.Queue()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active_by_issue: Dict[int, Job] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._dispatchers: List[threading.Thread] = []
+        self._closed = False
+
+    @property
+    def workers(self) -> int:
+        if self._workers is None:
+            from src.config import settings
+
+            self._workers = settings.JOB_WORKERS
+        return self._workers
+
+    @property
+    def max_queued(self) -> int:
+        if self._max_queued is None:
+            from src.config import settings
+
+            self._max_queued = settings.JOB_QUEUE_SIZE
+        return self._max_queued
+
+    @staticmethod
+    def _default_executor(workers: int) -> Executor:
+        context = multiprocessing.get_context("spawn")
+        log_queue = context.Queue()
+        forward_logs(log_queue)
+        return ProcessPoolExecutor(
+            max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(log_queue,)
+        )
+
+    def _ensure_started(self):
+        if self._executor is not None:
+            return
+        self._executor = self._executor_factory(self.workers)
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._dispatch, name=f"job-dispatcher-{n}", daemon=True)
+            thread.start()
+            self._dispatchers.append(thread)
+
+    def submit(self, issue_number: int) -> Job:
+        """Ставит Issue в очередь. Возвращает новую или уже существующую задачу."""
+        with self._lock:
+            if self._closed:
+                raise QueueClosedError("Очередь остановлена")
+
+            existing = self._active_by_issue.get(issue_number)
+            if existing is not None:
+                log.info(f"[Jobs] Issue #{issue_number} уже в работе ({existing.id}), дубликат объединен.")
+                return existing
+
+            queued = sum(1 for job in self._active_by_issue.values() if job.status == "QUEUED")
+            if queued >= self.max_queued:
+                raise QueueFullError(f"В очереди уже {queued} задач")
+
+            self._ensure_started()
+            job = Job(id=f"job-{next(self._ids)}", issue_number=issue_number, status="QUEUED", created_at=time.time())
+            self._jobs[job.id] = job
+            self._active_by_issue[issue_number] = job
+            self._trim_history()
+
+        self._queue.put(job)
+        log.info(f"[Jobs] {job.id}: Issue #{issue_number} поставлена в очередь.")
+        return job
+
+    def _dispatch(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+
+            with self._lock:
+                job.status = "RUNNING"
+                job.started_at = time.time()
+
+            executor = self._executor
+            try:
+                result = executor.submit(_run_tagged, self.job_fn, job.id, job.issue_number).result()
+                if isinstance(result, dict) and "metrics" in result:
+                    metrics.merge(result["metrics"])
+                status, error = "DONE", None
+            except BrokenProcessPool as e:
+                # Процесс-исполнитель умер (OOM, segfault): пересоздаем пул для следующих задач
+                log.error(f"[Jobs] {job.id}: пул процессов сломан, пересоздаем: {e}")
+                status, error = "FAILED", f"Worker process crashed: {e}"
+                self._restart_executor(executor)
+            except Exception as e:
+                log.error(f"[Jobs] {job.id}: ошибка агента: {e}")
+                status, error = "FAILED", str(e)
+
+            with self._lock:
+                job.status = status
+                job.error = error
+                job.finished_at = time.time()
+                self._active_by_issue.pop(job.issue_number, None)
+            metrics.inc("agent_jobs_total", status=status)
+            metrics.observe("agent_job_duration_seconds", job.finished_at - job.started_at, status=status)
+
+    def _restart_executor(self, broken: Executor):
+        with self._lock:
+            if self._executor is not broken:
+                return  # пул уже пересоздан другим диспетчером
+            self._executor = self._executor_factory(self.workers)
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _trim_history(self):
+        while len(self._jobs) > JOB_HISTORY_SIZE:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest.status in {"QUEUED", "RUNNING"}:
+                break
+            self._jobs.pop(oldest_id)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [job.to_dict() for job in reversed(self._jobs.values())]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "queued": statuses.count("QUEUED"),
+            "running": statuses.count("RUNNING"),
+            "done": statuses.count("DONE"),
+            "failed": statuses.count("FAILED"),
+        }
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            self._closed = True
+        for _ in self._dispatchers:
+            self._queue.put(None)
+        if wait:
+            for thread in self._dispatchers:
+                thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,138 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+_OPENERS = {"{": "}", "[": "]"}
+_CLOSERS = {"}", "]"}
+_SCALAR_CHARS = set("0123456789+-.eEtrufalsn")
+_WHITESPACE = set(" \t\r\n")
+
+
+class IncrementalJSONParser:
+    """
+    Инкрементальный разбор JSON-объекта верхнего уровня из потока чанков.
+
+    Отслеживает строки и вложенность, поэтому знает, когда закрылось
+    очередное поле верхнего уровня и когда закрылся весь объект. Для поля-массива
+    (например, "actions") промежуточное значение сообщается после каждого
+    закрытого элемента-объекта, не дожидаясь конца массива.
+    Синтаксические ошибки поднимаются как json.JSONDecodeError сразу,
+    не дожидаясь конца ответа.
+    """
+
+    def __init__(self):
+        self._text: List[str] = []
+        self._length = 0
+        self._stack: List[str] = []
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._seen_keys: set = set()
+        self._key_start = 0
+        self._last_key_text = ""
+        self._current_key: Optional[str] = None
+        self._array_start: Optional[int] = None
+        self.done = False
+        self.result: Optional[Dict[str, Any]] = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self._text)
+
+    def _error(self, msg: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(msg, self.text, self._length)
+
+    def _fields_from_prefix(self, prefix: str) -> List[Tuple[str, Any]]:
+        """Разбирает уже закрытые поля объекта и возвращает только новые."""
+        try:
+            partial = json.loads(prefix + "}")
+        except json.JSONDecodeError as e:
+            raise json.JSONDecodeError(f"Некорректный JSON в потоке: {e.msg}", prefix, e.pos) from None
+        if not isinstance(partial, dict):
+            raise self._error("Ожидался JSON-объект")
+        fresh = [(k, v) for k, v in partial.items() if k not in self._seen_keys]
+        self._seen_keys.update(k for k, _ in fresh)
+        return fresh
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Добавляет чанк и возвращает поля верхнего уровня, закрывшиеся в нем.
+        Поле-массив может встретиться несколько раз: сначала с уже закрытыми
+        элементами, последним — с окончательным значением.
+        """
+        completed: List[Tuple[str, Any]] = []
+        if self.done or not chunk:
+            return completed
+
+        for char in chunk:
+            self._text.append(char)
+            self._length += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._last_key_text = self.text[self._key_start:]
+                continue
+
+            if not self._started:
+                if char in _WHITESPACE:
+                    continue
+                if char != "{":
+                    raise self._error("Ответ должен начинаться с '{'")
+                self._started = True
+                self._stack.append("}")
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if len(self._stack) == 1:
+                    self._key_start = self._length - 1
+            elif char == ":" and len(self._stack) == 1:
+                self._current_key = json.loads(self._last_key_text)
+            elif char in _OPENERS:
+                if char == "[" and len(self._stack) == 1:
+                    self._array_start = self._length - 1
+                self._stack.append(_OPENERS[char])
+            elif char in _CLOSERS:
+                if not self._stack or self._stack.pop() != char:
+                    raise self._error(f"Непарная скобка '{char}'")
+                if not self._stack:
+                    completed.extend(self._fields_from_final(self._finish()))
+                    break
+                if len(self._stack) == 1:
+                    self._array_start = None
+                elif self._array_start is not None and self._stack == ["}", "]"]:
+                    completed.append(self._partial_array())
+            elif char == "," and len(self._stack) == 1:
+                completed.extend(self._fields_from_prefix(self.text[:-1]))
+            elif char not in _WHITESPACE and char != ":" and char != "," and char not in _SCALAR_CHARS:
+                raise self._error(f"Недопустимый символ '{char}'")
+
+        return completed
+
+    def _partial_array(self) -> Tuple[str, Any]:
+        """Текущий ключ и массив из уже закрытых элементов."""
+        prefix = self.text[self._array_start:]
+        try:
+            items = json.loads(prefix + "]")
+        except json.JSONDecodeError as e:
+            raise json.JSONDecodeError(f"Некорректный JSON в потоке: {e.msg}", prefix, e.pos) from None
+        return str(self._current_key), items
+
+    def _finish(self) -> Dict[str, Any]:
+        try:
+            result: Dict[str, Any] = json.loads(self.text)
+        except json.JSONDecodeError as e:
+            raise json.JSONDecodeError(f"Некорректный JSON в потоке: {e.msg}", e.doc, e.pos) from None
+        self.result = result
+        self.done = True
+        return result
+
+    def _fields_from_final(self, result: Dict[str, Any]) -> List[Tuple[str, Any]]:
+        fresh = [(k, v) for k, v in result.items() if k not in self._seen_keys]
+        self._seen_keys.update(k for k, _ in fresh)
+        return fresh
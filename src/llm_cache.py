@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from src.config import settings
+from src.logger import log
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+
+
+class CompletionCache:
+    """
+    Персистентный кэш ответов LLM, адресуемый по содержимому запроса.
+    Ключ — sha256 от модели, сообщений и параметров сэмплирования.
+    Вытеснение: LRU по времени последнего обращения с лимитом размера и TTL.
+    """
+
+    def __init__(self, path: str, max_bytes: int, ttl_seconds: float):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON completions(accessed)")
+
+    @staticmethod
+    def make_key(request: Dict[str, Any]) -> str:
+        """Канонизирует параметры запроса и возвращает их хэш."""
+        canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.stats.misses += 1
+                return None
+
+            value, created = row
+            if self.ttl_seconds and now - created > self.ttl_seconds:
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self.stats.evictions += 1
+                self.stats.misses += 1
+                return None
+
+            self._conn.execute("UPDATE completions SET accessed = ? WHERE key = ?", (now, key))
+            self.stats.hits += 1
+
+        result: Dict[str, Any] = json.loads(value)
+        return result
+
+    def put(self, key: str, value: Dict[str, Any]):
+        payload = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload.encode("utf-8")), now, now)
+            )
+            self.stats.writes += 1
+            self._evict(now)
+
+    def _evict(self, now: float):
+        """Удаляет просроченные записи, затем самые давние, пока кэш не влезет в лимит."""
+        if self.ttl_seconds:
+            cursor = self._conn.execute(
+                "DELETE FROM completions WHERE created < ?", (now - self.ttl_seconds,)
+            )
+            self.stats.evictions += max(cursor.rowcount, 0)
+
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        overflow = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM completions ORDER BY accessed ASC"):
+            victims.append((key,))
+            freed += size
+            if freed >= overflow:
+                break
+
+        self._conn.executemany("DELETE FROM completions WHERE key = ?", victims)
+        self.stats.evictions += len(victims)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache_lock = threading.Lock()
+_cache: Optional[CompletionCache] = None
+
+
+def get_completion_cache() -> Optional[CompletionCache]:
+    """Возвращает общий на процесс кэш или None, если LLM_CACHE_PATH не задан."""
+    global _cache
+    if not settings.LLM_CACHE_PATH:
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = CompletionCache(
+                    settings.LLM_CACHE_PATH,
+                    max_bytes=settings.LLM_CACHE_MAX_MB * 1024 * 1024,
+                    ttl_seconds=settings.LLM_CACHE_TTL_HOURS * 3600
+                )
+                log.info(f"Кэш ответов LLM: {settings.LLM_CACHE_PATH}")
+            except (OSError, sqlite3.Error) as e:
+                log.warning(f"Не удалось открыть кэш LLM, работаем без него: {e}")
+                return None
+        return _cache
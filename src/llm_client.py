@@ -1,64 +1,396 @@
+import asyncio
 import json
-import httpx
-from typing import List, Dict, Any, Optional
-from openai import OpenAI, APIError, APITimeoutError
+import threading
+import weakref
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, List, Dict, Any, Callable, Optional, Tuple
 from src.config import settings
+from src.context_manager import estimate_tokens
+from src.json_stream import IncrementalJSONParser
+from src.llm_cache import CompletionCache, get_completion_cache
 from src.logger import log
+from src.tracing import Span, metrics, tracer
+
+# openai и httpx импортируются при первом обращении к клиенту: это ~0.6 с
+# холодного старта, которые не нужны для --help, тестов и webhook-сервера
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+
+# дл OpenRouter
+DEFAULT_HEADERS = {
+    "HTTP-Referer": "https://github.com/IlyushinDM/megaschool-coding-agent",
+    "X-Title": "SDLC Coding Agent"
+}
+
+# Таймауты запроса и установки соединения (секунды)
+DEFAULT_TIMEOUT = 60.0
+CONNECT_TIMEOUT = 10.0
+
+_client_lock = threading.Lock()
+_http_client: Optional["httpx.Client"] = None
+# AsyncClient привязан к event loop, поэтому держим по одному пулу на loop
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def _http2_enabled() -> bool:
+    """HTTP/2 требует пакет h2; без него откатываемся на HTTP/1.1 keep-alive."""
+    if not settings.LLM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        log.warning("Пакет h2 не установлен, HTTP/2 к LLM отключен.")
+        return False
+    return True
+
+
+def _pool_limits() -> "httpx.Limits":
+    import httpx
+
+    return httpx.Limits(
+        max_connections=settings.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_MAX_KEEPALIVE,
+        keepalive_expiry=30.0
+    )
+
+
+def get_http_client() -> "httpx.Client":
+    """Общий на процесс синхронный пул соединений к LLM."""
+    global _http_client
+    import httpx
+
+    with _client_lock:
+        if _http_client is None or _http_client.is_closed:
+            _http_client = httpx.Client(
+                timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=CONNECT_TIMEOUT),
+                headers=DEFAULT_HEADERS,
+                limits=_pool_limits(),
+                http2=_http2_enabled()
+            )
+        return _http_client
+
+
+def get_async_http_client() -> "httpx.AsyncClient":
+    """Общий асинхронный пул соединений к LLM для текущего event loop."""
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    with _client_lock:
+        client = _async_http_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=CONNECT_TIMEOUT),
+                headers=DEFAULT_HEADERS,
+                limits=_pool_limits(),
+                http2=_http2_enabled()
+            )
+            _async_http_clients[loop] = client
+        return client
+
+
+async def aclose_async_http_client() -> None:
+    """Закрывает пул текущего event loop (например, перед завершением asyncio.run)."""
+    loop = asyncio.get_running_loop()
+    with _client_lock:
+        client = _async_http_clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
+
+
+_record_lock = threading.Lock()
+
+
+def transcript_key(messages: List[Dict[str, str]]) -> str:
+    """Ключ записи транскрипта: хэш сообщений запроса (по нему ответ ищется при воспроизведении)."""
+    return CompletionCache.make_key({"messages": messages})
+
+
+def _record_transcript(messages: List[Dict[str, str]], result: Dict[str, Any], response: Any = None):
+    """Дописывает ответ LLM в LLM_RECORD_PATH для офлайн-бенчмарка (benchmarks/replay.py)."""
+    if not settings.LLM_RECORD_PATH:
+        return
+    usage = getattr(response, "usage", None)
+    entry = {
+        "key": transcript_key(messages),
+        "content": json.dumps(result, ensure_ascii=False),
+        "usage": {
+            kind: getattr(usage, kind) for kind in ("prompt_tokens", "completion_tokens")
+            if isinstance(getattr(usage, kind, None), int)
+        },
+    }
+    with _record_lock:
+        with open(settings.LLM_RECORD_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def _record_usage(span: Span, response: Any):
+    """Токены запроса и ответа — в атрибуты спана и счетчик agent_llm_tokens_total."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    for kind in ("prompt", "completion"):
+        tokens = getattr(usage, f"{kind}_tokens", None)
+        if not isinstance(tokens, int):
+            continue
+        span.set(**{f"{kind}_tokens": span.attrs.get(f"{kind}_tokens", 0) + tokens})
+        metrics.inc("agent_llm_tokens_total", tokens, kind=kind, model=settings.MODEL_NAME)
+
 
 class LLMService:
-    def __init__(self):
-        # дл OpenRouter
-        headers = {
-            "HTTP-Referer": "https://github.com/IlyushinDM/megaschool-coding-agent",
-            "X-Title": "SDLC Coding Agent"
+    def __init__(self, warm_up: bool = False):
+        """
+        warm_up=True создает клиент в фоновом потоке: импорт openai идет
+        параллельно с первыми запросами к GitHub, а не перед ними.
+        """
+        self._client: Optional["OpenAI"] = None
+        self._client_init_lock = threading.Lock()
+        self._async_client: Optional["AsyncOpenAI"] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.cache = get_completion_cache()
+        if warm_up:
+            threading.Thread(target=lambda: self.client, name="llm-warm-up", daemon=True).start()
+
+    @property
+    def client(self) -> "OpenAI":
+        """OpenAI поверх общего пула; создается при первом обращении."""
+        if self._client is None:
+            with self._client_init_lock:
+                if self._client is None:
+                    from openai import OpenAI
+
+                    self._client = OpenAI(
+                        api_key=settings.API_KEY,
+                        base_url=settings.BASE_URL,
+                        http_client=get_http_client()
+                    )
+        return self._client
+
+    @property
+    def async_client(self) -> "AsyncOpenAI":
+        """AsyncOpenAI поверх общего пула; пересоздается при смене event loop."""
+        from openai import AsyncOpenAI
+
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = AsyncOpenAI(
+                api_key=settings.API_KEY,
+                base_url=settings.BASE_URL,
+                http_client=get_async_http_client()
+            )
+            self._async_loop = loop
+        return self._async_client
+
+    @staticmethod
+    def _completion_kwargs(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        return {
+            "model": settings.MODEL_NAME,
+            "messages": messages,
+            "response_format": {"type": "json_object"},
+            "temperature": 0.1,
+            "extra_body": {
+                "transforms": ["middle-out"]
+            }
         }
 
-        http_client = httpx.Client(
-            timeout=httpx.Timeout(60.0, connect=10.0),
-            headers=headers
-        )
-        
-        self.client = OpenAI(
-            api_key=settings.API_KEY,
-            base_url=settings.BASE_URL,
-            http_client=http_client
+    def _cache_lookup(self, messages: List[Dict[str, str]]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        if self.cache is None:
+            return None, None
+        key = CompletionCache.make_key(self._completion_kwargs(messages))
+        cached = self.cache.get(key)
+        if cached is not None:
+            log.info("Ответ LLM взят из кэша.")
+        return key, cached
+
+    def _cache_store(self, key: Optional[str], result: Dict[str, Any]):
+        if self.cache is not None and key is not None:
+            self.cache.put(key, result)
+
+    @staticmethod
+    def _parse_response(span: Span, response: Any) -> Dict[str, Any]:
+        """JSON из ответа без потока; токены ответа — в спан."""
+        _record_usage(span, response)
+        content = response.choices[0].message.content
+        if not content:
+            raise ValueError("Получен пустой ответ от LLM")
+        result: Dict[str, Any] = json.loads(content)
+        return result
+
+    def _accept(self, cache_key: Optional[str], messages: List[Dict[str, str]],
+                result: Dict[str, Any], response: Any = None) -> Dict[str, Any]:
+        """Удачная попытка: ответ — в кэш и транскрипт бенчмарка."""
+        self._cache_store(cache_key, result)
+        _record_transcript(messages, result, response)
+        return result
+
+    @staticmethod
+    def _attempt_failed(error: Exception, attempt: int, retries: int, span: Span,
+                        messages: List[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+        """
+        Разбор ошибки попытки: битый JSON — в messages добавляется просьба исправить
+        формат. Возвращает итоговый {"error": ...}, если повторов больше не будет.
+        """
+        from openai import APITimeoutError
+
+        if isinstance(error, json.JSONDecodeError):
+            log.warning(f"Попытка {attempt + 1}: LLM вернула битый JSON.")
+            if attempt < retries:
+                metrics.inc("agent_llm_retries_total", reason="invalid_json")
+                messages.append({
+                    "role": "user",
+                    "content": "Error: Your response is not valid JSON. Fix formatting. Return JSON only."
+                })
+            return None
+        if isinstance(error, APITimeoutError):
+            log.warning(f"Попытка {attempt + 1}: Таймаут. Пробуем снова...")
+            if attempt < retries:
+                metrics.inc("agent_llm_retries_total", reason="timeout")
+            return None
+        log.error(f"Ошибка LLM: {error}")
+        if attempt == retries:
+            span.fail(error)
+            return {"error": str(error)}
+        metrics.inc("agent_llm_retries_total", reason="error")
+        return None
+
+    def _stream_json(
+        self,
+        span: Span,
+        messages: List[Dict[str, str]],
+        on_field: Optional[Callable[[str, Any], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Читает ответ потоком и разбирает JSON по мере поступления.
+        Закрывшиеся поля сразу передаются в on_field; поток обрывается, как только
+        объект закрыт; битый JSON обнаруживается на первом же некорректном поле.
+        """
+        parser = IncrementalJSONParser()
+        stream = self.client.chat.completions.create(
+            stream=True, stream_options={"include_usage": True}, **self._completion_kwargs(messages)
         )
+        usage = None
+        try:
+            for chunk in stream:
+                if isinstance(getattr(getattr(chunk, "usage", None), "completion_tokens", None), int):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                for name, value in parser.feed(chunk.choices[0].delta.content or ""):
+                    if on_field is not None:
+                        on_field(name, value)
+                if parser.done:
+                    break
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+            if usage is None:
+                # Токены приходят последним чанком, а поток обрывается раньше — оценка по тексту
+                usage = SimpleNamespace(
+                    prompt_tokens=sum(estimate_tokens(str(m.get("content") or "")) for m in messages),
+                    completion_tokens=estimate_tokens(parser.text)
+                )
+            _record_usage(span, SimpleNamespace(usage=usage))
+
+        if parser.result is not None:
+            return parser.result
+        if not parser.text.strip():
+            raise ValueError("Получен пустой ответ от LLM")
+        raise json.JSONDecodeError("Поток завершился до закрытия JSON-объекта", parser.text, len(parser.text))
 
-    def generate_json(self, messages: List[Dict[str, str]], retries: int = 3) -> Optional[Dict[str, Any]]:
-        current_messages = messages.copy()
-        
-        for attempt in range(retries + 1):
+    def generate_json(
+        self,
+        messages: List[Dict[str, str]],
+        retries: int = 3,
+        stream: Optional[bool] = None,
+        on_field: Optional[Callable[[str, Any], None]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Запрашивает у LLM JSON-ответ. В потоковом режиме (stream или LLM_STREAM)
+        ответ разбирается по мере поступления: закрывшиеся поля передаются
+        в on_field до конца генерации (поле-массив — и по мере закрытия элементов),
+        поток обрывается сразу после закрытия объекта, а битый JSON обнаруживается
+        до конца генерации. Поля неудачной попытки тоже могут попасть в on_field.
+        """
+        with tracer.span("llm.generate_json", model=settings.MODEL_NAME) as span:
+            cache_key, cached = self._cache_lookup(messages)
+            span.set(cached=cached is not None)
+            if cached is not None:
+                return cached
+
+            if stream is None:
+                stream = settings.LLM_STREAM
+            current_messages = messages.copy()
+
+            span.set(stream=stream)
+            for attempt in range(retries + 1):
+                span.set(attempts=attempt + 1)
+                try:
+                    log.info(f"Запрос к LLM (попытка {attempt+1})...")
+                    if stream:
+                        return self._accept(cache_key, current_messages, self._stream_json(span, current_messages, on_field))
+                    response = self.client.chat.completions.create(**self._completion_kwargs(current_messages))
+                    return self._accept(cache_key, current_messages, self._parse_response(span, response), response)
+                except Exception as e:
+                    failed = self._attempt_failed(e, attempt, retries, span, current_messages)
+                    if failed is not None:
+                        return failed
+
+            span.fail("Failed after retries")
+            return {"error": "Failed after retries"}
+
+    async def agenerate_json(self, messages: List[Dict[str, str]], retries: int = 3) -> Optional[Dict[str, Any]]:
+        """Асинхронный аналог generate_json: не занимает поток на время ожидания ответа."""
+        with tracer.span("llm.agenerate_json", model=settings.MODEL_NAME) as span:
+            cache_key, cached = self._cache_lookup(messages)
+            span.set(cached=cached is not None)
+            if cached is not None:
+                return cached
+
+            current_messages = messages.copy()
+
+            for attempt in range(retries + 1):
+                span.set(attempts=attempt + 1)
+                try:
+                    log.info(f"Асинхронный запрос к LLM (попытка {attempt+1})...")
+                    response = await self.async_client.chat.completions.create(
+                        **self._completion_kwargs(current_messages)
+                    )
+                    return self._accept(cache_key, current_messages, self._parse_response(span, response), response)
+                except Exception as e:
+                    failed = self._attempt_failed(e, attempt, retries, span, current_messages)
+                    if failed is not None:
+                        return failed
+
+            span.fail("Failed after retries")
+            return {"error": "Failed after retries"}
+
+    async def agenerate_many(
+        self,
+        batch: List[List[Dict[str, str]]],
+        concurrency: Optional[int] = None,
+        retries: int = 3
+    ) -> List[Optional[Dict[str, Any]]]:
+        """Выполняет несколько запросов одновременно, не более concurrency в полете."""
+        semaphore = asyncio.Semaphore(concurrency or settings.LLM_CONCURRENCY)
+
+        async def _one(messages: List[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                return await self.agenerate_json(messages, retries=retries)
+
+        return await asyncio.gather(*(_one(m) for m in batch))
+
+    def generate_many(
+        self,
+        batch: List[List[Dict[str, str]]],
+        concurrency: Optional[int] = None,
+        retries: int = 3
+    ) -> List[Optional[Dict[str, Any]]]:
+        """Синхронная обертка над agenerate_many для кода вне event loop."""
+        async def _run() -> List[Optional[Dict[str, Any]]]:
             try:
-                log.info(f"Запрос к LLM (попытка {attempt+1})...")
-                
-                response = self.client.chat.completions.create(
-                    model=settings.MODEL_NAME,
-                    messages=current_messages,
-                    response_format={"type": "json_object"},
-                    temperature=0.1,
-                    extra_body={
-                        "transforms": ["middle-out"] 
-                    }
-                )
-                content = response.choices[0].message.content
-                
-                if not content:
-                    raise ValueError("Получен пустой ответ от LLM")
-                
-                return json.loads(content)
-
-            except json.JSONDecodeError:
-                log.warning(f"Попытка {attempt + 1}: LLM вернула битый JSON.")
-                if attempt < retries:
-                    current_messages.append({
-                        "role": "user", 
-                        "content": "Error: Your response is not valid JSON. Fix formatting. Return JSON only."
-                    })
-            except APITimeoutError:
-                log.warning(f"Попытка {attempt + 1}: Таймаут. Пробуем снова...")
-            except Exception as e:
-                log.error(f"Ошибка LLM: {e}")
-                if attempt == retries:
-                    return {"error": str(e)}
-        
-        return {"error": "Failed after retries"}
+                return await self.agenerate_many(batch, concurrency=concurrency, retries=retries)
+            finally:
+                await aclose_async_http_client()
+
+        return asyncio.run(_run())
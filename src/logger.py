@@ -1,17 +1,180 @@
+import atexit
+import contextvars
+import copy
+import json
 import logging
-from rich.logging import RichHandler
-
-def configure_logging(level: int = logging.INFO):
-    """Настраивает глобальное логирование проекта."""
-    logging.basicConfig(
-        level=level,
-        format="%(message)s",
-        datefmt="[%X]",
-        handlers=[
-            RichHandler(rich_tracebacks=True, markup=True, show_path=False),
-            logging.FileHandler("agent_run.log", encoding='utf-8')
-        ]
-    )
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+# Логирование настраивается из окружения напрямую, а не через AppConfig:
+# логи нужны и до проверки обязательных переменных (GH_TOKEN и т.д.)
+#   LOG_LEVEL        — уровень (INFO)
+#   LOG_FORMAT       — rich (консоль с разметкой, файл — текст) или json (JSON Lines везде)
+#   LOG_FILE         — файл лога (agent_run.log); пусто — только консоль
+#   LOG_MAX_MB       — ротация по размеру (20 МБ)
+#   LOG_ROTATE_WHEN  — ротация по времени вместо размера (midnight, H, D...)
+#   LOG_BACKUPS      — сколько старых файлов хранить (5)
+
+_configured = False
+_configure_lock = threading.RLock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.Handler] = None
+
+# Метки текущего запуска (job_id, issue, pr); копируются в потоки инструментов через contextvars.
+# Значение не меняется на месте: log_context кладет новый словарь (общий изменяемый default был бы виден всем)
+_log_context: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("log_context", default=None)
+
+
+@contextmanager
+def log_context(**tags: Any) -> Iterator[None]:
+    """Добавляет метки ко всем записям лога внутри блока (и в потоках, запущенных из него)."""
+    token = _log_context.set({**(_log_context.get() or {}), **tags})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def _plain(text: str) -> str:
+    """Сообщение без rich-разметки ([bold], [dim]...) для файла и JSON."""
+    from rich.markup import render
+
+    try:
+        return render(text).plain
+    except Exception:
+        return text
+
+
+def _tags(record: logging.LogRecord) -> str:
+    return " ".join(f"{key}={value}" for key, value in getattr(record, "context", {}).items())
+
+
+class PlainFormatter(logging.Formatter):
+    """Текстовая строка с временем, уровнем и метками запуска."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(message)s")
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        # Запись общая для всех обработчиков слушателя — меняем копию
+        record = copy.copy(record)
+        tags = _tags(record)
+        record.message = f"[{tags}] {_plain(record.message)}" if tags else _plain(record.message)
+        return super().formatMessage(record)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Сообщение для RichHandler: метки запуска приглушенным префиксом."""
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        from rich.markup import escape
+
+        tags = _tags(record)
+        return f"[dim]{escape(tags)}[/dim] {record.message}" if tags else record.message
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: ts, level, logger, message, метки и traceback."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": _plain(record.getMessage()),
+            **getattr(record, "context", {}),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    На вызывающем потоке только подставляет аргументы и метки; разметка rich,
+    форматирование и запись на диск выполняются в потоке QueueListener.
+    Для очереди между процессами traceback заранее превращается в текст.
+    """
+
+    def __init__(self, log_queue: Any, local: bool):
+        super().__init__(log_queue)
+        self.local = local
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.context = dict(_log_context.get() or {})
+        if not self.local and record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _file_handler(path: str, backups: int) -> logging.Handler:
+    when = os.getenv("LOG_ROTATE_WHEN", "")
+    if when:
+        return logging.handlers.TimedRotatingFileHandler(path, when=when, backupCount=backups, encoding="utf-8")
+    max_bytes = int(float(os.getenv("LOG_MAX_MB", 20)) * 1024 * 1024)
+    return logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+
+
+def _build_handlers() -> List[logging.Handler]:
+    json_mode = os.getenv("LOG_FORMAT", "rich").strip().lower() == "json"
+    console: logging.Handler
+    if json_mode:
+        console = logging.StreamHandler(sys.stderr)
+        console.setFormatter(JsonFormatter())
+    else:
+        from rich.logging import RichHandler
+
+        console = RichHandler(rich_tracebacks=True, markup=True, show_path=False)
+        console.setFormatter(ConsoleFormatter(datefmt="[%X]"))
+    handlers: List[logging.Handler] = [console]
+
+    path = os.getenv("LOG_FILE", "agent_run.log")
+    if path:
+        file_handler = _file_handler(path, int(os.getenv("LOG_BACKUPS", 5)))
+        file_handler.setFormatter(JsonFormatter() if json_mode else PlainFormatter())
+        handlers.append(file_handler)
+    return handlers
+
+
+def configure_logging(level: Optional[int] = None, log_queue: Any = None):
+    """
+    Настраивает глобальное логирование проекта: корневой логгер пишет в очередь,
+    обработчики работают в отдельном потоке. С log_queue (процесс пула задач)
+    записи уходят в очередь родительского процесса, который их и выводит.
+    """
+    global _configured, _listener, _queue_handler
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    with _configure_lock:
+        shutdown_logging()
+        if level is None:
+            level = logging.getLevelName(os.getenv("LOG_LEVEL", "INFO").upper())
+
+        if log_queue is None:
+            log_queue = queue.SimpleQueue()
+            _listener = logging.handlers.QueueListener(log_queue, *_build_handlers(), respect_handler_level=True)
+            _listener.start()
+            _queue_handler = _ContextQueueHandler(log_queue, local=True)
+        else:
+            _queue_handler = _ContextQueueHandler(log_queue, local=False)
+
+        root = logging.getLogger()
+        root.addHandler(_queue_handler)
+        root.setLevel(level)
+        _configured = True
     # Подавляем лишний шум от библиотек
     logging.getLogger("httpx").setLevel(logging.WARNING)
     logging.getLogger("httpcore").setLevel(logging.WARNING)
@@ -19,6 +182,50 @@ def configure_logging(level: int = logging.INFO):
     logging.getLogger("git").setLevel(logging.WARNING)
     logging.getLogger("openai").setLevel(logging.WARNING)
 
-configure_logging()
 
-log = logging.getLogger("rich")
+def forward_logs(log_queue: Any) -> logging.handlers.QueueListener:
+    """Выводит записи из очереди процессов пула теми же обработчиками, что и у этого процесса."""
+    if not _configured:
+        configure_logging()
+    handlers = _listener.handlers if _listener is not None else ()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def shutdown_logging():
+    """Дописывает очередь и снимает обработчики; следующий вызов log настроит логирование заново."""
+    global _configured, _listener, _queue_handler
+    with _configure_lock:
+        if _queue_handler is not None:
+            logging.getLogger().removeHandler(_queue_handler)
+            _queue_handler = None
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
+        _configured = False
+
+
+atexit.register(shutdown_logging)
+
+
+class _LazyLogger:
+    """
+    Логгер проекта, который настраивает логирование (rich, agent_run.log)
+    при первом использовании, а не при импорте модуля.
+    """
+
+    def __init__(self, name: str):
+        self._logger = logging.getLogger(name)
+
+    def __getattr__(self, name: str):
+        if not _configured:
+            with _configure_lock:
+                if not _configured:
+                    configure_logging()
+        return getattr(self._logger, name)
+
+
+log = _LazyLogger("rich")
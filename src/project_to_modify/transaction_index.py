@@ -0,0 +1,233 @@
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+Rows = Union[int, np.ndarray]
+
+
+def _grown(array: np.ndarray, used: int, needed: int) -> np.ndarray:
+    """Массив не меньше needed элементов (емкость удваивается), первые used сохранены."""
+    if needed <= len(array):
+        return array
+    size = max(len(array), 16)
+    while size < needed:
+        size *= 2
+    grown = np.empty(size, dtype=array.dtype)
+    grown[:used] = array[:used]
+    return grown
+
+
+class CodeIndex:
+    """
+    Вторичный индекс по кодовому столбцу (статус, валюта): для каждого кода —
+    плотный список его строк, для каждой строки — позиция в этом списке.
+    Добавление, удаление и смена кода — O(1); строки кода — срез без поиска.
+    """
+
+    def __init__(self, capacity: int):
+        self._members: List[np.ndarray] = []
+        self._counts: List[int] = []
+        self.positions = np.empty(capacity, dtype=np.int32)
+
+    def reserve(self, capacity: int):
+        self.positions = _grown(self.positions, len(self.positions), capacity)
+
+    def _room(self, code: int, extra: int) -> np.ndarray:
+        while len(self._members) <= code:
+            self._members.append(np.empty(16, dtype=np.int32))
+            self._counts.append(0)
+        self._members[code] = _grown(self._members[code], self._counts[code], self._counts[code] + extra)
+        return self._members[code]
+
+    def add(self, row: int, code: int):
+        members = self._room(code, 1)
+        position = self._counts[code]
+        members[position] = row
+        self.positions[row] = position
+        self._counts[code] = position + 1
+
+    def add_many(self, rows: np.ndarray, codes: np.ndarray):
+        if len(rows) == 0:
+            return
+        if (codes == codes[0]).all():
+            groups = [(int(codes[0]), rows)]
+        else:
+            order = np.argsort(codes, kind="stable")
+            values, starts = np.unique(codes[order], return_index=True)
+            stops = [*starts[1:].tolist(), len(rows)]
+            groups = [(int(code), rows[order[start:stop]]) for code, start, stop in zip(values, starts, stops, strict=True)]
+        for code, group in groups:
+            members = self._room(code, len(group))
+            start = self._counts[code]
+            members[start:start + len(group)] = group
+            self.positions[group] = np.arange(start, start + len(group), dtype=np.int32)
+            self._counts[code] = start + len(group)
+
+    def discard(self, row: int, code: int):
+        """Убирает строку из списка кода, ставя на ее место последнюю строку списка."""
+        members = self._members[code]
+        position = int(self.positions[row])
+        last = self._counts[code] - 1
+        moved = members[last]
+        members[position] = moved
+        self.positions[moved] = position
+        self._counts[code] = last
+
+    def move(self, row: int, old: int, new: int):
+        if old != new:
+            self.discard(row, old)
+            self.add(row, new)
+
+    def move_many(self, rows: np.ndarray, old: np.ndarray, new: np.ndarray):
+        """Пакетный move для разных строк rows: то же удаление с перестановкой, но векторно."""
+        changed = old != new
+        rows, old, new = rows[changed], old[changed], new[changed]
+        for code in np.unique(old).tolist():
+            members = self._members[code]
+            count = self._counts[code]
+            positions = self.positions[rows[old == code]]
+            kept = count - len(positions)
+            # Дыры в начале списка заполняются оставшимися строками из его хвоста
+            holes = np.sort(positions[positions < kept])
+            leaving = np.zeros(count - kept, dtype=bool)
+            leaving[positions[positions >= kept] - kept] = True
+            tail = members[kept:count][~leaving]
+            members[holes] = tail
+            self.positions[tail] = holes
+            self._counts[code] = kept
+        self.add_many(rows, new)
+
+    def renumber(self, old_row: int, new_row: int, code: int):
+        """Строка old_row переехала на номер new_row (удаление с перестановкой в таблице)."""
+        position = self.positions[old_row]
+        self._members[code][position] = new_row
+        self.positions[new_row] = position
+
+    def count(self, code: int) -> int:
+        return self._counts[code] if code < len(self._counts) else 0
+
+    def rows(self, code: int) -> np.ndarray:
+        """Строки кода в порядке индекса (view; копировать перед изменением таблицы)."""
+        if code >= len(self._counts):
+            return np.empty(0, dtype=np.int32)
+        return self._members[code][:self._counts[code]]
+
+    def nbytes(self) -> int:
+        return self.positions.nbytes + sum(members.nbytes for members in self._members)
+
+    def state(self, size: int) -> Tuple[List[int], Dict[str, np.ndarray]]:
+        """Размеры списков и массивы индекса для снимка (view, без копий)."""
+        arrays = {"positions": self.positions[:size]}
+        for code, count in enumerate(self._counts):
+            arrays[f"members{code}"] = self._members[code][:count]
+        return list(self._counts), arrays
+
+    @classmethod
+    def restore(cls, counts: List[int], arrays: Dict[str, np.ndarray]) -> "CodeIndex":
+        index = cls(0)
+        index.positions = arrays["positions"]
+        index._counts = list(counts)
+        index._members = [arrays[f"members{code}"] for code in range(len(counts))]
+        return index
+
+
+class TimeIndex:
+    """
+    Упорядоченный индекс по времени. Пока строки идут в порядке времени (обычный
+    случай для datetime.now()), сам столбец timestamps отсортирован и диапазон
+    ищется бинарным поиском прямо в нем, без дополнительной памяти. Иначе
+    строится перестановка строк по времени: более поздние добавления дописываются
+    в нее, остальные изменения перестраивают ее при следующем запросе.
+    """
+
+    def __init__(self) -> None:
+        self._sorted = True
+        self._order: Optional[np.ndarray] = None
+        self._keys: Optional[np.ndarray] = None
+        self._indexed = 0
+        self._stale = False
+
+    @classmethod
+    def restore(cls, in_column_order: bool) -> "TimeIndex":
+        """Индекс после загрузки снимка: перестановка, если нужна, строится при первом запросе."""
+        index = cls()
+        index._sorted = in_column_order
+        index._stale = not in_column_order
+        return index
+
+    @property
+    def in_column_order(self) -> bool:
+        """True, пока столбец отсортирован и отдельная перестановка не нужна."""
+        return self._sorted
+
+    def appended(self, timestamps: np.ndarray, first_row: int):
+        """Строки first_row.. дописаны в конец столбца timestamps (заполненная часть)."""
+        if self._sorted and first_row == len(timestamps) - 1:
+            # Частый случай: одна строка (add_transaction) не раньше предыдущей
+            if first_row == 0 or timestamps[first_row - 1] <= timestamps[first_row]:
+                return
+        segment = timestamps[max(first_row - 1, 0):]
+        in_order = bool((segment[1:] >= segment[:-1]).all())
+        if self._sorted:
+            if not in_order:
+                self._sorted, self._stale = False, True
+            return
+        if self._stale or not in_order:
+            self._stale = True
+            return
+        added = timestamps[first_row:]
+        if self._order is None or self._keys is None or (self._indexed and added[0] < self._keys[self._indexed - 1]):
+            self._stale = True
+            return
+        needed = self._indexed + len(added)
+        order = self._order = _grown(self._order, self._indexed, needed)
+        keys = self._keys = _grown(self._keys, self._indexed, needed)
+        order[self._indexed:needed] = np.arange(first_row, len(timestamps), dtype=np.int32)
+        keys[self._indexed:needed] = added
+        self._indexed = needed
+
+    def changed(self, timestamps: np.ndarray, rows: Rows):
+        """У строк rows поменялось время (или на их место переставлена другая строка)."""
+        if self._sorted:
+            rows = np.atleast_1d(rows)
+            values = timestamps[rows]
+            before = timestamps[np.maximum(rows - 1, 0)]
+            after = timestamps[np.minimum(rows + 1, len(timestamps) - 1)]
+            if ((before <= values) & (values <= after)).all():
+                return
+            self._sorted = False
+        self._stale = True
+
+    def truncated(self):
+        """Удалена последняя строка таблицы."""
+        if not self._sorted:
+            self._stale = True
+
+    def _rebuild(self, timestamps: np.ndarray):
+        if (timestamps[1:] >= timestamps[:-1]).all():
+            self._sorted, self._order, self._keys, self._indexed = True, None, None, 0
+        else:
+            self._order = np.argsort(timestamps, kind="stable").astype(np.int32)
+            self._keys = timestamps[self._order]
+            self._indexed = len(timestamps)
+        self._stale = False
+
+    def bounds(self, timestamps: np.ndarray, since: Optional[int], until: Optional[int]) -> Tuple[int, int]:
+        """Границы [start, stop) строк со временем в [since, until) в порядке индекса."""
+        if not self._sorted and (self._stale or self._order is None):
+            self._rebuild(timestamps)
+        # После _rebuild перестановка есть всегда, когда столбец не отсортирован
+        keys = timestamps if self._sorted or self._keys is None else self._keys[:self._indexed]
+        start = int(np.searchsorted(keys, since, "left")) if since is not None else 0
+        stop = int(np.searchsorted(keys, until, "left")) if until is not None else len(keys)
+        return start, max(start, stop)
+
+    def rows(self, start: int, stop: int) -> np.ndarray:
+        if self._sorted or self._order is None:
+            return np.arange(start, stop, dtype=np.int32)
+        return self._order[start:stop].copy()
+
+    def nbytes(self) -> int:
+        if self._sorted or self._order is None or self._keys is None:
+            return 0
+        return self._order.nbytes + self._keys.nbytes
@@ -1,26 +1,182 @@
-from typing import Dict, List, Optional
+from typing import Collection, Dict, Iterable, Iterator, List, MutableMapping, Optional, Sequence, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
+from itertools import islice
 
+import numpy as np
 
-@dataclass
+from src.project_to_modify.transaction_shards import ShardedTransactionTable
+from src.project_to_modify.transaction_store import TransactionStore
+from src.project_to_modify.transaction_table import ArrayLike, TransactionTable
+
+
+@dataclass(slots=True)
 class Transaction:
     id: str
     amount: float
     currency: str
-    status: str  # PENDING, COMPLETED, FAILED
+    status: str  # PENDING, COMPLETED, FAILED, REFUNDED
     timestamp: datetime
 
 
+class TransactionView:
+    """
+    Транзакция из таблицы: поля читаются и пишутся прямо в столбцы под замком
+    секции. Хранит только id, поэтому остается верной после удаления и
+    перестановки строк.
+    """
+
+    __slots__ = ("_storage", "id")
+
+    def __init__(self, storage: ShardedTransactionTable, t_id: str):
+        self._storage = storage
+        self.id = t_id
+
+    @property
+    def amount(self) -> float:
+        with self._storage.locked_row(self.id) as (table, row):
+            return float(table.amounts[row])
+
+    @amount.setter
+    def amount(self, value: float):
+        with self._storage.locked_row(self.id) as (table, row):
+            table.set_amount(row, value)
+
+    @property
+    def currency(self) -> str:
+        with self._storage.locked_row(self.id) as (table, row):
+            return table.currency_of(row)
+
+    @currency.setter
+    def currency(self, value: str):
+        with self._storage.locked_row(self.id) as (table, row):
+            table.set_currency(row, value)
+
+    @property
+    def status(self) -> str:
+        with self._storage.locked_row(self.id) as (table, row):
+            return table.status_of(row)
+
+    @status.setter
+    def status(self, value: str):
+        with self._storage.locked_row(self.id) as (table, row):
+            table.set_status(row, value)
+
+    @property
+    def timestamp(self) -> datetime:
+        with self._storage.locked_row(self.id) as (table, row):
+            return table.timestamp_of(row)
+
+    @timestamp.setter
+    def timestamp(self, value: datetime):
+        with self._storage.locked_row(self.id) as (table, row):
+            table.set_timestamp(row, value)
+
+    def to_transaction(self) -> Transaction:
+        with self._storage.locked_row(self.id) as (table, row):
+            t_id, amount, currency, status, timestamp = table.record(row)
+        return Transaction(id=t_id, amount=amount, currency=currency, status=status, timestamp=timestamp)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, TransactionView):
+            other = other.to_transaction()
+        if isinstance(other, Transaction):
+            return self.to_transaction() == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(self.to_transaction()).replace("Transaction(", "TransactionView(", 1)
+
+
+class TransactionMapping(MutableMapping[str, TransactionView]):
+    """
+    Словарь id -> транзакция поверх колоночной таблицы. Значения — TransactionView:
+    изменения полей сразу попадают в таблицу. Присвоить можно и Transaction.
+    """
+
+    def __init__(self, storage: ShardedTransactionTable):
+        self._storage = storage
+
+    def __getitem__(self, t_id: str) -> TransactionView:
+        if t_id not in self._storage:
+            raise KeyError(t_id)
+        return TransactionView(self._storage, t_id)
+
+    def __setitem__(self, t_id: str, transaction: Union[Transaction, TransactionView]):
+        if isinstance(transaction, TransactionView):
+            transaction = transaction.to_transaction()
+        self._storage.put(t_id, transaction.amount, transaction.currency, transaction.status, transaction.timestamp)
+
+    def __delitem__(self, t_id: str):
+        self._storage.remove(t_id)
+
+    def __contains__(self, t_id: object) -> bool:
+        return t_id in self._storage
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._storage)
+
+    def __len__(self) -> int:
+        return len(self._storage)
+
+
 class PaymentProcessor:
     """
     Продуктовый сервис для обработки платежей.
     Содержит скрытые баги для проверки работы AI-агента.
     """
     
-    def __init__(self, tax_rate: float = 0.20):
+    # Размер пакета при загрузке из итератора
+    INGEST_CHUNK = 65536
+    # Ответы process_refunds на ошибки, в порядке проверок process_refund
+    REFUND_ERRORS = (
+        "ERROR: Transaction not found",
+        "ERROR: Cannot process refund for zero amount",
+        "ERROR: Refund amount must be greater than zero",
+        "ERROR: Refund exceeds original amount",
+        "ERROR: Transaction already refunded",
+    )
+
+    def __init__(self, tax_rate: float = 0.20, store: Optional[TransactionStore] = None, shards: int = 1):
+        """
+        store — необязательное долговременное хранилище: транзакции
+        восстанавливаются из него, а все изменения пишутся в его журнал.
+        shards — число секций хранилища, каждая под своим замком: методы
+        можно вызывать из нескольких потоков, а process_refunds обрабатывает
+        секции параллельно.
+        """
         self.tax_rate = tax_rate
-        self.transactions: Dict[str, Transaction] = {}
+        self.store = store
+        self.storage = store.open(shards) if store is not None else ShardedTransactionTable(shards)
+        self.transactions: MutableMapping[str, TransactionView] = TransactionMapping(self.storage)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def table(self) -> TransactionTable:
+        """Таблица транзакций процессора с одной секцией."""
+        if len(self.storage.tables) != 1:
+            raise AttributeError("У PaymentProcessor с несколькими секциями нет общей таблицы: см. storage.tables")
+        return self.storage.tables[0]
+
+    def snapshot(self):
+        """Снимок таблицы в хранилище; журнал после этого начинается заново."""
+        if self.store is not None:
+            self.store.snapshot()
+
+    def close(self):
+        """Останавливает пул потоков, дописывает журнал на диск и отключает хранилище."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self.store is not None:
+            self.store.close()
+
+    def __enter__(self) -> "PaymentProcessor":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
     def calculate_total_with_tax(self, amount: float) -> float:
         """
@@ -44,37 +200,178 @@ class PaymentProcessor:
 
     def process_refund(self, transaction_id: str, refund_amount: float) -> str:
         """
-        Оформляет возврат по транзакции.
-        """
-        if transaction_id not in self.transactions:
-            return "ERROR: Transaction not found"
-        
-        transaction = self.transactions[transaction_id]
-        
-        if transaction.amount == 0:
-            return "ERROR: Cannot process refund for zero amount"
-        
-        if refund_amount <= 0:
-            return "ERROR: Refund amount must be greater than zero"
-        
-        if refund_amount > transaction.amount:
-            return "ERROR: Refund exceeds original amount"
-        
-        ratio = refund_amount / transaction.amount
-        transaction.status = "REFUNDED"
+        Оформляет возврат по транзакции. Проверка и смена статуса идут под
+        замком секции, поэтому из параллельных возвратов одной транзакции
+        успешен ровно один.
+        """
+        table, lock = self.storage.shard(transaction_id)
+        with lock:
+            row = table.find(transaction_id)
+            if row is None:
+                return "ERROR: Transaction not found"
+
+            amount = float(table.amounts[row])
+
+            if amount == 0:
+                return "ERROR: Cannot process refund for zero amount"
+
+            if refund_amount <= 0:
+                return "ERROR: Refund amount must be greater than zero"
+
+            if refund_amount > amount:
+                return "ERROR: Refund exceeds original amount"
+
+            if table.status_of(row) == "REFUNDED":
+                return "ERROR: Transaction already refunded"
+
+            table.set_status(row, "REFUNDED")
+        ratio = refund_amount / amount
         return f"SUCCESS: Refund ratio {ratio:.2f} processed"
 
+    def process_refunds(self, transaction_ids: ArrayLike, refund_amounts: Union[float, ArrayLike]) -> List[str]:
+        """
+        Пакетный process_refund: ответ на каждую пару (id, сумма) в порядке
+        пакета. Повтор id в пакете ведет себя как повторный вызов — успешен
+        первый корректный возврат. Секции обрабатываются параллельно в пуле
+        потоков, каждая под своим замком и целиком на NumPy.
+        """
+        ids = transaction_ids.tolist() if isinstance(transaction_ids, np.ndarray) else list(transaction_ids)
+        refunds = np.asarray(refund_amounts, dtype=np.float64)
+        if refunds.ndim == 0:
+            refunds = np.full(len(ids), float(refunds))
+        elif len(refunds) != len(ids):
+            raise ValueError(f"Длины transaction_ids ({len(ids)}) и refund_amounts ({len(refunds)}) не совпадают")
+        results: List[str] = [""] * len(ids)
+
+        def process_shard(shard: int, positions: np.ndarray):
+            with self.storage.locks[shard]:
+                messages = self._refund_shard(self.storage.tables[shard], [ids[p] for p in positions.tolist()],
+                                              refunds[positions])
+            for position, message in zip(positions.tolist(), messages, strict=True):
+                results[position] = message
+
+        groups = [(shard, positions) for shard, positions in enumerate(self.storage.split(ids)) if len(positions)]
+        if len(groups) > 1:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=len(self.storage.tables),
+                                                    thread_name_prefix="payment-refunds")
+            for future in [self._executor.submit(process_shard, *group) for group in groups]:
+                future.result()
+        else:
+            for group in groups:
+                process_shard(*group)
+        return results
+
+    def _refund_shard(self, table: TransactionTable, ids: Sequence[str], refunds: np.ndarray) -> List[str]:
+        """Возвраты одной секции (вызывается под ее замком)."""
+        rows = table.rows_of(ids)
+        found = rows >= 0
+        amounts = np.zeros(len(ids))
+        amounts[found] = table.amounts[rows[found]]
+        refunded = np.zeros(len(ids), dtype=bool)
+        refunded[found] = table.statuses[rows[found]] == table.status_codes.code("REFUNDED")
+
+        errors = np.select([~found, amounts == 0, refunds <= 0, refunds > amounts], [0, 1, 2, 3], default=-1)
+        valid = np.flatnonzero(errors < 0)
+        # Из корректных возвратов строки проходит первый, и только если строка еще не REFUNDED
+        _, first = np.unique(rows[valid], return_index=True)
+        accepted = valid[first]
+        accepted = accepted[~refunded[accepted]]
+        errors[valid] = 4
+        errors[accepted] = -1
+        table.set_statuses(rows[accepted], "REFUNDED")
+
+        ratios = refunds / np.where(amounts == 0, 1.0, amounts)
+        return [self.REFUND_ERRORS[error] if error >= 0 else f"SUCCESS: Refund ratio {ratio:.2f} processed"
+                for error, ratio in zip(errors.tolist(), ratios.tolist(), strict=True)]
+
     def add_transaction(self, t_id: str, amount: float, currency: str = "USD"):
         """
         Добавляет транзакцию в базу.
         """
-        self.transactions[t_id] = Transaction(
-            id=t_id,
-            amount=amount,
-            currency=currency,
-            status="PENDING",
-            timestamp=datetime.now()
-        )
+        self.storage.put(t_id, amount, currency, "PENDING", datetime.now())
+
+    def add_transactions(self, ids: ArrayLike, amounts: ArrayLike, currencies: Union[str, ArrayLike] = "USD",
+                         timestamps: Optional[ArrayLike] = None) -> int:
+        """
+        Пакетный аналог add_transaction: массивы (или последовательности) id,
+        сумм и валют (или одна валюта на весь пакет). Время по умолчанию —
+        текущее; для загрузки истории можно передать datetime/datetime64 на
+        каждую запись. Возвращает число записей.
+        """
+        return self.storage.extend(ids, amounts, currencies, "PENDING",
+                                   datetime.now() if timestamps is None else timestamps)
+
+    def add_transactions_from(self, rows: Iterable[Tuple], chunk_size: Optional[int] = None) -> int:
+        """
+        Загрузка из итератора кортежей (id, amount) или (id, amount, currency)
+        пакетами по chunk_size без материализации всего потока в памяти.
+        """
+        chunk_size = chunk_size or self.INGEST_CHUNK
+        iterator = iter(rows)
+        total = 0
+        while True:
+            chunk = list(islice(iterator, chunk_size))
+            if not chunk:
+                return total
+            ids = [row[0] for row in chunk]
+            amounts = [row[1] for row in chunk]
+            currencies = [row[2] if len(row) > 2 else "USD" for row in chunk]
+            total += self.add_transactions(ids, amounts, currencies)
+
+    def find_transactions(self, status: Union[None, str, Collection[str]] = None,
+                          currency: Union[None, str, Collection[str]] = None,
+                          since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[str]:
+        """
+        Id транзакций по статусу, валюте (значение или набор значений) и времени
+        в [since, until). Использует индексы, без прохода по всем транзакциям.
+        """
+        return self.storage.select_ids(status, currency, since, until)
+
+    def count_transactions(self, status: Union[None, str, Collection[str]] = None,
+                           currency: Union[None, str, Collection[str]] = None,
+                           since: Optional[datetime] = None, until: Optional[datetime] = None) -> int:
+        """Число транзакций под теми же условиями, что и в find_transactions."""
+        return self.storage.count(status, currency, since, until)
+
+    def totals_by_currency(self, status: Union[None, str, Collection[str]] = None,
+                           since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, float]:
+        """Сумма транзакций по валютам, с фильтром по статусу и времени."""
+        return self.storage.sums_by_currency(status, since, until)
+
+    def counts_by_status(self) -> Dict[str, int]:
+        return self.storage.counts_by_status()
+
+    def _amounts(self, amounts: ArrayLike) -> np.ndarray:
+        values = np.asarray(amounts, dtype=np.float64)
+        if (values < 0).any():
+            raise ValueError("Сумма не может быть отрицательной")
+        return values
+
+    def calculate_totals_with_tax(self, amounts: ArrayLike) -> np.ndarray:
+        """Пакетный calculate_total_with_tax: ValueError, если хотя бы одна сумма отрицательна."""
+        return self._amounts(amounts) * (1 + self.tax_rate)
+
+    def apply_discounts(self, amounts: ArrayLike, discount_percents: Union[float, ArrayLike]) -> np.ndarray:
+        """Пакетный apply_discount: одна скидка на все суммы или по скидке на сумму."""
+        if discount_percents is None:
+            raise ValueError("Discount percent must be provided")
+        discounts = np.asarray(discount_percents)
+        if discounts.dtype == object:
+            if any(d is None for d in discounts.ravel().tolist()):
+                raise ValueError("Discount percent must be provided")
+        discounts = discounts.astype(np.float64)
+        if (discounts < 0).any():
+            raise ValueError("Скидка не может быть отрицательной")
+        if (discounts > 100).any():
+            raise ValueError("Скидка не может превышать 100%")
+        values = np.asarray(amounts, dtype=np.float64)
+        return values - (values * (discounts / 100))
+
+    def calculate_final_amounts(self, amounts: ArrayLike, is_exempt: Union[bool, ArrayLike]) -> np.ndarray:
+        """Пакетный calculate_final_amount: признак освобождения общий или на каждую сумму."""
+        values = self._amounts(amounts)
+        return np.where(np.asarray(is_exempt, dtype=bool), values, values * (1 + self.tax_rate))
 
     def calculate_final_amount(self, amount: float, is_exempt: bool) -> float:
         """
@@ -84,4 +381,4 @@ class PaymentProcessor:
             raise ValueError("Сумма не может быть отрицательной")
         if is_exempt:
             return amount
-        return self.calculate_total_with_tax(amount)
\ No newline at end of file
+        return self.calculate_total_with_tax(amount)
@@ -0,0 +1,226 @@
+import threading
+import zlib
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from typing import Any, Collection, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from src.project_to_modify.transaction_table import (
+    ArrayLike,
+    JournalSink,
+    TransactionTable,
+    hash_ids,
+    to_epoch_us_array,
+)
+
+# Номер секции — старшие биты crc32 * φ: младшие биты crc32 таблица секции
+# использует для выбора ячейки, и они не должны зависеть от секции
+_FIBONACCI = 0x9E3779B1
+
+Filter = Union[None, str, Collection[str]]
+
+
+class ShardedTransactionTable:
+    """
+    Транзакции, разбитые по id на секции — независимые TransactionTable, у
+    каждой свой замок (lock striping): операции над разными секциями не ждут
+    друг друга. Все методы берут замок своей секции; tables и locks открыты для
+    пакетных операций, которые держат замок секции сами.
+    """
+
+    def __init__(self, shards: int = 1, capacity: int = 1024):
+        if shards < 1:
+            raise ValueError(f"Число секций должно быть положительным, а не {shards}")
+        self.tables = [TransactionTable(capacity) for _ in range(shards)]
+        self.locks = [threading.Lock() for _ in range(shards)]
+
+    def __len__(self) -> int:
+        return sum(len(table) for table in self.tables)
+
+    def __contains__(self, t_id: object) -> bool:
+        if not isinstance(t_id, str):
+            return False
+        table, lock = self.shard(t_id)
+        with lock:
+            return t_id in table
+
+    def __iter__(self) -> Iterator[str]:
+        for table, lock in zip(self.tables, self.locks, strict=True):
+            with lock:
+                ids = table.ids_of(np.arange(len(table)))
+            yield from ids
+
+    # --- секции и замки ---
+
+    def shard_of(self, t_id: str) -> int:
+        if len(self.tables) == 1:
+            return 0
+        # id не-строки не хранятся ни в одной секции: берем секцию пустого id, как и split
+        data = t_id.encode("utf-8") if isinstance(t_id, str) else b""
+        return ((zlib.crc32(data) * _FIBONACCI) & 0xFFFFFFFF) * len(self.tables) >> 32
+
+    def shard(self, t_id: str) -> Tuple[TransactionTable, threading.Lock]:
+        n = self.shard_of(t_id)
+        return self.tables[n], self.locks[n]
+
+    def split(self, ids: List[str]) -> List[np.ndarray]:
+        """Позиции пакета ids по секциям; внутри секции порядок пакета сохраняется."""
+        if len(self.tables) == 1:
+            return [np.arange(len(ids))]
+        # id не-строки идут в секцию пустого id: rows_of там их не найдет
+        encoded = [t_id.encode("utf-8") if isinstance(t_id, str) else b"" for t_id in ids]
+        hashes = hash_ids(encoded).astype(np.uint64)
+        shards = ((hashes * _FIBONACCI) & 0xFFFFFFFF) * len(self.tables) >> 32
+        order = np.argsort(shards, kind="stable")
+        bounds = np.searchsorted(shards[order], np.arange(len(self.tables) + 1))
+        return [order[start:stop] for start, stop in zip(bounds[:-1], bounds[1:], strict=True)]
+
+    @contextmanager
+    def locked(self) -> Iterator["ShardedTransactionTable"]:
+        """Все замки по порядку секций: согласованное состояние (снимок)."""
+        with ExitStack() as stack:
+            for lock in self.locks:
+                stack.enter_context(lock)
+            yield self
+
+    @contextmanager
+    def locked_row(self, t_id: str) -> Iterator[Tuple[TransactionTable, int]]:
+        """(таблица, строка) транзакции под замком ее секции; KeyError, если ее нет."""
+        table, lock = self.shard(t_id)
+        with lock:
+            yield table, table.row(t_id)
+
+    @property
+    def journal(self) -> Optional[JournalSink]:
+        return self.tables[0].journal
+
+    @journal.setter
+    def journal(self, sink: Optional[JournalSink]):
+        for table in self.tables:
+            table.journal = sink
+
+    # --- запись ---
+
+    def put(self, t_id: str, amount: float, currency: str, status: str, timestamp: datetime):
+        table, lock = self.shard(t_id)
+        with lock:
+            table.put(t_id, amount, currency, status, timestamp)
+
+    def extend(self, ids: ArrayLike, amounts: ArrayLike, currencies: Union[str, ArrayLike],
+               statuses: Union[str, ArrayLike], timestamps: Union[datetime, ArrayLike]) -> int:
+        """TransactionTable.extend, разложенный по секциям."""
+        if len(self.tables) == 1:
+            with self.locks[0]:
+                return self.tables[0].extend(ids, amounts, currencies, statuses, timestamps)
+        id_list = ids.tolist() if isinstance(ids, np.ndarray) else list(ids)
+        count = len(id_list)
+        amounts = np.asarray(amounts, dtype=np.float64).ravel()
+        # Столбец — общее значение на пакет (str или datetime) либо массив той же длины, что ids
+        columns: Dict[str, Any] = {"amounts": amounts, "currencies": currencies, "statuses": statuses,
+                                   "timestamps": timestamps}
+        for name, values in columns.items():
+            if isinstance(values, (str, datetime)):
+                continue
+            if name == "timestamps":
+                values = to_epoch_us_array(values)
+            elif name != "amounts":
+                values = np.array(values.tolist() if isinstance(values, np.ndarray) else list(values), dtype=object)
+            if len(values) != count:
+                raise ValueError(f"Длины ids ({count}) и {name} ({len(values)}) не совпадают")
+            columns[name] = values
+
+        id_array = np.array(id_list, dtype=object)
+        for table, lock, positions in zip(self.tables, self.locks, self.split(id_list), strict=True):
+            if not len(positions):
+                continue
+            part: Dict[str, Any] = {name: values if isinstance(values, (str, datetime)) else values[positions]
+                                    for name, values in columns.items()}
+            with lock:
+                table.extend(id_array[positions], part["amounts"], part["currencies"], part["statuses"],
+                             part["timestamps"])
+        return count
+
+    def remove(self, t_id: str):
+        table, lock = self.shard(t_id)
+        with lock:
+            table.remove(t_id)
+
+    # --- запросы: по секциям, каждая под своим замком ---
+
+    def select_ids(self, statuses: Filter = None, currencies: Filter = None,
+                   since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[str]:
+        ids: List[str] = []
+        for table, lock in zip(self.tables, self.locks, strict=True):
+            with lock:
+                ids += table.ids_of(table.select(statuses, currencies, since, until))
+        return ids
+
+    def count(self, statuses: Filter = None, currencies: Filter = None,
+              since: Optional[datetime] = None, until: Optional[datetime] = None) -> int:
+        total = 0
+        for table, lock in zip(self.tables, self.locks, strict=True):
+            with lock:
+                total += len(table.select(statuses, currencies, since, until))
+        return total
+
+    def sums_by_currency(self, statuses: Filter = None, since: Optional[datetime] = None,
+                         until: Optional[datetime] = None) -> Dict[str, float]:
+        everything = statuses is None and since is None and until is None
+        totals: Dict[str, float] = {}
+        for table, lock in zip(self.tables, self.locks, strict=True):
+            with lock:
+                sums = table.sums_by_currency(None if everything else table.select(statuses, None, since, until))
+            for currency, amount in sums.items():
+                totals[currency] = totals.get(currency, 0.0) + amount
+        return totals
+
+    def counts_by_status(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for table, lock in zip(self.tables, self.locks, strict=True):
+            with lock:
+                shard_counts = table.counts_by_status()
+            for status, count in shard_counts.items():
+                counts[status] = counts.get(status, 0) + count
+        return counts
+
+    # --- снимок ---
+
+    def export_state(self) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        """Состояние всех секций для снимка; вызывать под locked()."""
+        meta: Dict[str, Any] = {"shards": []}
+        arrays: Dict[str, np.ndarray] = {}
+        for n, table in enumerate(self.tables):
+            table_meta, table_arrays = table.export_state()
+            meta["shards"].append(table_meta)
+            arrays.update({f"{n}.{name}": array for name, array in table_arrays.items()})
+        return meta, arrays
+
+    @classmethod
+    def from_state(cls, meta: Dict[str, Any], arrays: Dict[str, np.ndarray],
+                   shards: Optional[int] = None) -> "ShardedTransactionTable":
+        """
+        Секции из export_state (снимок одной TransactionTable — одна секция).
+        Если shards отличается от числа секций в снимке, записи раскладываются заново.
+        """
+        if "shards" in meta:
+            parts: List[Dict[str, np.ndarray]] = [{} for _ in meta["shards"]]
+            for key, array in arrays.items():
+                n, _, name = key.partition(".")
+                parts[int(n)][name] = array
+            tables = [TransactionTable.from_state(table_meta, part) for table_meta, part in zip(meta["shards"], parts, strict=True)]
+        else:
+            tables = [TransactionTable.from_state(meta, arrays)]
+
+        loaded = cls(len(tables), capacity=0)
+        loaded.tables = tables
+        if shards is None or shards == len(tables):
+            return loaded
+        resharded = cls(shards)
+        for table in tables:
+            currency_names = np.array(table.currency_codes.values, dtype=object)
+            status_names = np.array(table.status_codes.values, dtype=object)
+            resharded.extend(table.ids_of(np.arange(len(table))), table.column("amounts"),
+                             currency_names[table.column("currencies")], status_names[table.column("statuses")],
+                             table.column("timestamps"))
+        return resharded
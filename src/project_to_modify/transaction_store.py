@@ -0,0 +1,506 @@
+"""
+Долговременное хранение PaymentProcessor: журнал изменений и снимки таблицы.
+
+В каталоге хранилища лежат пары поколений:
+    snapshot-000007.snap   — состояние таблицы на начало поколения 7
+    journal-000007.log     — изменения после этого снимка (append-only)
+
+Снимок N содержит все записи журналов < N, поэтому при старте берется
+последний снимок и поверх него проигрываются журналы начиная с N. Старые
+поколения удаляются только после того, как новый снимок записан и fsync-нут.
+"""
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from src.project_to_modify.transaction_shards import ShardedTransactionTable
+
+# Запись журнала: длина данных, CRC32 (тип + данные), тип; затем данные
+_FRAME = struct.Struct("<IIB")
+_BATCH, _REMOVE = 1, 2
+# BATCH — пачка put в столбцах: число записей, размер словаря строк; затем словарь
+# (<H + байты), суммы f8, время i8, коды валют и статусов u2 (индексы словаря), длины id i4, байты id
+_BATCH_FIELDS = struct.Struct("<IH")
+_LENGTH = struct.Struct("<H")
+# CRC записи начинается с CRC байта типа
+_CRC_SEED = {kind: zlib.crc32(bytes((kind,))) for kind in (_BATCH, _REMOVE)}
+
+_SNAPSHOT_MAGIC = b"PAYSNAP1"
+_SNAPSHOT_HEADER = struct.Struct("<8sQ")
+_ALIGN = 64
+
+_GENERATION = re.compile(r"^(snapshot|journal)-(\d+)\.(snap|log)$")
+
+SYNC_MODES = ("interval", "always")
+
+# Одиночный put в очереди журнала: (id, сумма, время в мкс, валюта, статус)
+PutEntry = Tuple[bytes, float, int, str, str]
+# Его размер в записи BATCH без id: сумма, время, два кода, длина id
+_PUT_BYTES = 8 + 8 + 2 + 2 + 4
+
+
+def _frame(kind: int, payload: bytes) -> bytes:
+    return _FRAME.pack(len(payload), zlib.crc32(payload, _CRC_SEED[kind]), kind) + payload
+
+
+def encode_batch(packed_ids: Union[bytes, np.ndarray], id_lengths: np.ndarray, amounts: np.ndarray, micros: np.ndarray,
+                 currency_codes: np.ndarray, currency_values: Sequence[str],
+                 status_codes: np.ndarray, status_values: Sequence[str]) -> bytes:
+    """Пачка put одной записью; коды валют и статусов ссылаются на общий словарь строк записи."""
+    currency_names = list(currency_values[:int(currency_codes.max()) + 1]) if len(currency_codes) else []
+    status_names = list(status_values[:int(status_codes.max()) + 1]) if len(status_codes) else []
+    parts: List[Union[bytes, np.ndarray]] = [_BATCH_FIELDS.pack(len(amounts), len(currency_names) + len(status_names))]
+    for name in currency_names + status_names:
+        data = name.encode("utf-8")
+        parts += [_LENGTH.pack(len(data)), data]
+    parts += [
+        np.ascontiguousarray(amounts, dtype="<f8"),
+        np.ascontiguousarray(micros, dtype="<i8"),
+        np.ascontiguousarray(currency_codes, dtype="<u2"),
+        np.asarray(status_codes, dtype="<u2") + np.uint16(len(currency_names)),
+        np.ascontiguousarray(id_lengths, dtype="<i4"),
+        packed_ids,
+    ]
+    return _frame(_BATCH, b"".join(parts))
+
+
+def encode_puts(puts: Sequence[PutEntry]) -> bytes:
+    """Очередь одиночных put (то, что накопилось за интервал) — одной записью BATCH."""
+    ids, amounts, micros, currencies, statuses = zip(*puts, strict=True)
+    currency_values = list(dict.fromkeys(currencies))
+    status_values = list(dict.fromkeys(statuses))
+    currency_lookup = {value: code for code, value in enumerate(currency_values)}
+    status_lookup = {value: code for code, value in enumerate(status_values)}
+    count = len(puts)
+    return encode_batch(
+        b"".join(ids),
+        np.fromiter(map(len, ids), dtype=np.int32, count=count),
+        np.array(amounts, dtype=np.float64),
+        np.array(micros, dtype=np.int64),
+        np.fromiter(map(currency_lookup.__getitem__, currencies), dtype=np.uint16, count=count),
+        currency_values,
+        np.fromiter(map(status_lookup.__getitem__, statuses), dtype=np.uint16, count=count),
+        status_values,
+    )
+
+
+def encode_remove(t_id: bytes) -> bytes:
+    return _frame(_REMOVE, t_id)
+
+
+def read_records(data: bytes) -> Tuple[List[Tuple[int, memoryview]], int]:
+    """Записи журнала и длина целой части: оборванная или поврежденная запись завершает чтение."""
+    view = memoryview(data)
+    records = []
+    offset = 0
+    while offset + _FRAME.size <= len(view):
+        length, crc, kind = _FRAME.unpack_from(view, offset)
+        end = offset + _FRAME.size + length
+        if end > len(view):
+            break
+        payload = view[offset + _FRAME.size:end]
+        if kind not in _CRC_SEED or zlib.crc32(payload, _CRC_SEED[kind]) != crc:
+            break
+        records.append((kind, payload))
+        offset = end
+    return records, offset
+
+
+def _apply_batch(table: ShardedTransactionTable, payload: memoryview):
+    count, name_count = _BATCH_FIELDS.unpack_from(payload)
+    offset = _BATCH_FIELDS.size
+    names = []
+    for _ in range(name_count):
+        (length,) = _LENGTH.unpack_from(payload, offset)
+        names.append(str(payload[offset + _LENGTH.size:offset + _LENGTH.size + length], "utf-8"))
+        offset += _LENGTH.size + length
+
+    def column(dtype: str) -> np.ndarray:
+        nonlocal offset
+        values = np.frombuffer(payload, dtype=dtype, count=count, offset=offset)
+        offset += values.nbytes
+        return values
+
+    amounts, micros = column("<f8"), column("<i8")
+    currency_codes, status_codes, id_lengths = column("<u2"), column("<u2"), column("<i4")
+    blob = payload[offset:]
+    ends = np.cumsum(id_lengths).tolist()
+    ids = [str(blob[end - length:end], "utf-8") for end, length in zip(ends, id_lengths.tolist(), strict=True)]
+    values = np.array(names, dtype=object)
+    table.extend(ids, amounts, values[currency_codes], values[status_codes], micros)
+
+
+def apply_records(table: ShardedTransactionTable, records: List[Tuple[int, memoryview]]):
+    """Проигрывает записи журнала в таблицу (журнал таблицы на это время отключен)."""
+    for kind, payload in records:
+        if kind == _BATCH:
+            _apply_batch(table, payload)
+        else:
+            t_id = str(payload, "utf-8")
+            # Запись могла попасть и в снимок, если снимок писался параллельно с изменениями
+            if t_id in table:
+                table.remove(t_id)
+
+
+# --- снимки ---
+
+def write_snapshot(path: Path, meta: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+    """
+    Снимок: заголовок (magic, длина JSON), JSON с метаданными и описанием
+    массивов, затем сами массивы с выравниванием по 64 байта. Пишется во
+    временный файл и атомарно переименовывается после fsync.
+    """
+    layout: List[Dict[str, Any]] = []
+    offset = 0
+    for name, array in arrays.items():
+        layout.append({"name": name, "dtype": array.dtype.str, "count": len(array), "offset": offset})
+        offset += -(-array.nbytes // _ALIGN) * _ALIGN
+    header = json.dumps({"meta": meta, "arrays": layout}).encode("utf-8")
+    data_start = -(-(_SNAPSHOT_HEADER.size + len(header)) // _ALIGN) * _ALIGN
+
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, len(header)))
+        f.write(header)
+        for entry, array in zip(layout, arrays.values(), strict=True):
+            f.seek(data_start + entry["offset"])
+            f.write(memoryview(np.ascontiguousarray(array)).cast("B"))
+        f.truncate(data_start + offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(path.parent)
+
+
+def load_snapshot(path: Path) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """
+    Метаданные и массивы снимка через mmap с копированием при записи: страницы
+    читаются с диска по мере обращения, а изменения остаются в памяти процесса.
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    magic, header_len = _SNAPSHOT_HEADER.unpack_from(mapped)
+    if magic != _SNAPSHOT_MAGIC:
+        raise ValueError(f"{path}: не снимок транзакций")
+    header = json.loads(mapped[_SNAPSHOT_HEADER.size:_SNAPSHOT_HEADER.size + header_len])
+    data_start = -(-(_SNAPSHOT_HEADER.size + header_len) // _ALIGN) * _ALIGN
+    arrays = {}
+    for entry in header["arrays"]:
+        dtype = np.dtype(entry["dtype"])
+        end = data_start + entry["offset"] + entry["count"] * dtype.itemsize
+        if end > len(mapped):
+            raise ValueError(f"{path}: снимок обрезан")
+        arrays[entry["name"]] = np.frombuffer(mapped, dtype=dtype, count=entry["count"],
+                                              offset=data_start + entry["offset"])
+    return header["meta"], arrays
+
+
+def _fsync_dir(directory: Path):
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# --- журнал ---
+
+class TransactionJournal:
+    """
+    Append-only журнал с групповой фиксацией. Изменения копятся в очереди,
+    фоновый поток пишет накопленное одним write и одним fsync на всю пачку;
+    одиночные put при этом кодируются столбцами в одну запись BATCH.
+
+    sync="interval" — запись не ждет диска, fsync не реже чем раз в
+    sync_interval секунд (при сбое теряется не больше этого окна);
+    sync="always"   — каждая запись ждет fsync своей пачки: потоки, пишущие
+    одновременно, делят один fsync.
+    """
+
+    def __init__(self, path: Path, sync: str = "interval", sync_interval: float = 0.01):
+        if sync not in SYNC_MODES:
+            raise ValueError(f"sync должен быть одним из {SYNC_MODES}, а не {sync!r}")
+        self.sync_mode = sync
+        self.sync_interval = sync_interval
+        self._file = open(path, "ab")
+        self.path = path
+        self.bytes_written = self._file.tell()
+        self._pending: List[Union[PutEntry, bytes]] = []
+        self._appended = 0
+        self._durable = 0
+        self._error: Optional[BaseException] = None
+        self._closing = False
+        self._urgent = False
+        self._cond = threading.Condition(threading.Lock())
+        self._flusher = threading.Thread(target=self._run, name="transaction-journal", daemon=True)
+        self._flusher.start()
+
+    # JournalSink
+    def put(self, t_id: bytes, amount: float, micros: int, currency: str, status: str):
+        self._append((t_id, amount, micros, currency, status), _PUT_BYTES + len(t_id))
+
+    def extend(self, packed_ids: Union[bytes, np.ndarray], id_lengths: np.ndarray, amounts: np.ndarray,
+               micros: np.ndarray, currency_codes: np.ndarray, currency_values: Sequence[str],
+               status_codes: np.ndarray, status_values: Sequence[str]):
+        # Пакет кодируется сразу: вызывающий может изменить свои массивы после возврата
+        record = encode_batch(packed_ids, id_lengths, amounts, micros, currency_codes, currency_values,
+                              status_codes, status_values)
+        self._append(record, len(record))
+
+    def remove(self, t_id: bytes):
+        record = encode_remove(t_id)
+        self._append(record, len(record))
+
+    def _append(self, entry: Union[PutEntry, bytes], size: int):
+        with self._cond:
+            if self._error is not None:
+                raise OSError(f"Журнал {self.path} недоступен") from self._error
+            self._pending.append(entry)
+            self._appended += 1
+            # Для put — оценка: точный размер известен только после кодирования пачки
+            self.bytes_written += size
+            if self.sync_mode == "always":
+                self._urgent = True
+                self._cond.notify_all()
+                self._wait(self._appended)
+            elif len(self._pending) == 1:
+                self._cond.notify_all()
+
+    def sync(self):
+        """Ждет, пока все уже принятые записи окажутся на диске."""
+        with self._cond:
+            self._urgent = True
+            self._cond.notify_all()
+            self._wait(self._appended)
+
+    def _wait(self, sequence: int):
+        while self._durable < sequence and self._error is None:
+            self._cond.wait()
+        if self._error is not None:
+            raise OSError(f"Журнал {self.path} недоступен") from self._error
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                # Копим пачку: записи, пришедшие за интервал, уйдут одним write и одним fsync
+                deadline = time.monotonic() + self.sync_interval
+                while not (self._urgent or self._closing) and time.monotonic() < deadline:
+                    self._cond.wait(deadline - time.monotonic())
+                batch, self._pending = self._pending, []
+                sequence = self._appended
+                self._urgent = False
+                if not batch and self._closing:
+                    return
+            try:
+                data = self._encode(batch)
+                self._file.write(data)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except BaseException as exc:
+                with self._cond:
+                    self._error = exc
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._durable = sequence
+                self._cond.notify_all()
+
+    @staticmethod
+    def _encode(batch: List[Union[PutEntry, bytes]]) -> bytes:
+        records, puts = [], []
+        for entry in batch:
+            if isinstance(entry, tuple):
+                puts.append(entry)
+                continue
+            if puts:
+                records.append(encode_puts(puts))
+                puts = []
+            records.append(entry)
+        if puts:
+            records.append(encode_puts(puts))
+        return b"".join(records)
+
+    def close(self):
+        """Дописывает буфер, делает fsync и закрывает файл."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._flusher.join()
+        self._file.close()
+        if self._error is not None:
+            raise OSError(f"Журнал {self.path} недоступен") from self._error
+
+
+class TransactionStore:
+    """
+    Каталог с журналом и снимками для PaymentProcessor. open() восстанавливает
+    таблицу (снимок + хвост журнала) и подключает к ней журнал; snapshot()
+    начинает новое поколение. При snapshot_bytes снимок делается
+    автоматически в фоновом потоке, как только журнал поколения его превысит.
+    """
+
+    def __init__(self, directory: str, sync: str = "interval", sync_interval: float = 0.01,
+                 snapshot_bytes: Optional[int] = 32 * 1024 * 1024):
+        if sync not in SYNC_MODES:
+            raise ValueError(f"sync должен быть одним из {SYNC_MODES}, а не {sync!r}")
+        self.directory = Path(directory)
+        self.sync_mode = sync
+        self.sync_interval = sync_interval
+        self.snapshot_bytes = snapshot_bytes
+        self.generation = 0
+        self.journal: Optional[TransactionJournal] = None
+        self.table: Optional[ShardedTransactionTable] = None
+        self.recovery: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        # Запуск фонового снимка; не берется под замками секций
+        self._trigger = threading.Lock()
+        self._snapshotter: Optional[threading.Thread] = None
+        self._snapshot_error: Optional[BaseException] = None
+
+    def _path(self, kind: str, generation: int) -> Path:
+        suffix = "snap" if kind == "snapshot" else "log"
+        return self.directory / f"{kind}-{generation:06d}.{suffix}"
+
+    def _generations(self, kind: str) -> List[int]:
+        found = []
+        for path in self.directory.iterdir():
+            match = _GENERATION.match(path.name)
+            if match and match.group(1) == kind:
+                found.append(int(match.group(2)))
+        return sorted(found)
+
+    def open(self, shards: int = 1) -> ShardedTransactionTable:
+        """
+        Загружает последний снимок, проигрывает журналы после него и включает
+        журналирование. Таблица делится на shards секций независимо от того,
+        со сколькими секциями был записан снимок.
+        """
+        started = time.perf_counter()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        snapshots = self._generations("snapshot")
+        self.generation = snapshots[-1] if snapshots else 0
+        if snapshots:
+            table = ShardedTransactionTable.from_state(*load_snapshot(self._path("snapshot", self.generation)), shards)
+        else:
+            table = ShardedTransactionTable(shards)
+        loaded = time.perf_counter()
+
+        segments = [g for g in self._generations("journal") if g >= self.generation]
+        replayed = 0
+        for generation in segments:
+            path = self._path("journal", generation)
+            data = path.read_bytes()
+            records, valid = read_records(data)
+            if valid < len(data):
+                if generation != segments[-1]:
+                    raise ValueError(f"{path}: поврежден журнал не последнего поколения (байт {valid})")
+                # Оборванный хвост последней записи (сбой во время write) отрезаем
+                with open(path, "r+b") as f:
+                    f.truncate(valid)
+            apply_records(table, records)
+            replayed += len(records)
+        if segments:
+            self.generation = segments[-1]
+
+        self.recovery = {
+            "rows": len(table),
+            "snapshot_s": round(loaded - started, 3),
+            "replay_s": round(time.perf_counter() - loaded, 3),
+            "journal_records": replayed,
+        }
+        self.table = table
+        self.journal = TransactionJournal(self._path("journal", self.generation), self.sync_mode, self.sync_interval)
+        table.journal = self
+        return table
+
+    def _current_journal(self) -> TransactionJournal:
+        journal = self.journal
+        if journal is None:
+            raise RuntimeError(f"Хранилище {self.directory} не открыто")
+        return journal
+
+    # JournalSink: передает записи текущему журналу и следит за порогом снимка
+    def put(self, t_id: bytes, amount: float, micros: int, currency: str, status: str):
+        self._current_journal().put(t_id, amount, micros, currency, status)
+        self._maybe_snapshot()
+
+    def extend(self, packed_ids: Union[bytes, np.ndarray], id_lengths: np.ndarray, amounts: np.ndarray,
+               micros: np.ndarray, currency_codes: np.ndarray, currency_values: Sequence[str],
+               status_codes: np.ndarray, status_values: Sequence[str]):
+        self._current_journal().extend(packed_ids, id_lengths, amounts, micros, currency_codes, currency_values,
+                                       status_codes, status_values)
+        self._maybe_snapshot()
+
+    def remove(self, t_id: bytes):
+        self._current_journal().remove(t_id)
+        self._maybe_snapshot()
+
+    def _maybe_snapshot(self):
+        # Вызывается под замком секции, поэтому снимок (ему нужны все замки) — в отдельном потоке
+        if not self.snapshot_bytes or self._current_journal().bytes_written < self.snapshot_bytes:
+            return
+        with self._trigger:
+            if self._snapshotter is None or not self._snapshotter.is_alive():
+                self._snapshotter = threading.Thread(target=self._background_snapshot,
+                                                     name="transaction-snapshot", daemon=True)
+                self._snapshotter.start()
+
+    def _background_snapshot(self):
+        try:
+            with self._lock:
+                if self.journal is not None and self.journal.bytes_written >= self.snapshot_bytes:
+                    self.snapshot()
+        except BaseException as exc:
+            self._snapshot_error = exc
+
+    def snapshot(self):
+        """
+        Новое поколение: журнал переключается на новый файл, состояние таблицы
+        пишется в снимок, после чего старые снимки и журналы удаляются. Секции
+        заблокированы только на переключение журнала и копирование состояния:
+        запись снимка на диск идет параллельно с новыми изменениями.
+        """
+        with self._lock:
+            with self.table.locked():
+                old_journal = self.journal
+                self.generation += 1
+                self.journal = TransactionJournal(self._path("journal", self.generation), self.sync_mode,
+                                                  self.sync_interval)
+                old_journal.close()
+                meta, views = self.table.export_state()
+                # export_state отдает view на живые массивы — копия нужна до снятия замков
+                arrays = {name: view.copy() for name, view in views.items()}
+            write_snapshot(self._path("snapshot", self.generation), meta, arrays)
+            for kind in ("snapshot", "journal"):
+                for generation in self._generations(kind):
+                    if generation < self.generation:
+                        self._path(kind, generation).unlink(missing_ok=True)
+
+    def sync(self):
+        """Ждет fsync всех принятых записей (например, перед ответом клиенту)."""
+        self._current_journal().sync()
+
+    def close(self):
+        if self._snapshotter is not None:
+            self._snapshotter.join()
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        if self.table is not None:
+            self.table.journal = None
+        if self._snapshot_error is not None:
+            raise OSError(f"Снимок в {self.directory} не записан") from self._snapshot_error
+
@@ -0,0 +1,687 @@
+import sys
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Collection, Dict, Iterable, Iterator, List, Optional, Protocol, Sequence, Tuple, Union
+
+import numpy as np
+from numpy.typing import DTypeLike
+
+from src.project_to_modify.transaction_index import CodeIndex, TimeIndex
+
+ArrayLike = Union[np.ndarray, Iterable]
+
+# Время хранится как int64 микросекунд от эпохи (наивное локальное время, как datetime.now())
+EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+# Хэш id — CRC32 байтов UTF-8: не зависит от PYTHONHASHSEED (одинаков в любом процессе)
+# и считается на C; совпадение хэшей все равно проверяется сравнением байтов
+hash_id = zlib.crc32
+
+# Служебные значения ячеек хэш-таблицы
+_EMPTY = -1
+_DELETED = -2
+
+
+def to_epoch_us(moment: datetime) -> int:
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return (moment - EPOCH) // _MICROSECOND
+
+
+def from_epoch_us(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def to_epoch_us_array(moments: ArrayLike) -> np.ndarray:
+    """Пакетный to_epoch_us: datetime, datetime64 или уже готовые int64 мкс."""
+    values = np.asarray(moments)
+    if values.dtype == object:
+        return np.fromiter(map(to_epoch_us, values.ravel().tolist()), dtype=np.int64, count=values.size)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype("datetime64[us]").astype(np.int64).ravel()
+    return values.astype(np.int64).ravel()
+
+
+def hash_ids(encoded: Sequence[bytes]) -> np.ndarray:
+    return np.fromiter(map(zlib.crc32, encoded), dtype=np.uint32, count=len(encoded))
+
+
+def _table_size(rows: int) -> int:
+    """Размер хэш-таблицы: степень двойки, заполнение не выше 1/2."""
+    size = 16
+    while size < rows * 2:
+        size *= 2
+    return size
+
+
+class CodeBook:
+    """Строковые значения (валюты, статусы) и их коды; в таблице хранятся только коды."""
+
+    def __init__(self, values: Sequence[str] = (), dtype: DTypeLike = np.uint8):
+        self.dtype: np.dtype[Any] = np.dtype(dtype)
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+        for value in values:
+            self.code(value)
+
+    def code(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            if code > np.iinfo(self.dtype).max:
+                raise ValueError(f"Слишком много различных значений для {self.dtype}: {value!r}")
+            value = sys.intern(value)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def codes(self, values: Sequence[str]) -> np.ndarray:
+        codes = list(map(self._codes.get, values))
+        if None in codes:
+            for value in dict.fromkeys(values):
+                self.code(value)
+            codes = list(map(self._codes.__getitem__, values))
+        return np.array(codes, dtype=self.dtype)
+
+    def find(self, value: str) -> Optional[int]:
+        """Код без добавления: None, если значение не встречалось."""
+        return self._codes.get(value)
+
+    def value(self, code: int) -> str:
+        return self.values[code]
+
+
+class JournalSink(Protocol):
+    """Получатель изменений таблицы (журнал TransactionStore); вызывается после каждой записи."""
+
+    def put(self, t_id: bytes, amount: float, micros: int, currency: str, status: str): ...
+
+    def extend(self, packed_ids: Union[bytes, np.ndarray], id_lengths: np.ndarray, amounts: np.ndarray,
+               micros: np.ndarray, currency_codes: np.ndarray, currency_values: Sequence[str],
+               status_codes: np.ndarray, status_values: Sequence[str]): ...
+
+    def remove(self, t_id: bytes): ...
+
+
+class TransactionTable:
+    """
+    Колоночное хранилище транзакций (struct of arrays). На транзакцию —
+    сумма float64, время int64 (мкс от эпохи), коды валюты и статуса, id в
+    общем UTF-8 буфере и ячейки хэш-таблицы id -> строка (int32, до 2^31 строк).
+    Объектов Python на транзакцию не создается; строки хранятся плотно.
+
+    Вторичные индексы (статус, валюта, время) обновляются всеми методами
+    записи; столбцы статуса, валюты и времени меняются только через них.
+    Если задан journal, каждое изменение после применения уходит в него.
+    """
+
+    COLUMNS = ("amounts", "timestamps", "currencies", "statuses", "id_starts", "id_lengths", "id_hashes")
+
+    def __init__(self, capacity: int = 1024):
+        self._size = 0
+        self.currency_codes = CodeBook(("USD", "EUR"), dtype=np.uint16)
+        self.status_codes = CodeBook(("PENDING", "COMPLETED", "FAILED", "REFUNDED"), dtype=np.uint8)
+        self.amounts = np.empty(capacity, dtype=np.float64)
+        self.timestamps = np.empty(capacity, dtype=np.int64)
+        self.currencies = np.empty(capacity, dtype=np.uint16)
+        self.statuses = np.empty(capacity, dtype=np.uint8)
+        self.id_starts = np.empty(capacity, dtype=np.int64)
+        self.id_lengths = np.empty(capacity, dtype=np.int32)
+        self.id_hashes = np.empty(capacity, dtype=np.uint32)
+        self._buffer = np.empty(capacity * 16, dtype=np.uint8)
+        self._buffer_used = 0
+        self._slots = np.full(_table_size(capacity), _EMPTY, dtype=np.int32)
+        self._deleted = 0
+        self.status_index = CodeIndex(capacity)
+        self.currency_index = CodeIndex(capacity)
+        self.time_index = TimeIndex()
+        self.journal: Optional[JournalSink] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, t_id: object) -> bool:
+        return isinstance(t_id, str) and self.find(t_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for row in range(self._size):
+            yield self.id_of(row)
+
+    # --- id и хэш-таблица ---
+
+    def id_of(self, row: int) -> str:
+        return self._id_bytes(row).decode("utf-8")
+
+    def ids_of(self, rows: np.ndarray) -> List[str]:
+        """id нескольких строк сразу: срезы одного memoryview вместо обращений к NumPy на каждую."""
+        buffer = self._buffer.data
+        starts, lengths = self.id_starts[rows].tolist(), self.id_lengths[rows].tolist()
+        return [str(buffer[start:start + length], "utf-8") for start, length in zip(starts, lengths, strict=True)]
+
+    def _id_bytes(self, row: int) -> bytes:
+        start = int(self.id_starts[row])
+        return self._buffer[start:start + int(self.id_lengths[row])].tobytes()
+
+    def _probe(self, data: bytes, h: int) -> Tuple[int, int]:
+        """(строка, ячейка): строка -1, если id нет, и тогда ячейка — куда его вставить."""
+        mask = len(self._slots) - 1
+        slot = h & mask
+        free = -1
+        while True:
+            row = int(self._slots[slot])
+            if row == _EMPTY:
+                return -1, free if free >= 0 else slot
+            if row == _DELETED:
+                if free < 0:
+                    free = slot
+            elif int(self.id_hashes[row]) == h and self._id_bytes(row) == data:
+                return row, slot
+            slot = (slot + 1) & mask
+
+    def find(self, t_id: str) -> Optional[int]:
+        """Номер строки транзакции; None, если ее нет (в том числе для id не-строки)."""
+        if not isinstance(t_id, str):
+            return None
+        data = t_id.encode("utf-8")
+        row, _ = self._probe(data, hash_id(data))
+        return row if row >= 0 else None
+
+    def row(self, t_id: str) -> int:
+        """Номер строки транзакции; KeyError, если ее нет."""
+        row = self.find(t_id)
+        if row is None:
+            raise KeyError(t_id)
+        return row
+
+    def rows_of(self, ids: Sequence[str]) -> np.ndarray:
+        """Пакетный find: строки id (int64), -1 для отсутствующих."""
+        try:
+            encoded = list(map(str.encode, ids))
+        except TypeError:
+            # В пакете есть id не-строки: таких в таблице нет, ищутся только строки
+            positions = [n for n, t_id in enumerate(ids) if isinstance(t_id, str)]
+            rows = np.full(len(ids), -1, dtype=np.int64)
+            rows[positions] = self.rows_of([ids[n] for n in positions])
+            return rows
+        return self._lookup(encoded, hash_ids(encoded))
+
+    def _reserve(self, extra: int, extra_bytes: int) -> bool:
+        """Запас под extra строк и extra_bytes байт id; True, если хэш-таблица перестроена."""
+        needed = self._size + extra
+        capacity = len(self.amounts)
+        if needed > capacity:
+            capacity = max(capacity, 16)
+            while capacity < needed:
+                capacity *= 2
+            for name in self.COLUMNS:
+                old = getattr(self, name)
+                grown = np.empty(capacity, dtype=old.dtype)
+                grown[:self._size] = old[:self._size]
+                setattr(self, name, grown)
+            self.status_index.reserve(capacity)
+            self.currency_index.reserve(capacity)
+
+        bytes_needed = self._buffer_used + extra_bytes
+        if bytes_needed > len(self._buffer):
+            size = max(len(self._buffer), 256)
+            while size < bytes_needed:
+                size *= 2
+            grown = np.empty(size, dtype=np.uint8)
+            grown[:self._buffer_used] = self._buffer[:self._buffer_used]
+            self._buffer = grown
+
+        if (needed + self._deleted) * 2 > len(self._slots):
+            self._slots = np.full(_table_size(needed), _EMPTY, dtype=np.int32)
+            self._deleted = 0
+            self._place(np.arange(self._size, dtype=np.int64))
+            return True
+        return False
+
+    def _place(self, rows: np.ndarray):
+        """Векторная вставка строк в хэш-таблицу: линейное пробирование раундами."""
+        mask = len(self._slots) - 1
+        slots = self.id_hashes[rows].astype(np.int64) & mask
+        while len(rows):
+            free = self._slots[slots] < 0
+            tombstones = free & (self._slots[slots] == _DELETED)
+            # Из нескольких претендентов на одну свободную ячейку ее занимает один — тот, чья запись уцелела
+            self._slots[slots[free]] = rows[free]
+            placed = free & (self._slots[slots] == rows)
+            self._deleted -= int(np.count_nonzero(tombstones & placed))
+            rows, slots = rows[~placed], (slots[~placed] + 1) & mask
+
+    def _lookup(self, encoded: List[bytes], hashes: np.ndarray) -> np.ndarray:
+        """Строки уже известных id пакета (векторное пробирование), -1 для новых."""
+        found_rows = np.full(len(encoded), -1, dtype=np.int64)
+        if self._size == 0:
+            return found_rows
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        packed = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        offsets = np.zeros(len(encoded), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        mask = len(self._slots) - 1
+        pending = np.arange(len(encoded))
+        slots = hashes.astype(np.int64) & mask
+        while len(pending):
+            rows = self._slots[slots]
+            done = rows == _EMPTY
+            # Байты сверяются только при совпадении хэша
+            candidates = np.flatnonzero((rows >= 0) & (self.id_hashes[np.maximum(rows, 0)] == hashes[pending]))
+            if len(candidates):
+                queries = pending[candidates]
+                same = self._same_ids(rows[candidates], packed, offsets[queries], lengths[queries])
+                found_rows[queries[same]] = rows[candidates[same]]
+                done[candidates[same]] = True
+            pending, slots = pending[~done], (slots[~done] + 1) & mask
+        return found_rows
+
+    def _same_ids(self, rows: np.ndarray, packed: np.ndarray, starts: np.ndarray, lengths: np.ndarray,
+                  chunk: int = 65536) -> np.ndarray:
+        """Совпадает ли id строки rows[i] с packed[starts[i]:starts[i] + lengths[i]] — побайтно, без цикла."""
+        same: np.ndarray = self.id_lengths[rows] == lengths
+        for begin in range(0, len(rows), chunk):
+            part = np.flatnonzero(same[begin:begin + chunk]) + begin
+            part_lengths = lengths[part]
+            segment = np.repeat(np.arange(len(part)), part_lengths)
+            segment_starts = np.zeros(len(part), dtype=np.int64)
+            np.cumsum(part_lengths[:-1], out=segment_starts[1:])
+            within = np.arange(len(segment)) - segment_starts[segment]
+            differs = (self._buffer[self.id_starts[rows[part]][segment] + within]
+                       != packed[starts[part][segment] + within])
+            same[part[segment[differs]]] = False
+        return same
+
+    @staticmethod
+    def _first_occurrences(encoded: List[bytes], hashes: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+        """Для каждого кандидата — индекс первого вхождения того же id в пакете."""
+        first = candidates.copy()
+        order = np.argsort(hashes[candidates], kind="stable")
+        sorted_hashes = hashes[candidates][order]
+        for n in np.flatnonzero(sorted_hashes[1:] == sorted_hashes[:-1]) + 1:
+            m = n - 1
+            while m >= 0 and sorted_hashes[m] == sorted_hashes[n]:
+                if encoded[candidates[order[m]]] == encoded[candidates[order[n]]]:
+                    first[order[n]] = first[order[m]]
+                    break
+                m -= 1
+        return first
+
+    # --- запись ---
+
+    def put(self, t_id: str, amount: float, currency: str, status: str, timestamp: datetime) -> int:
+        """Добавляет транзакцию или перезаписывает существующую с тем же id."""
+        if not isinstance(t_id, str):
+            raise TypeError(f"id транзакции должен быть строкой, а не {type(t_id).__name__}")
+        currency_code, status_code = self.currency_codes.code(currency), self.status_codes.code(status)
+        data = t_id.encode("utf-8")
+        h = hash_id(data)
+        row, slot = self._probe(data, h)
+        micros = to_epoch_us(timestamp)
+        if row >= 0:
+            self.amounts[row] = amount
+            self._set_currency(row, currency_code)
+            self._set_status(row, status_code)
+            self._set_timestamp(row, micros)
+        else:
+            row = self._insert(data, h, slot, amount, currency_code, status_code, micros)
+        if self.journal is not None:
+            self.journal.put(data, amount, micros, currency, status)
+        return row
+
+    def _insert(self, data: bytes, h: int, slot: int, amount: float, currency_code: int, status_code: int,
+                micros: int) -> int:
+        if self._reserve(1, len(data)):
+            _, slot = self._probe(data, h)
+        row = self._size
+        start = self._buffer_used
+        self._buffer.data[start:start + len(data)] = data
+        self._buffer_used += len(data)
+        self.id_starts[row] = start
+        self.id_lengths[row] = len(data)
+        self.id_hashes[row] = h
+        if self._slots[slot] == _DELETED:
+            self._deleted -= 1
+        self._slots[slot] = row
+        self._size += 1
+        self.amounts[row] = amount
+        self.currencies[row] = currency_code
+        self.statuses[row] = status_code
+        self.timestamps[row] = micros
+        self.currency_index.add(row, currency_code)
+        self.status_index.add(row, status_code)
+        self.time_index.appended(self.column("timestamps"), row)
+        return row
+
+    def extend(self, ids: ArrayLike, amounts: ArrayLike, currencies: Union[str, ArrayLike],
+               statuses: Union[str, ArrayLike], timestamps: Union[datetime, ArrayLike]) -> int:
+        """
+        Пакетное добавление. Повторяющиеся id ведут себя как серия put:
+        существующие строки перезаписываются, внутри пакета побеждает последний.
+        Валюта, статус и время — одно значение на пакет или по значению на
+        запись. Возвращает число записей.
+        """
+        id_list = ids.tolist() if isinstance(ids, np.ndarray) else list(ids)
+        amounts = np.asarray(amounts, dtype=np.float64).ravel()
+        count = len(id_list)
+        if len(amounts) != count:
+            raise ValueError(f"Длины ids ({count}) и amounts ({len(amounts)}) не совпадают")
+        currency_codes = self._batch_codes(self.currency_codes, "currencies", currencies, count)
+        status_codes = self._batch_codes(self.status_codes, "statuses", statuses, count)
+        if isinstance(timestamps, datetime):
+            micros = np.full(count, to_epoch_us(timestamps), dtype=np.int64)
+        else:
+            micros = to_epoch_us_array(timestamps)
+            if len(micros) != count:
+                raise ValueError(f"Длины ids ({count}) и timestamps ({len(micros)}) не совпадают")
+        if count == 0:
+            return 0
+
+        encoded = list(map(str.encode, id_list))
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=count)
+        packed = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        offsets = np.zeros(count, dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        hashes = hash_ids(encoded)
+
+        # Строка каждой записи: существующая, или новая — одна на все вхождения id в пакете
+        rows = self._lookup(encoded, hashes)
+        new = np.flatnonzero(rows < 0)
+        first = self._first_occurrences(encoded, hashes, new)
+        unique_new = new[first == new]
+
+        first_row = self._size
+        self._reserve(len(unique_new), int(lengths[unique_new].sum()))
+        new_rows = np.arange(first_row, first_row + len(unique_new), dtype=np.int64)
+        row_of_first = np.empty(count, dtype=np.int64)
+        row_of_first[unique_new] = new_rows
+        rows[new] = row_of_first[first]
+
+        if len(unique_new) == count:
+            id_bytes = packed
+            starts = self._buffer_used + offsets
+        else:
+            id_bytes = np.frombuffer(b"".join(encoded[n] for n in unique_new.tolist()), dtype=np.uint8)
+            starts = np.zeros(len(unique_new), dtype=np.int64)
+            np.cumsum(lengths[unique_new][:-1], out=starts[1:])
+            starts += self._buffer_used
+        self._buffer[self._buffer_used:self._buffer_used + len(id_bytes)] = id_bytes
+        self._buffer_used += len(id_bytes)
+        self.id_starts[new_rows] = starts
+        self.id_lengths[new_rows] = lengths[unique_new]
+        self.id_hashes[new_rows] = hashes[unique_new]
+        self._size = first_row + len(unique_new)
+        self._place(new_rows)
+
+        batch = (amounts, micros, currency_codes, status_codes)
+        if len(unique_new) != count:
+            # Несколько записей в одну строку: значения берутся из последней
+            order = np.argsort(rows, kind="stable")
+            last = order[np.r_[rows[order][1:] != rows[order][:-1], True]]
+            rows, amounts, micros, currency_codes, status_codes = (
+                rows[last], amounts[last], micros[last], currency_codes[last], status_codes[last]
+            )
+
+        fresh = rows >= first_row
+        updated = rows[~fresh]
+        if len(updated):
+            self.currency_index.move_many(updated, self.currencies[updated], currency_codes[~fresh])
+            self.status_index.move_many(updated, self.statuses[updated], status_codes[~fresh])
+        self.amounts[rows] = amounts
+        self.currencies[rows] = currency_codes
+        self.statuses[rows] = status_codes
+        self.timestamps[rows] = micros
+        self.currency_index.add_many(rows[fresh], currency_codes[fresh])
+        self.status_index.add_many(rows[fresh], status_codes[fresh])
+        if len(new_rows):
+            self.time_index.appended(self.column("timestamps"), first_row)
+        if len(updated):
+            self.time_index.changed(self.column("timestamps"), updated)
+        if self.journal is not None:
+            amounts, micros, currency_codes, status_codes = batch
+            self.journal.extend(packed, lengths, amounts, micros, currency_codes, self.currency_codes.values,
+                                status_codes, self.status_codes.values)
+        return count
+
+    @staticmethod
+    def _batch_codes(book: CodeBook, name: str, values: Union[str, ArrayLike], count: int) -> np.ndarray:
+        if isinstance(values, str):
+            return np.full(count, book.code(values), dtype=book.dtype)
+        value_list = values.tolist() if isinstance(values, np.ndarray) else list(values)
+        if len(value_list) != count:
+            raise ValueError(f"Длины ids ({count}) и {name} ({len(value_list)}) не совпадают")
+        return book.codes(value_list)
+
+    def remove(self, t_id: str):
+        """Удаляет строку, переставляя на ее место последнюю (таблица остается плотной)."""
+        if not isinstance(t_id, str):
+            raise KeyError(t_id)
+        data = t_id.encode("utf-8")
+        row, slot = self._probe(data, hash_id(data))
+        if row < 0:
+            raise KeyError(t_id)
+        self._slots[slot] = _DELETED
+        self._deleted += 1
+        self.status_index.discard(row, int(self.statuses[row]))
+        self.currency_index.discard(row, int(self.currencies[row]))
+        last = self._size - 1
+        if row != last:
+            _, last_slot = self._probe(self._id_bytes(last), int(self.id_hashes[last]))
+            self.status_index.renumber(last, row, int(self.statuses[last]))
+            self.currency_index.renumber(last, row, int(self.currencies[last]))
+            for name in self.COLUMNS:
+                column = getattr(self, name)
+                column[row] = column[last]
+            self._slots[last_slot] = row
+        self._size = last
+        if row != last:
+            self.time_index.changed(self.column("timestamps"), row)
+        else:
+            self.time_index.truncated()
+        if self.journal is not None:
+            self.journal.remove(data)
+
+    def _set_status(self, row: int, code: int):
+        self.status_index.move(row, int(self.statuses[row]), code)
+        self.statuses[row] = code
+
+    def _set_currency(self, row: int, code: int):
+        self.currency_index.move(row, int(self.currencies[row]), code)
+        self.currencies[row] = code
+
+    def _set_timestamp(self, row: int, micros: int):
+        self.timestamps[row] = micros
+        self.time_index.changed(self.column("timestamps"), row)
+
+    def _journal_row(self, row: int):
+        if self.journal is not None:
+            self.journal.put(self._id_bytes(row), float(self.amounts[row]), int(self.timestamps[row]),
+                             self.currency_of(row), self.status_of(row))
+
+    def set_status(self, row: int, status: str):
+        """Меняет статус строки вместе с индексом статусов."""
+        self._set_status(row, self.status_codes.code(status))
+        self._journal_row(row)
+
+    def set_currency(self, row: int, currency: str):
+        self._set_currency(row, self.currency_codes.code(currency))
+        self._journal_row(row)
+
+    def set_timestamp(self, row: int, timestamp: datetime):
+        self._set_timestamp(row, to_epoch_us(timestamp))
+        self._journal_row(row)
+
+    def set_amount(self, row: int, amount: float):
+        self.amounts[row] = amount
+        self._journal_row(row)
+
+    def set_statuses(self, rows: np.ndarray, status: str):
+        """Пакетный set_status для различных строк rows; в журнал — одной записью."""
+        code = self.status_codes.code(status)
+        self.status_index.move_many(rows, self.statuses[rows], np.full(len(rows), code, dtype=self.statuses.dtype))
+        self.statuses[rows] = code
+        if self.journal is not None and len(rows):
+            starts, lengths = self.id_starts[rows].tolist(), self.id_lengths[rows]
+            buffer = self._buffer.data
+            packed = b"".join([buffer[start:start + length] for start, length in zip(starts, lengths.tolist(), strict=True)])
+            self.journal.extend(packed, lengths, self.amounts[rows], self.timestamps[rows], self.currencies[rows],
+                                self.currency_codes.values, self.statuses[rows], self.status_codes.values)
+
+    # --- чтение ---
+
+    def status_of(self, row: int) -> str:
+        return self.status_codes.value(int(self.statuses[row]))
+
+    def currency_of(self, row: int) -> str:
+        return self.currency_codes.value(int(self.currencies[row]))
+
+    def timestamp_of(self, row: int) -> datetime:
+        return from_epoch_us(self.timestamps[row])
+
+    def record(self, row: int) -> Tuple[str, float, str, str, datetime]:
+        """Поля строки как значения Python: (id, amount, currency, status, timestamp)."""
+        return (
+            self.id_of(row),
+            float(self.amounts[row]),
+            self.currency_of(row),
+            self.status_of(row),
+            self.timestamp_of(row),
+        )
+
+    # --- запросы ---
+
+    @staticmethod
+    def _wanted(book: CodeBook, values: Union[None, str, Collection[str]]) -> Optional[List[int]]:
+        """Коды запрошенных значений; неизвестные значения просто ничего не находят."""
+        if values is None:
+            return None
+        values = [values] if isinstance(values, str) else values
+        return [code for code in map(book.find, values) if code is not None]
+
+    @staticmethod
+    def _postings(index: CodeIndex, codes: List[int]) -> np.ndarray:
+        if len(codes) == 1:
+            return index.rows(codes[0]).copy()
+        return np.concatenate([index.rows(code) for code in codes] or [np.empty(0, dtype=np.int32)])
+
+    @staticmethod
+    def _matches(values: np.ndarray, codes: List[int]) -> np.ndarray:
+        return values == codes[0] if len(codes) == 1 else np.isin(values, codes)
+
+    def select(self, statuses: Union[None, str, Collection[str]] = None,
+               currencies: Union[None, str, Collection[str]] = None,
+               since: Optional[datetime] = None, until: Optional[datetime] = None) -> np.ndarray:
+        """
+        Номера строк, подходящих под все условия: статус и валюта — значение или
+        набор значений, время — полуинтервал [since, until). Строки берутся из
+        самого узкого индекса, остальные условия проверяются по столбцам.
+        Порядок строк не определен.
+        """
+        status_codes = self._wanted(self.status_codes, statuses)
+        currency_codes = self._wanted(self.currency_codes, currencies)
+        low = to_epoch_us(since) if since is not None else None
+        high = to_epoch_us(until) if until is not None else None
+
+        # (оценка размера, источник) — строки материализуются только у выбранного
+        options = []
+        if status_codes is not None:
+            options.append((sum(map(self.status_index.count, status_codes)), "status"))
+        if currency_codes is not None:
+            options.append((sum(map(self.currency_index.count, currency_codes)), "currency"))
+        if low is not None or high is not None:
+            start, stop = self.time_index.bounds(self.column("timestamps"), low, high)
+            options.append((stop - start, "time"))
+        if not options:
+            return np.arange(self._size, dtype=np.int32)
+
+        _, source = min(options)
+        if source == "status":
+            rows = self._postings(self.status_index, status_codes or [])
+        elif source == "currency":
+            rows = self._postings(self.currency_index, currency_codes or [])
+        else:
+            rows = self.time_index.rows(start, stop)
+
+        if status_codes is not None and source != "status":
+            rows = rows[self._matches(self.statuses[rows], status_codes)]
+        if currency_codes is not None and source != "currency":
+            rows = rows[self._matches(self.currencies[rows], currency_codes)]
+        if source != "time":
+            if low is not None:
+                rows = rows[self.timestamps[rows] >= low]
+            if high is not None:
+                rows = rows[self.timestamps[rows] < high]
+        return rows
+
+    def sums_by_currency(self, rows: Optional[np.ndarray] = None) -> Dict[str, float]:
+        """Сумма amount по валютам для строк rows (None — вся таблица)."""
+        codes = self.column("currencies") if rows is None else self.currencies[rows]
+        amounts = self.column("amounts") if rows is None else self.amounts[rows]
+        minlength = len(self.currency_codes.values)
+        sums = np.bincount(codes, weights=amounts, minlength=minlength)
+        counts = np.bincount(codes, minlength=minlength)
+        return {self.currency_codes.value(code): float(sums[code]) for code in np.flatnonzero(counts).tolist()}
+
+    def counts_by_status(self) -> Dict[str, int]:
+        """Число транзакций в каждом статусе — прямо из индекса, без прохода по таблице."""
+        counts = {value: self.status_index.count(code) for code, value in enumerate(self.status_codes.values)}
+        return {value: count for value, count in counts.items() if count}
+
+    # --- снимок ---
+
+    def export_state(self) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        """Метаданные и массивы таблицы вместе с индексами (view на заполненную часть, без копий)."""
+        status_counts, status_arrays = self.status_index.state(self._size)
+        currency_counts, currency_arrays = self.currency_index.state(self._size)
+        meta = {
+            "size": self._size,
+            "buffer_used": self._buffer_used,
+            "deleted": self._deleted,
+            "currencies": list(self.currency_codes.values),
+            "statuses": list(self.status_codes.values),
+            "status_counts": status_counts,
+            "currency_counts": currency_counts,
+            "time_in_column_order": self.time_index.in_column_order,
+        }
+        arrays = {name: self.column(name) for name in self.COLUMNS}
+        arrays["buffer"] = self._buffer[:self._buffer_used]
+        arrays["slots"] = self._slots
+        arrays.update({f"status_index.{name}": array for name, array in status_arrays.items()})
+        arrays.update({f"currency_index.{name}": array for name, array in currency_arrays.items()})
+        return meta, arrays
+
+    @classmethod
+    def from_state(cls, meta: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> "TransactionTable":
+        """
+        Таблица из export_state. Массивы используются как есть (например,
+        отображенные в память): копируются только при первом росте таблицы.
+        """
+        table = cls(capacity=0)
+        table._size = meta["size"]
+        table._buffer_used = meta["buffer_used"]
+        table._deleted = meta["deleted"]
+        table.currency_codes = CodeBook(meta["currencies"], dtype=table.currencies.dtype)
+        table.status_codes = CodeBook(meta["statuses"], dtype=table.statuses.dtype)
+        for name in cls.COLUMNS:
+            setattr(table, name, arrays[name])
+        table._buffer = arrays["buffer"]
+        table._slots = arrays["slots"]
+
+        def index_arrays(prefix: str) -> Dict[str, np.ndarray]:
+            return {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
+
+        table.status_index = CodeIndex.restore(meta["status_counts"], index_arrays("status_index."))
+        table.currency_index = CodeIndex.restore(meta["currency_counts"], index_arrays("currency_index."))
+        table.time_index = TimeIndex.restore(meta["time_in_column_order"])
+        return table
+
+    def column(self, name: str) -> np.ndarray:
+        """Заполненная часть столбца (view, без копирования)."""
+        values: np.ndarray = getattr(self, name)
+        return values[:self._size]
+
+    def nbytes(self) -> int:
+        """Память под массивы таблицы вместе с запасом емкости."""
+        indexes = self.status_index.nbytes() + self.currency_index.nbytes() + self.time_index.nbytes()
+        columns = sum(int(getattr(self, name).nbytes) for name in self.COLUMNS)
+        return columns + self._buffer.nbytes + self._slots.nbytes + indexes
@@ -0,0 +1,47 @@
+"""
+Долгоживущий процесс pytest для TestTools.
+
+Модуль намеренно не импортирует ничего из src: дочерний процесс должен
+стартовать без конфигурации и логгера агента. Сторонние зависимости
+(pytest, библиотеки проекта) остаются импортированными между прогонами,
+а модули рабочей копии выгружаются по списку измененных файлов.
+"""
+import io
+import os
+import sys
+from contextlib import redirect_stderr, redirect_stdout
+
+
+def _purge(paths):
+    """Выгружает из sys.modules модули, загруженные из указанных файлов."""
+    targets = {os.path.realpath(p) for p in paths}
+    for name, module in list(sys.modules.items()):
+        module_file = getattr(module, "__file__", None)
+        if module_file and os.path.realpath(module_file) in targets:
+            del sys.modules[name]
+
+
+def serve(conn, root: str):
+    os.chdir(root)
+    if root not in sys.path:
+        sys.path.insert(0, root)
+
+    import pytest
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+
+        _purge(request.get("purge", []))
+        output = io.StringIO()
+        try:
+            with redirect_stdout(output), redirect_stderr(output):
+                exit_code = int(pytest.main(list(request["args"])))
+        except BaseException as e:  # pytest.main может вызвать SystemExit
+            exit_code = -1
+            output.write(f"\nWorker error: {e!r}\n")
+        conn.send({"exit_code": exit_code, "output": output.getvalue()})
@@ -0,0 +1,83 @@
+import base64
+import json
+import re
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from src.diff_chunks import DiffPiece
+
+# Состояние ревью хранится в скрытом HTML-комментарии внутри комментария бота:
+# CI-раннеры эфемерны, а комментарий PR переживает любые перезапуски
+STATE_MARKER = "ai-review-state"
+STATE_PATTERN = re.compile(rf"<!-- {STATE_MARKER}:([A-Za-z0-9+/=]+) -->")
+# Лимит GitHub на тело комментария — 65536 символов; состояние больше не встраиваем
+MAX_STATE_CHARS = 50000
+
+
+@dataclass
+class ReviewState:
+    """
+    Результат прошлого ревью PR: head SHA, резюме и замечания по каждому хунку.
+    Ключ хунка — DiffPiece.key, номер строки замечания хранится как смещение
+    от начала хунка, чтобы замечание переживало сдвиг хунка по файлу.
+    """
+    head_sha: str = ""
+    summary: str = ""
+    findings: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)
+
+    def to_marker(self) -> str:
+        payload = json.dumps(
+            {"head": self.head_sha, "summary": self.summary, "findings": self.findings},
+            ensure_ascii=False, separators=(",", ":")
+        )
+        encoded = base64.b64encode(zlib.compress(payload.encode("utf-8"), 9)).decode("ascii")
+        if len(encoded) > MAX_STATE_CHARS:
+            return ""
+        return f"<!-- {STATE_MARKER}:{encoded} -->"
+
+    @classmethod
+    def from_comments(cls, bodies: Iterable[str]) -> Optional["ReviewState"]:
+        """Состояние из последнего комментария, в котором оно есть."""
+        last = None
+        for body in bodies:
+            match = STATE_PATTERN.search(body or "")
+            if match:
+                last = match.group(1)
+        if last is None:
+            return None
+        try:
+            data = json.loads(zlib.decompress(base64.b64decode(last)).decode("utf-8"))
+        except (ValueError, zlib.error):
+            return None
+        return cls(head_sha=data.get("head", ""), summary=data.get("summary", ""), findings=data.get("findings", {}))
+
+
+def attribute_details(pieces: List[DiffPiece], details: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Раскладывает замечания LLM по хункам: по строке, а без строки — на первый
+    хунк файла. Возвращает запись для каждого хунка, включая хунки без замечаний.
+    """
+    findings: Dict[str, List[Dict[str, Any]]] = {piece.key: [] for piece in pieces}
+    for item in details:
+        path = item.get("file_path")
+        line = item.get("line_number")
+        same_file = [piece for piece in pieces if piece.filename == path]
+        if not same_file:
+            continue
+        target = next((p for p in same_file if isinstance(line, int) and p.covers(line)), same_file[0])
+        offset = None
+        if isinstance(line, int) and target.start_line is not None and target.covers(line):
+            offset = line - target.start_line
+        findings[target.key].append({"offset": offset, "comment": item.get("comment")})
+    return findings
+
+
+def restore_details(piece: DiffPiece, stored: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Замечания из кэша с номерами строк, пересчитанными под текущее положение хунка."""
+    details = []
+    for item in stored:
+        offset = item.get("offset")
+        line = piece.start_line + offset if offset is not None and piece.start_line is not None else None
+        details.append({"file_path": piece.filename, "line_number": line, "comment": item.get("comment")})
+    return details
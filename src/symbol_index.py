@@ -0,0 +1,235 @@
+import ast
+import fnmatch
+import os
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
+
+from src.file_index import repo_walker
+
+MAX_RESULTS = 50
+
+
+@dataclass(frozen=True)
+class Symbol:
+    name: str        # короткое имя: foo, Bar, method
+    qualname: str    # полное имя внутри модуля: Bar.method
+    kind: str        # def | class | import | call
+    path: str
+    line: int
+
+    def render(self) -> str:
+        return f"{self.path}:{self.line} {self.kind} {self.qualname}"
+
+
+@dataclass
+class _FileRecord:
+    mtime_ns: int
+    symbols: List[Symbol] = field(default_factory=list)
+    lines: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+class _Collector(ast.NodeVisitor):
+    """Собирает определения, импорты и места вызовов одного модуля."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.scope: List[str] = []
+        self.symbols: List[Symbol] = []
+
+    def _add(self, name: str, qualname: str, kind: str, node: Union[ast.stmt, ast.expr]):
+        self.symbols.append(Symbol(name, qualname, kind, self.path, node.lineno))
+
+    def _visit_scope(self, node, kind: str):
+        qualname = ".".join(self.scope + [node.name])
+        self._add(node.name, qualname, kind, node)
+        self.scope.append(node.name)
+        self.generic_visit(node)
+        self.scope.pop()
+
+    def visit_FunctionDef(self, node):
+        self._visit_scope(node, "def")
+
+    def visit_AsyncFunctionDef(self, node):
+        self._visit_scope(node, "def")
+
+    def visit_ClassDef(self, node):
+        self._visit_scope(node, "class")
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self._add(alias.name.rsplit(".", 1)[-1], alias.name, "import", node)
+            if alias.asname:
+                self._add(alias.asname, f"{alias.name} as {alias.asname}", "import", node)
+
+    def visit_ImportFrom(self, node):
+        module = "." * node.level + (node.module or "")
+        for alias in node.names:
+            self._add(alias.name, f"{module}.{alias.name}", "import", node)
+            if alias.asname:
+                self._add(alias.asname, f"{module}.{alias.name} as {alias.asname}", "import", node)
+
+    def visit_Call(self, node):
+        func = node.func
+        if isinstance(func, ast.Name):
+            self._add(func.id, func.id, "call", node)
+        elif isinstance(func, ast.Attribute):
+            self._add(func.attr, ast.unparse(func), "call", node)
+        self.generic_visit(node)
+
+
+class SymbolIndex:
+    """
+    Индекс символов Python-файлов рабочей копии на основе ast.
+
+    Хранит определения, импорты и места вызовов с обратным индексом по имени.
+    Файлы перечитываются только при изменении mtime; write_file агента
+    обновляет запись файла сразу через update_file.
+    """
+
+    def __init__(self, root: str = "."):
+        self.root = root
+        self._files: Dict[str, _FileRecord] = {}
+        self._by_name: Dict[str, List[Symbol]] = defaultdict(list)
+        self._lock = threading.RLock()
+
+    def _parse(self, rel_path: str, mtime_ns: int) -> _FileRecord:
+        full_path = os.path.join(self.root, rel_path)
+        try:
+            with open(full_path, encoding="utf-8", errors="replace") as f:
+                source = f.read()
+        except OSError as e:
+            return _FileRecord(mtime_ns=mtime_ns, error=str(e))
+
+        record = _FileRecord(mtime_ns=mtime_ns, lines=source.splitlines())
+        try:
+            tree = ast.parse(source, filename=rel_path)
+        except (SyntaxError, ValueError) as e:
+            record.error = f"SyntaxError: {e}"
+            return record
+
+        collector = _Collector(rel_path)
+        collector.visit(tree)
+        record.symbols = collector.symbols
+        return record
+
+    def _replace(self, rel_path: str, record: Optional[_FileRecord]):
+        old = self._files.pop(rel_path, None)
+        if old is not None:
+            for symbol in old.symbols:
+                bucket = self._by_name.get(symbol.name)
+                if bucket:
+                    bucket[:] = [s for s in bucket if s.path != rel_path]
+        if record is not None:
+            self._files[rel_path] = record
+            for symbol in record.symbols:
+                self._by_name[symbol.name].append(symbol)
+
+    def _normalize(self, path: str) -> str:
+        # Относительный путь считается от root, а не от текущей директории процесса
+        full_path = os.path.abspath(os.path.join(self.root, path))
+        return os.path.relpath(full_path, os.path.abspath(self.root)).replace(os.sep, "/")
+
+    def update_file(self, path: str):
+        """Переиндексирует один файл (после записи агентом)."""
+        if not path.endswith(".py"):
+            return
+        rel_path = self._normalize(path)
+        if rel_path.startswith("../"):
+            return
+        with self._lock:
+            try:
+                mtime_ns = os.stat(os.path.join(self.root, rel_path)).st_mtime_ns
+            except OSError:
+                self._replace(rel_path, None)
+                return
+            self._replace(rel_path, self._parse(rel_path, mtime_ns))
+
+    def refresh(self):
+        """Синхронизирует индекс с диском: новые и измененные файлы парсятся, удаленные убираются."""
+        with self._lock:
+            seen = set()
+            for rel_path in repo_walker.list_files(self.root, pattern="*.py"):
+                seen.add(rel_path)
+                try:
+                    mtime_ns = os.stat(os.path.join(self.root, rel_path)).st_mtime_ns
+                except OSError:
+                    continue
+                record = self._files.get(rel_path)
+                if record is None or record.mtime_ns != mtime_ns:
+                    self._replace(rel_path, self._parse(rel_path, mtime_ns))
+            for rel_path in list(self._files):
+                if rel_path not in seen:
+                    self._replace(rel_path, None)
+
+    def lookup(self, name: str) -> Tuple[List[Symbol], List[Symbol]]:
+        """Возвращает (определения, использования) символа; поддерживает Class.method."""
+        self.refresh()
+        short = name.rsplit(".", 1)[-1]
+        with self._lock:
+            candidates = list(self._by_name.get(short, []))
+
+        def matches(symbol: Symbol) -> bool:
+            if "." not in name:
+                return True
+            return symbol.qualname == name or symbol.qualname.endswith("." + name)
+
+        definitions = [s for s in candidates if s.kind in {"def", "class"} and matches(s)]
+        usages = [s for s in candidates if s.kind in {"import", "call"}]
+        definitions.sort(key=lambda s: (s.path, s.line))
+        usages.sort(key=lambda s: (s.path, s.line))
+        return definitions, usages
+
+    def search(self, pattern: str, path_glob: Optional[str] = None) -> List[Tuple[str, int, str]]:
+        """Поиск регулярного выражения по строкам проиндексированных файлов."""
+        self.refresh()
+        regex = re.compile(pattern)
+        hits: List[Tuple[str, int, str]] = []
+        with self._lock:
+            files = sorted(self._files.items())
+        for rel_path, record in files:
+            if path_glob and not fnmatch.fnmatch(rel_path, path_glob):
+                continue
+            for lineno, line in enumerate(record.lines, start=1):
+                if regex.search(line):
+                    hits.append((rel_path, lineno, line.strip()))
+                    if len(hits) >= MAX_RESULTS:
+                        return hits
+        return hits
+
+
+class CodeSearchTools:
+    """Инструменты агента поверх SymbolIndex."""
+
+    def __init__(self, root: str = "."):
+        self.index = SymbolIndex(root)
+
+    def find_symbol(self, name: str) -> str:
+        """Где определен и где используется символ (функция, класс, метод)."""
+        definitions, usages = self.index.lookup(name)
+        if not definitions and not usages:
+            return f"Символ '{name}' не найден в Python-файлах проекта."
+
+        out = [f"Определения ({len(definitions)}):"]
+        out += [f"  {s.render()}" for s in definitions[:MAX_RESULTS]] or ["  —"]
+        out.append(f"Использования ({len(usages)}):")
+        out += [f"  {s.render()}" for s in usages[:MAX_RESULTS]] or ["  —"]
+        if len(usages) > MAX_RESULTS:
+            out.append(f"  ... и еще {len(usages) - MAX_RESULTS}")
+        return "\n".join(out)
+
+    def search_code(self, pattern: str, path_glob: Optional[str] = None) -> str:
+        """Поиск по регулярному выражению в Python-файлах проекта."""
+        try:
+            hits = self.index.search(pattern, path_glob)
+        except re.error as e:
+            return f"Ошибка: некорректное регулярное выражение: {e}"
+        if not hits:
+            return f"Совпадений для '{pattern}' не найдено."
+        lines = [f"{path}:{lineno}: {text}" for path, lineno, text in hits]
+        if len(hits) >= MAX_RESULTS:
+            lines.append(f"... (показаны первые {MAX_RESULTS}, уточните запрос)")
+        return "\n".join(lines)
@@ -0,0 +1,250 @@
+import ast
+import fnmatch
+import multiprocessing
+import os
+import threading
+from collections import defaultdict
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+from src.file_index import repo_walker
+from src.logger import log
+from src.pytest_worker import serve
+
+TEST_FILE_PATTERNS = ("test_*.py", "*_test.py")
+SOURCE_ROOTS = ("", "src")
+TESTS_TIMEOUT = 120
+TESTS_OUTPUT_CHARS = 8000
+# Код выхода pytest «тесты не найдены»: в репозитории без тестов это не провал
+PYTEST_NO_TESTS_COLLECTED = 5
+
+
+def is_test_file(rel_path: str) -> bool:
+    name = rel_path.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatch(name, pattern) for pattern in TEST_FILE_PATTERNS)
+
+
+class ImportGraph:
+    """
+    Граф импортов между Python-файлами рабочей копии.
+    Нужен, чтобы по списку измененных файлов найти тесты, которые от них зависят.
+    """
+
+    def __init__(self, root: str = "."):
+        self.root = root
+        self._mtimes: Dict[str, int] = {}
+        self._imports: Dict[str, Set[str]] = {}
+        self._modules: Dict[str, str] = {}
+
+    @staticmethod
+    def _module_names(rel_path: str) -> List[str]:
+        """Имена модуля файла с учетом корней исходников (корень и src/, как в pytest.ini)."""
+        names = []
+        stem = rel_path[:-3]
+        if stem.endswith("/__init__"):
+            stem = stem[: -len("/__init__")]
+        for source_root in SOURCE_ROOTS:
+            prefix = f"{source_root}/" if source_root else ""
+            if stem.startswith(prefix):
+                names.append(stem[len(prefix):].replace("/", "."))
+        return names
+
+    def _parse_imports(self, rel_path: str) -> Set[str]:
+        try:
+            with open(os.path.join(self.root, rel_path), encoding="utf-8", errors="replace") as f:
+                tree = ast.parse(f.read(), filename=rel_path)
+        except (OSError, SyntaxError, ValueError):
+            return set()
+
+        package = rel_path[:-3].replace("/", ".").rsplit(".", 1)[0] if "/" in rel_path else ""
+        found: Set[str] = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                found.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                if node.level:
+                    base_parts = package.split(".") if package else []
+                    base_parts = base_parts[: len(base_parts) - (node.level - 1)] if node.level > 1 else base_parts
+                    base = ".".join(base_parts + ([node.module] if node.module else []))
+                else:
+                    base = node.module or ""
+                if base:
+                    found.add(base)
+                found.update(f"{base}.{alias.name}" if base else alias.name for alias in node.names)
+        return found
+
+    def refresh(self):
+        seen = set()
+        for rel_path in repo_walker.list_files(self.root, pattern="*.py"):
+            seen.add(rel_path)
+            try:
+                mtime = os.stat(os.path.join(self.root, rel_path)).st_mtime_ns
+            except OSError:
+                continue
+            if self._mtimes.get(rel_path) != mtime:
+                self._mtimes[rel_path] = mtime
+                self._imports[rel_path] = self._parse_imports(rel_path)
+        for rel_path in list(self._mtimes):
+            if rel_path not in seen:
+                self._mtimes.pop(rel_path)
+                self._imports.pop(rel_path, None)
+
+        self._modules = {}
+        for rel_path in self._mtimes:
+            for name in self._module_names(rel_path):
+                self._modules[name] = rel_path
+
+    def _resolve(self, imported: str) -> Optional[str]:
+        parts = imported.split(".")
+        while parts:
+            target = self._modules.get(".".join(parts))
+            if target is not None:
+                return target
+            parts.pop()
+        return None
+
+    def dependents(self, changed: Iterable[str]) -> Set[str]:
+        """Транзитивное замыкание файлов, импортирующих измененные (включая их самих)."""
+        reverse: Dict[str, Set[str]] = defaultdict(set)
+        for rel_path, imports in self._imports.items():
+            for imported in imports:
+                target = self._resolve(imported)
+                if target is not None and target != rel_path:
+                    reverse[target].add(rel_path)
+
+        result = set(changed)
+        queue = list(result)
+        while queue:
+            current = queue.pop()
+            for dependent in reverse.get(current, ()):
+                if dependent not in result:
+                    result.add(dependent)
+                    queue.append(dependent)
+        return result
+
+    def affected_tests(self, changed: Iterable[str]) -> List[str]:
+        return sorted(p for p in self.dependents(changed) if is_test_file(p))
+
+    @property
+    def files(self) -> Dict[str, int]:
+        return dict(self._mtimes)
+
+
+class PytestWorker:
+    """Клиент долгоживущего процесса pytest (см. src.pytest_worker)."""
+
+    def __init__(self, root: str = "."):
+        self.root = os.path.abspath(root)
+        self._process: Optional[BaseProcess] = None
+        self._conn: Optional[Connection] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> Connection:
+        if self._process is not None and self._process.is_alive() and self._conn is not None:
+            return self._conn
+        ctx = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = ctx.Pipe()
+        process = ctx.Process(target=serve, args=(child_conn, self.root), daemon=True, name="pytest-worker")
+        process.start()
+        self._process = process
+        child_conn.close()
+        self._conn = parent_conn
+        return parent_conn
+
+    def run(self, args: List[str], purge: List[str], timeout: float) -> Tuple[int, str]:
+        with self._lock:
+            conn = self._ensure_started()
+            conn.send({"args": args, "purge": [os.path.join(self.root, p) for p in purge]})
+            if not conn.poll(timeout):
+                self.close()
+                return -1, f"Превышено время ожидания тестов ({timeout} с), воркер перезапущен."
+            try:
+                reply = conn.recv()
+            except EOFError:
+                self.close()
+                return -1, "Воркер pytest неожиданно завершился."
+        return reply["exit_code"], reply["output"]
+
+    def close(self):
+        if self._process is None:
+            return
+        try:
+            if self._conn is not None:
+                self._conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self._process.join(timeout=2)
+        if self._process.is_alive():
+            self._process.kill()
+        self._process = None
+        self._conn = None
+
+
+class TestTools:
+    """
+    Инструмент запуска тестов для агента.
+
+    Держит теплый процесс pytest и выбирает только тесты, зависящие от файлов,
+    записанных через write_file. Полный прогон — по запросу или если изменений нет.
+    """
+
+    __test__ = False  # не путать pytest: это не тестовый класс
+
+    def __init__(self, root: str = "."):
+        self.root = root
+        self.graph = ImportGraph(root)
+        self.worker = PytestWorker(root)
+        self.changed_files: Set[str] = set()
+        self._last_mtimes: Dict[str, int] = {}
+
+    def mark_changed(self, path: str):
+        rel_path = os.path.relpath(os.path.abspath(path), os.path.abspath(self.root)).replace(os.sep, "/")
+        self.changed_files.add(rel_path)
+
+    def _stale_files(self) -> List[str]:
+        """Файлы, измененные с прошлого прогона, их зависимые и все тесты — их воркер перезагрузит."""
+        current = self.graph.files
+        modified = {p for p, mtime in current.items() if self._last_mtimes.get(p) != mtime}
+        stale = self.graph.dependents(modified) | {p for p in current if is_test_file(p)}
+        self._last_mtimes = current
+        return sorted(stale)
+
+    def run(self, paths: Union[str, Sequence[str], None] = None, full: bool = False) -> Tuple[bool, str]:
+        """
+        Запускает тесты: явно указанные, затронутые изменениями или весь набор. Возвращает (успех, отчет).
+        paths — путь или список путей (LLM иногда передает одну строку вместо списка).
+        """
+        self.graph.refresh()
+
+        if paths:
+            targets = [paths] if isinstance(paths, str) else list(paths)
+            scope = "указанные тесты"
+        elif full or not self.changed_files:
+            targets = []
+            scope = "полный набор"
+        else:
+            targets = self.graph.affected_tests(self.changed_files)
+            scope = f"затронутые изменениями ({len(targets)} файлов)"
+            if not targets:
+                scope = "полный набор (затронутых тестов не найдено)"
+
+        log.info(f"Tool: run_tests — {scope}")
+        exit_code, output = self.worker.run(["-q", "-p", "no:cacheprovider"] + targets, self._stale_files(), TESTS_TIMEOUT)
+
+        if len(output) > TESTS_OUTPUT_CHARS:
+            output = f"... (начало обрезано) ...\n{output[-TESTS_OUTPUT_CHARS:]}"
+        if exit_code == 0:
+            status = "ПРОЙДЕНЫ"
+        elif exit_code == PYTEST_NO_TESTS_COLLECTED:
+            status = "ТЕСТОВ НЕТ (код 5), считаются пройденными"
+        else:
+            status = f"УПАЛИ (код {exit_code})"
+        passed = exit_code in (0, PYTEST_NO_TESTS_COLLECTED)
+        return passed, f"Тесты [{scope}]: {status}\n{output.strip()}"
+
+    def run_tests(self, paths: Union[str, Sequence[str], None] = None, full: bool = False) -> str:
+        return self.run(paths=paths, full=full)[1]
+
+    def close(self):
+        self.worker.close()
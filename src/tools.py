@@ -1,63 +1,249 @@
 import json
+import os
+import signal
 import subprocess
+import threading
+from collections import deque
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Deque, List, Optional
+from src.file_index import get_line_index, repo_walker
 from src.logger import log
 
 # Разрешенные команды - белый список
 ALLOWED_COMMANDS = {'pytest', 'ls', 'dir', 'python', 'ruff', 'echo', 'git'}
 
 MAX_CHARS = 8000  # ~1000 токенов на вывод
+HEAD_CHARS = 2000  # из них начало вывода (заголовок pytest, первые ошибки)
+COMMAND_TIMEOUT = 45
+PIPE_READ_LIMIT = 64 * 1024
+
+# Файлы крупнее READ_FULL_MAX_BYTES read_file отдает постранично
+READ_FULL_MAX_BYTES = 64_000
+READ_PAGE_LINES = 200
+READ_PAGE_BYTES = 16_000
 
 class FileSystemTools:
-    @staticmethod
-    def list_files(directory: str = ".") -> str:
-        """Возвращает список файлов (только на 2 уровня вглубь)."""
+    """Файловые инструменты агента; относительные пути считаются от root (рабочей копии)."""
+
+    def __init__(self, root: str = "."):
+        self.root = Path(root)
+
+    def resolve(self, path: str) -> Path:
+        """Путь внутри root; ValueError, если путь (абсолютный, через .. или symlink) ведет за его пределы."""
+        root = self.root.resolve()
+        target = (root / path).resolve()
+        if target != root and root not in target.parents:
+            raise ValueError(f"Путь '{path}' вне рабочей копии")
+        return target
+
+    def list_files(self, directory: str = ".", max_depth: Optional[int] = None, pattern: Optional[str] = None) -> str:
+        """
+        Возвращает список файлов без скрытых, служебных и игнорируемых .gitignore путей.
+        max_depth ограничивает глубину (1 — только сама директория), pattern — glob-фильтр.
+        """
         log.info(f"Tool: list_files('{directory}')")
         target_dir = Path(directory)
-        
-        if not target_dir.exists():
+        try:
+            resolved = self.resolve(directory)
+        except ValueError as e:
+            return f"Ошибка: {e}."
+
+        if not resolved.exists():
             return f"Ошибка: Директория '{directory}' не существует."
 
         files = []
-        # Ограничиваем обход, чтобы не сканировать venv / системные папки слишком глубоко
-        for path in target_dir.rglob("*"):
-            # Игнорируем всё, что связано с окружением и гитом 
-            # ! Добавить принеобходимости еще ограничения
-            if any(part.startswith(".") or part in {"__pycache__", "venv", "env", "node_modules", "dist"} for part in path.parts):
-                continue
-            
-            if path.is_file():
-                # Не выводим больше 50 файлов, чтобы не перегружать контекст
-                if len(files) > 50:
-                    files.append("... (список слишком длинный, уточните директорию)")
-                    break
-                files.append(str(path))
+        for rel_path in repo_walker.list_files(str(resolved), max_depth=max_depth, pattern=pattern):
+            # Не выводим больше 50 файлов, чтобы не перегружать контекст
+            if len(files) > 50:
+                files.append("... (список слишком длинный, уточните директорию)")
+                break
+            files.append(str(target_dir / rel_path))
         
         return json.dumps(files, ensure_ascii=False)
 
-    @staticmethod
-    def read_file(path: str) -> str:
-        file_path = Path(path)
+    def read_file(
+        self,
+        path: str,
+        start_line: Optional[int] = None,
+        end_line: Optional[int] = None,
+        offset: Optional[int] = None,
+        length: Optional[int] = None
+    ) -> str:
+        """
+        Читает файл целиком, если он небольшой, иначе — постранично.
+        start_line/end_line — диапазон строк (с 1, включительно),
+        offset/length — байтовое окно. Большие файлы читаются через mmap
+        по индексу строк, без загрузки файла в память.
+        """
+        try:
+            file_path = self.resolve(path)
+        except ValueError as e:
+            return f"Ошибка: {e}."
         if not file_path.exists():
             return f"Ошибка: Файл '{path}' не найден."
         try:
-            return file_path.read_text(encoding='utf-8')
+            ranged = start_line is not None or end_line is not None or offset is not None
+            if not ranged and file_path.stat().st_size <= READ_FULL_MAX_BYTES:
+                return file_path.read_text(encoding='utf-8')
+
+            index = get_line_index(str(file_path))
+            header = f"Файл '{path}': {index.size} байт, {index.line_count} строк."
+
+            if offset is not None:
+                window = length if length is not None else READ_PAGE_BYTES
+                data = index.read_bytes(int(offset), min(int(window), READ_PAGE_BYTES))
+                shown_end = int(offset) + len(data)
+                return f"{header} Показаны байты {offset}-{shown_end}.\n{data.decode('utf-8', errors='replace')}"
+
+            first = max(int(start_line or 1), 1)
+            if first > index.line_count:
+                return f"{header} Строка {first} за пределами файла."
+            last = int(end_line) if end_line is not None else first + READ_PAGE_LINES - 1
+            last = min(last, index.line_count, first + READ_PAGE_LINES - 1)
+            data = index.read_lines(first - 1, last)
+            if len(data) > READ_PAGE_BYTES:
+                data = data[:READ_PAGE_BYTES]
+                data_note = " (окно обрезано по размеру, сузьте диапазон)"
+            else:
+                data_note = ""
+
+            footer = ""
+            if last < index.line_count:
+                footer = f"\n... (дальше: start_line={last + 1})"
+            return f"{header} Показаны строки {first}-{last}{data_note}.\n{data.decode('utf-8', errors='replace')}{footer}"
         except Exception as e:
             return f"Ошибка чтения файла: {e}"
 
-    @staticmethod
-    def write_file(path: str, content: str) -> str:
-        file_path = Path(path)
+    def write_file(self, path: str, content: str) -> str:
         try:
+            file_path = self.resolve(path)
             file_path.parent.mkdir(parents=True, exist_ok=True)
             file_path.write_text(content, encoding='utf-8')
             return f"Файл '{path}' успешно сохранен."
         except Exception as e:
             return f"Ошибка записи файла: {e}"
 
+class HeadTailBuffer:
+    """
+    Буфер вывода с постоянным объемом памяти: первые head_chars символов
+    сохраняются целиком, из остального — только последние tail_chars.
+    """
+
+    def __init__(self, head_chars: int, tail_chars: int):
+        self.head_chars = head_chars
+        self.tail_chars = tail_chars
+        self._head: List[str] = []
+        self._head_len = 0
+        self._tail: Deque[str] = deque()
+        self._tail_len = 0
+        self.dropped = 0
+
+    def append(self, text: str):
+        if self._head_len < self.head_chars:
+            room = self.head_chars - self._head_len
+            self._head.append(text[:room])
+            self._head_len += min(len(text), room)
+            text = text[room:]
+            if not text:
+                return
+
+        if len(text) > self.tail_chars:
+            self.dropped += len(text) - self.tail_chars
+            text = text[-self.tail_chars:]
+        self._tail.append(text)
+        self._tail_len += len(text)
+        while self._tail_len > self.tail_chars:
+            overflow = self._tail_len - self.tail_chars
+            first = self._tail[0]
+            if len(first) <= overflow:
+                self._tail.popleft()
+                self._tail_len -= len(first)
+                self.dropped += len(first)
+            else:
+                self._tail[0] = first[overflow:]
+                self._tail_len -= overflow
+                self.dropped += overflow
+
+    def render(self) -> str:
+        head = "".join(self._head)
+        tail = "".join(self._tail)
+        if self.dropped:
+            return f"{head}\n... (пропущено {self.dropped} символов) ...\n{tail}"
+        return head + tail
+
+
+@dataclass
+class StreamCapture:
+    stdout: HeadTailBuffer
+    stderr: HeadTailBuffer
+    returncode: Optional[int] = None
+    timed_out: bool = False
+
+
+def _pump(pipe, buffer: HeadTailBuffer, label: str):
+    """Читает pipe построчно (строки ограничены по длине) и сразу пишет их в лог."""
+    from rich.markup import escape
+
+    with pipe:
+        for raw in iter(lambda: pipe.readline(PIPE_READ_LIMIT), b""):
+            line = raw.decode("utf-8", errors="replace")
+            buffer.append(line)
+            log.info(f"[dim]{label}│ {escape(line.rstrip())}[/dim]")
+
+
+def _kill_process_tree(process: subprocess.Popen):
+    """Останавливает всю группу процессов (shell=True порождает дочерние процессы)."""
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run_streaming(command: str, timeout: float, cwd: Optional[str] = None) -> StreamCapture:
+    """Запускает команду, читая stdout/stderr по мере поступления в ограниченные буферы."""
+    capture = StreamCapture(
+        stdout=HeadTailBuffer(HEAD_CHARS, MAX_CHARS - HEAD_CHARS),
+        stderr=HeadTailBuffer(HEAD_CHARS, MAX_CHARS - HEAD_CHARS)
+    )
+    process = subprocess.Popen(
+        command,
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        stdin=subprocess.DEVNULL,
+        cwd=cwd,
+        start_new_session=(os.name == "posix")
+    )
+    readers = [
+        threading.Thread(target=_pump, args=(process.stdout, capture.stdout, "out"), daemon=True),
+        threading.Thread(target=_pump, args=(process.stderr, capture.stderr, "err"), daemon=True)
+    ]
+    for reader in readers:
+        reader.start()
+
+    try:
+        capture.returncode = process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        capture.timed_out = True
+        _kill_process_tree(process)
+        capture.returncode = process.wait()
+
+    for reader in readers:
+        reader.join(timeout=5)
+    return capture
+
+
 class ShellTools:
-    @staticmethod
-    def run_command(command: str) -> str:
+    """Запуск команд из белого списка в директории root (рабочей копии)."""
+
+    def __init__(self, root: str = "."):
+        self.root = root
+
+    def run_command(self, command: str) -> str:
         """Выполняет shell-команду с защитой от инъекций."""
         log.info(f"Выполнение команды: {command}")
         
@@ -72,36 +258,23 @@ class ShellTools:
              return f"Ошибка: Утилита '{cmd_base}' не входит в белый список разрешенных."
         
         try:
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=45,
-                encoding='utf-8',
-                errors='replace'
-            )
-            
-            stdout = result.stdout.strip()
-            stderr = result.stderr.strip()
-            
-            if len(stdout) > MAX_CHARS:
-                stdout = f"... (начало обрезано) ...\n{stdout[-MAX_CHARS:]}"
-            
-            if len(stderr) > MAX_CHARS:
-                stderr = f"... (начало обрезано) ...\n{stderr[-MAX_CHARS:]}"
-            
-            output = ""
-            if stdout:
-                output += f"STDOUT:\n{stdout}\n"
-            if stderr:
-                output += f"STDERR:\n{stderr}\n"
-            if not output:
-                output = f"Команда выполнена (Код возврата: {result.returncode}), вывод пуст."
-                
-            return output
-
-        except subprocess.TimeoutExpired:
-            return "Ошибка: Превышено время ожидания выполнения команды."
+            capture = run_streaming(command, timeout=COMMAND_TIMEOUT, cwd=self.root)
         except Exception as e:
             return f"Ошибка выполнения: {e}"
+
+        stdout = capture.stdout.render().strip()
+        stderr = capture.stderr.render().strip()
+
+        output = ""
+        if stdout:
+            output += f"STDOUT:\n{stdout}\n"
+        if stderr:
+            output += f"STDERR:\n{stderr}\n"
+
+        if capture.timed_out:
+            note = f"Ошибка: Превышено время ожидания выполнения команды ({COMMAND_TIMEOUT} с), процесс остановлен."
+            return f"{note}\nЧастичный вывод:\n{output}" if output else note
+        if not output:
+            output = f"Команда выполнена (Код возврата: {capture.returncode}), вывод пуст."
+
+        return output
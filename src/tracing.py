@@ -0,0 +1,216 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple, Union
+
+from src.config import settings
+from src.logger import log
+
+# Границы корзин гистограмм длительностей (секунды)
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> LabelSet:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Metrics:
+    """
+    Счетчики и гистограммы в памяти процесса с выводом в формате Prometheus.
+    Снимок (snapshot/drain) сериализуется в JSON, поэтому метрики процессов
+    пула задач можно вернуть вместе с результатом задачи и слить (merge) в сервер.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelSet], float] = {}
+        self._histograms: Dict[Tuple[str, LabelSet], List[float]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: Any):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: Any):
+        key = (name, _labels(labels))
+        with self._lock:
+            # [счетчики по корзинам..., сумма, количество]
+            hist = self._histograms.setdefault(key, [0] * (len(self.buckets) + 2))
+            for n, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[n] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    def _dump(self) -> Dict[str, Any]:
+        return {
+            "counters": [[name, list(map(list, labels)), value] for (name, labels), value in self._counters.items()],
+            "histograms": [[name, list(map(list, labels)), list(hist)] for (name, labels), hist in self._histograms.items()],
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return self._dump()
+
+    def drain(self) -> Dict[str, Any]:
+        """Снимок с обнулением — для передачи приращений из процесса-исполнителя."""
+        with self._lock:
+            data = self._dump()
+            self._counters.clear()
+            self._histograms.clear()
+        return data
+
+    def merge(self, data: Dict[str, Any]):
+        with self._lock:
+            for name, labels, value in data.get("counters", []):
+                key = (name, tuple(tuple(pair) for pair in labels))
+                self._counters[key] = self._counters.get(key, 0) + value
+            for name, labels, hist in data.get("histograms", []):
+                key = (name, tuple(tuple(pair) for pair in labels))
+                current = self._histograms.setdefault(key, [0] * (len(self.buckets) + 2))
+                for n, value in enumerate(hist):
+                    current[n] += value
+
+    def render(self) -> str:
+        """Текстовый формат экспозиции Prometheus."""
+        def fmt(labels: LabelSet, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = labels + extra
+            if not pairs:
+                return ""
+            escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped, strict=True)) + "}"
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+
+        lines: List[str] = []
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{fmt(labels)} {value:g}")
+        for (name, labels), hist in histograms:
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            # hist: счетчики по границам buckets, затем сумма и общее число
+            for bound, count in zip(self.buckets, hist[:-2], strict=True):
+                lines.append(f"{name}_bucket{fmt(labels, (('le', f'{bound:g}'),))} {count:g}")
+            lines.append(f"{name}_bucket{fmt(labels, (('le', '+Inf'),))} {hist[-1]:g}")
+            lines.append(f"{name}_sum{fmt(labels)} {hist[-2]:g}")
+            lines.append(f"{name}_count{fmt(labels)} {hist[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    attrs: Dict[str, Any] = field(default_factory=dict)
+    status: str = "ok"
+    duration: float = 0.0
+
+    def set(self, **attrs: Any):
+        self.attrs.update(attrs)
+
+    def fail(self, error: Any):
+        self.status = "error"
+        self.attrs["error"] = str(error)[:500]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": round(self.duration, 6),
+            "status": self.status,
+            "attrs": self.attrs,
+        }
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """
+    Вложенные спаны (запуск агента -> итерация -> вызов LLM / инструмента).
+    Каждый завершенный спан пишется строкой JSON в trace-файл (если задан путь)
+    и обновляет метрики agent_spans_total и agent_span_duration_seconds.
+    """
+
+    def __init__(self, path: Union[str, Callable[[], str], None], metrics: Metrics):
+        # path может быть функцией: глобальный трейсер читает TRACE_PATH при первой записи
+        self.path = path
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._file: Optional[TextIO] = None
+
+    def _write(self, record: Dict[str, Any]):
+        if callable(self.path):
+            self.path = self.path()
+        if not self.path:
+            return
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            try:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                    self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+                self._file.write(line)
+            except OSError as e:
+                log.warning(f"Не удалось записать трассировку, запись отключена: {e}")
+                self.path = None
+
+    @contextmanager
+    def span(self, name: str, root: bool = False, **attrs: Any) -> Iterator[Span]:
+        parent = None if root else _current_span.get()
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent.span_id if parent else None,
+            start=time.time(),
+            attrs=attrs,
+        )
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.fail(repr(e))
+            raise
+        finally:
+            span.duration = time.perf_counter() - started
+            _current_span.reset(token)
+            self.metrics.inc("agent_spans_total", span=name, status=span.status)
+            self.metrics.observe("agent_span_duration_seconds", span.duration, span=name)
+            self._write(span.to_dict())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+metrics = Metrics()
+tracer = Tracer(lambda: settings.TRACE_PATH, metrics)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
@@ -1,20 +1,55 @@
-from fastapi import FastAPI, BackgroundTasks, Request
-from src.agents.code_agent import DeveloperAgent
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from src.config import settings
+from src.job_queue import JobQueue, QueueClosedError, QueueFullError
 from src.logger import log
+from src.tracing import metrics
+
+# Размеры пула и очереди читаются из настроек при первой задаче, а не при импорте
+job_queue = JobQueue()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.WORKTREE_POOL_DIR:
+        from src.workspace_pool import WorktreePool
+
+        try:
+            WorktreePool(".", settings.WORKTREE_POOL_DIR, settings.WORKTREE_POOL_SIZE, settings.WORKTREE_BASE_REF).warm()
+        except Exception as e:
+            log.warning(f"Не удалось подготовить пул рабочих копий: {e}")
+    yield
+    job_queue.shutdown(wait=False)
 
-app = FastAPI()
 
-def run_agent_process(issue_number: int):
-    """Фоновая задача для запуска агента."""
+app = FastAPI(lifespan=lifespan)
+
+def enqueue_issue(issue_number: int):
+    """Ставит Issue в очередь агента с учетом лимитов и дедупликации."""
     try:
-        log.info(f"[Webhook] Запуск обработки Issue #{issue_number}")
-        agent = DeveloperAgent()
-        agent.run(issue_number)
-    except Exception as e:
-        log.error(f"Ошибка в фоновом процессе агента: {e}")
+        job = job_queue.submit(issue_number)
+    except QueueFullError as e:
+        log.warning(f"[Webhook] Очередь переполнена, Issue #{issue_number} отклонена: {e}")
+        return JSONResponse(
+            status_code=429,
+            content={"status": "rejected", "message": str(e)},
+            headers={"Retry-After": str(settings.JOB_RETRY_AFTER)}
+        )
+    except QueueClosedError as e:
+        return JSONResponse(status_code=503, content={"status": "unavailable", "message": str(e)})
+
+    log.info(f"[Webhook] Issue #{issue_number} -> {job.id} ({job.status})")
+    return {
+        "status": "accepted",
+        "message": f"Agent started for issue #{issue_number}",
+        "job_id": job.id,
+        "job_status": job.status
+    }
 
 @app.post("/webhook")
-async def github_webhook(request: Request, background_tasks: BackgroundTasks):
+async def github_webhook(request: Request):
     """Эндпоинт для GitHub Webhooks."""
     try:
         payload = await request.json()
@@ -25,9 +60,7 @@ async def github_webhook(request: Request, background_tasks: BackgroundTasks):
     
     # Реакция на открытие Issue
     if action == "opened" and "issue" in payload:
-        issue_number = payload["issue"]["number"]
-        background_tasks.add_task(run_agent_process, issue_number)
-        return {"status": "accepted", "message": f"Agent started for issue #{issue_number}"}
+        return enqueue_issue(payload["issue"]["number"])
     
     # Реагируем на комментарии (Re-run)
     if action == "created" and "comment" in payload and "issue" in payload:
@@ -40,4 +73,26 @@ async def github_webhook(request: Request, background_tasks: BackgroundTasks):
 
 @app.get("/health")
 def health_check():
+    # Liveness без обращения к настройкам и очереди: состояние задач — в /jobs и /metrics
     return {"status": "ok", "version": "1.0.0"}
+
+@app.get("/jobs")
+def list_jobs():
+    return {"stats": job_queue.stats(), "jobs": job_queue.list_jobs()}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": f"Job '{job_id}' not found"})
+    return job.to_dict()
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Счетчики и гистограммы спанов агента (LLM, инструменты, итерации) и состояние очереди."""
+    stats = job_queue.stats()
+    gauges = "".join(
+        f"# TYPE agent_queue_{name} gauge\nagent_queue_{name} {value}\n"
+        for name, value in stats.items() if name in {"queued", "running", "workers", "max_queued"}
+    )
+    return PlainTextResponse(metrics.render() + gauges, media_type="text/plain; version=0.0.4")
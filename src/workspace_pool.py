@@ -0,0 +1,145 @@
+import os
+import subprocess
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
+
+from src.logger import log
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировок нет, рассчитываем на один запуск агента за раз
+    fcntl = None  # type: ignore[assignment]
+
+
+class WorkspaceUnavailableError(Exception):
+    """Все рабочие копии заняты дольше допустимого времени ожидания."""
+
+
+@dataclass
+class Workspace:
+    path: str
+    slot: int
+    base_commit: str
+
+
+def _git(args: List[str], cwd: str) -> str:
+    result = subprocess.run(
+        ["git", *args], cwd=cwd, capture_output=True, text=True, encoding="utf-8", errors="replace"
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args)}: {result.stderr.strip() or result.stdout.strip()}")
+    return result.stdout.strip()
+
+
+class _FileLock:
+    """Неблокирующая эксклюзивная блокировка файла (flock), видимая всем процессам."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is None:
+            self._fd = fd
+            return True
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def acquire(self):
+        while not self.try_acquire():
+            time.sleep(0.05)
+
+    def release(self):
+        if self._fd is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+
+class WorktreePool:
+    """
+    Пул заранее созданных `git worktree` для параллельных запусков агента.
+
+    Каждый слот — отдельная рабочая копия со своим lock-файлом, поэтому пулом
+    могут пользоваться несколько процессов (воркеры очереди задач). При выдаче
+    копия сбрасывается на базовый коммит через checkout --force и clean,
+    без повторного клонирования.
+    """
+
+    def __init__(self, repo_dir: str, pool_dir: str, size: int, base_ref: str = "HEAD"):
+        self.repo_dir = os.path.abspath(repo_dir)
+        self.pool_dir = os.path.abspath(pool_dir)
+        self.size = size
+        self.base_ref = base_ref
+        os.makedirs(self.pool_dir, exist_ok=True)
+
+    def _slot_path(self, slot: int) -> str:
+        return os.path.join(self.pool_dir, f"wt-{slot}")
+
+    def _resolve_base(self, base_ref: Optional[str]) -> str:
+        return _git(["rev-parse", "--verify", f"{base_ref or self.base_ref}^{{commit}}"], self.repo_dir)
+
+    def _ensure_worktree(self, slot: int, commit: str) -> str:
+        path = self._slot_path(slot)
+        if os.path.exists(os.path.join(path, ".git")):
+            return path
+
+        # git worktree add меняет общие метаданные репозитория — сериализуем между процессами
+        pool_lock = _FileLock(os.path.join(self.pool_dir, "pool.lock"))
+        pool_lock.acquire()
+        try:
+            _git(["worktree", "prune"], self.repo_dir)
+            _git(["worktree", "add", "--detach", "--force", path, commit], self.repo_dir)
+            log.info(f"[Workspace] Создана рабочая копия {path}")
+        finally:
+            pool_lock.release()
+        return path
+
+    @staticmethod
+    def _reset(path: str, commit: str):
+        _git(["checkout", "--force", "--detach", commit], path)
+        _git(["clean", "-ffdx", "--quiet"], path)
+
+    def warm(self):
+        """Создает все рабочие копии заранее, чтобы первый запуск не ждал git worktree add."""
+        commit = self._resolve_base(None)
+        for slot in range(self.size):
+            lock = _FileLock(self._slot_path(slot) + ".lock")
+            if lock.try_acquire():
+                try:
+                    self._ensure_worktree(slot, commit)
+                finally:
+                    lock.release()
+
+    @contextmanager
+    def lease(self, base_ref: Optional[str] = None, timeout: float = 600) -> Iterator[Workspace]:
+        """Выдает свободную рабочую копию, сброшенную на base_ref, на время блока with."""
+        commit = self._resolve_base(base_ref)
+        deadline = time.monotonic() + timeout
+
+        while True:
+            for slot in range(self.size):
+                lock = _FileLock(self._slot_path(slot) + ".lock")
+                if not lock.try_acquire():
+                    continue
+                try:
+                    path = self._ensure_worktree(slot, commit)
+                    self._reset(path, commit)
+                    log.info(f"[Workspace] Слот {slot} выдан ({commit[:8]})")
+                    yield Workspace(path=path, slot=slot, base_commit=commit)
+                    return
+                finally:
+                    lock.release()
+            if time.monotonic() > deadline:
+                raise WorkspaceUnavailableError(f"Нет свободных рабочих копий за {timeout} с")
+            time.sleep(0.5)
@@ -1,5 +1,13 @@
+import random
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
 import pytest
-from src.project_to_modify.transaction_service import PaymentProcessor, Transaction
+from src.project_to_modify.transaction_service import PaymentProcessor, Transaction, TransactionView
+from src.project_to_modify.transaction_store import TransactionStore
+from src.project_to_modify.transaction_table import TransactionTable, from_epoch_us, to_epoch_us
 
 
 def test_process_refund_zero_amount():
@@ -47,6 +55,20 @@ def test_process_refund_non_existent_transaction_zero_amount():
     assert result == "ERROR: Transaction not found"
 
 
+@pytest.mark.parametrize("shards", [1, 4])
+def test_process_refund_non_string_id_is_not_found(shards):
+    processor = PaymentProcessor(shards=shards)
+    processor.add_transaction("123", 10)
+    for t_id in (123, None):
+        assert processor.process_refund(t_id, 10) == "ERROR: Transaction not found"
+        assert t_id not in processor.transactions
+    assert processor.process_refunds([123, "123", None], 5) == [
+        "ERROR: Transaction not found", "SUCCESS: Refund ratio 0.50 processed", "ERROR: Transaction not found"
+    ]
+    with pytest.raises(TypeError):
+        processor.add_transaction(7, 10)
+
+
 def test_calculate_final_amount_with_tax():
     processor = PaymentProcessor(tax_rate=0.20)
     amount = 100
@@ -72,4 +94,360 @@ def test_calculate_final_amount_negative_amount():
     processor = PaymentProcessor(tax_rate=0.20)
     amount = -50
     with pytest.raises(ValueError):
-        processor.calculate_final_amount(amount, is_exempt=False)
\ No newline at end of file
+        processor.calculate_final_amount(amount, is_exempt=False)
+
+
+def test_batch_pricing_matches_scalar_methods():
+    processor = PaymentProcessor(tax_rate=0.2)
+    amounts = np.array([0.0, 1.5, 100.0, 999.99, 12345.678])
+    discounts = np.array([0, 10, 33.3, 50, 100])
+    exempt = np.array([True, False, True, False, False])
+
+    assert processor.calculate_totals_with_tax(amounts).tolist() == [processor.calculate_total_with_tax(a) for a in amounts]
+    assert processor.apply_discounts(amounts, discounts).tolist() == [
+        processor.apply_discount(a, d) for a, d in zip(amounts, discounts, strict=True)
+    ]
+    assert processor.apply_discounts(amounts, 15).tolist() == [processor.apply_discount(a, 15) for a in amounts]
+    assert processor.calculate_final_amounts(amounts, exempt).tolist() == [
+        processor.calculate_final_amount(a, e) for a, e in zip(amounts, exempt, strict=True)
+    ]
+
+
+def test_batch_pricing_validates_like_scalar_methods():
+    processor = PaymentProcessor()
+    with pytest.raises(ValueError, match="отрицательной"):
+        processor.calculate_totals_with_tax([10, -1])
+    with pytest.raises(ValueError, match="отрицательной"):
+        processor.calculate_final_amounts([-5], True)
+    with pytest.raises(ValueError, match="must be provided"):
+        processor.apply_discounts([100, 100], [10, None])
+    with pytest.raises(ValueError, match="отрицательной"):
+        processor.apply_discounts([100], [-1])
+    with pytest.raises(ValueError, match="превышать 100%"):
+        processor.apply_discounts([100, 100], [5, 110])
+
+
+def test_bulk_ingestion_behaves_like_add_transaction():
+    processor = PaymentProcessor()
+    processor.add_transaction("tx0", 5, "EUR")
+    processor.add_transactions(["tx1", "tx2", "tx1"], [10, 20, 30], ["USD", "EUR", "GBP"])
+    processor.add_transactions_from(((f"it{n}", n) for n in range(5)), chunk_size=2)
+
+    assert len(processor.transactions) == 8
+    assert processor.transactions["tx1"].amount == 30 and processor.transactions["tx1"].currency == "GBP"
+    assert processor.transactions["tx0"].currency == "EUR" and processor.transactions["it4"].status == "PENDING"
+    assert processor.process_refund("tx2", 5) == "SUCCESS: Refund ratio 0.25 processed"
+    assert processor.transactions["tx2"].status == "REFUNDED"
+
+    del processor.transactions["tx0"]
+    assert "tx0" not in processor.transactions and processor.transactions["it4"].amount == 4
+    with pytest.raises(ValueError):
+        processor.add_transactions(["a", "b"], [1])
+
+
+def test_transaction_views_write_through_to_compact_table():
+    processor = PaymentProcessor()
+    moment = datetime(2026, 3, 1, 9, 30, 15, 250001)
+    processor.transactions["tx1"] = Transaction("tx1", 12.5, "JPY", "COMPLETED", moment)
+
+    view = processor.transactions["tx1"]
+    assert isinstance(view, TransactionView)
+    assert view.to_transaction() == Transaction("tx1", 12.5, "JPY", "COMPLETED", moment)
+    view.status = "FAILED"
+    view.amount = 7
+    assert processor.transactions["tx1"].status == "FAILED" and processor.transactions["tx1"].amount == 7
+    assert processor.table.currency_codes.find("JPY") is not None
+    assert not hasattr(Transaction("t", 1, "USD", "PENDING", moment), "__dict__")
+    with pytest.raises(KeyError):
+        processor.transactions["missing"]
+
+    assert from_epoch_us(to_epoch_us(moment)) == moment
+    aware = datetime(2026, 3, 1, 9, 30, tzinfo=timezone.utc)
+    assert from_epoch_us(to_epoch_us(aware)) == aware.replace(tzinfo=None)
+
+
+def test_transaction_table_matches_dict_under_mixed_updates():
+    rng = random.Random(3)
+    table, expected = TransactionTable(capacity=4), {}
+    moment = datetime(2026, 1, 1)
+    for _ in range(2000):
+        action = rng.random()
+        if action < 0.4:
+            t_id, amount = f"id{rng.randint(0, 300)}é", rng.random()
+            table.put(t_id, amount, "USD", "PENDING", moment)
+            expected[t_id] = amount
+        elif action < 0.7:
+            ids = [f"id{rng.randint(0, 400)}é" for _ in range(rng.randint(0, 20))]
+            amounts = [rng.random() for _ in ids]
+            table.extend(ids, amounts, "EUR", "PENDING", moment)
+            expected.update(zip(ids, amounts, strict=True))
+        elif expected:
+            t_id = rng.choice(sorted(expected))
+            table.remove(t_id)
+            del expected[t_id]
+
+    assert len(table) == len(expected) and sorted(table) == sorted(expected)
+    for t_id, amount in expected.items():
+        row = table.row(t_id)
+        assert table.id_of(row) == t_id and table.amounts[row] == amount
+    assert table.find("absent") is None
+
+
+def test_queries_use_indexes_that_follow_refunds_and_updates():
+    processor = PaymentProcessor()
+    start = datetime(2026, 5, 1)
+    ids = [f"tx{n}" for n in range(12)]
+    processor.add_transactions(ids, [10.0 * (n + 1) for n in range(12)], ["USD", "EUR", "GBP"] * 4,
+                               timestamps=[start + timedelta(hours=n) for n in range(12)])
+    processor.add_transaction("late", 5, "EUR")
+
+    assert processor.process_refund("tx1", 5).startswith("SUCCESS")
+    assert processor.process_refund("tx4", 5).startswith("SUCCESS")
+    assert sorted(processor.find_transactions("REFUNDED")) == ["tx1", "tx4"]
+    assert processor.find_transactions("REFUNDED", "EUR", since=start + timedelta(hours=2)) == ["tx4"]
+    assert sorted(processor.find_transactions(currency=["GBP", "JPY"], until=start + timedelta(hours=6))) == ["tx2", "tx5"]
+    assert processor.count_transactions("PENDING", since=start + timedelta(hours=10)) == 3
+    assert processor.counts_by_status() == {"PENDING": 11, "REFUNDED": 2}
+    assert processor.totals_by_currency("REFUNDED") == {"EUR": 70.0}
+    assert processor.totals_by_currency()["EUR"] == 20 + 50 + 80 + 110 + 5
+
+    # Перезапись, правка через view и удаление переносят строки между списками индексов
+    processor.add_transaction("tx1", 1, "JPY")
+    processor.transactions["tx4"].status = "COMPLETED"
+    processor.transactions["tx7"].timestamp = start - timedelta(days=1)
+    del processor.transactions["tx0"]
+    assert processor.find_transactions("REFUNDED") == []
+    assert processor.find_transactions(currency="JPY") == ["tx1"]
+    assert processor.find_transactions(until=start) == ["tx7"]
+    assert processor.count_transactions(since=start) == len(processor.transactions) - 1
+    assert processor.find_transactions("UNKNOWN") == [] and processor.count_transactions() == 12
+
+
+def test_time_index_handles_out_of_order_timestamps():
+    rng = random.Random(5)
+    table = TransactionTable(capacity=4)
+    base = datetime(2026, 1, 1)
+    for n in range(300):
+        moment = base + timedelta(minutes=rng.randint(0, 500))
+        table.put(f"id{rng.randint(0, 200)}", 1.0, rng.choice(["USD", "EUR"]), "PENDING", moment)
+        if n % 7 == 0:
+            table.remove(table.id_of(rng.randrange(len(table))))
+        if n % 25 == 0:
+            since, until = base + timedelta(minutes=100), base + timedelta(minutes=300)
+            stamps = table.column("timestamps")
+            expected = np.flatnonzero((stamps >= to_epoch_us(since)) & (stamps < to_epoch_us(until)))
+            assert sorted(table.select(since=since, until=until).tolist()) == expected.tolist()
+            eur = table.select(currencies="EUR", since=since)
+            assert all(table.currency_of(row) == "EUR" for row in eur.tolist())
+    assert not table.time_index.in_column_order
+
+
+def _contents(processor):
+    return {t_id: processor.transactions[t_id].to_transaction() for t_id in processor.transactions}
+
+
+def test_store_restores_transactions_from_snapshot_and_journal(tmp_path):
+    with PaymentProcessor(store=TransactionStore(tmp_path)) as processor:
+        processor.add_transaction("a", 10, "EUR")
+        processor.add_transaction("b", 20)
+        processor.add_transactions(["c", "d", "c"], [1, 2, 3], ["GBP", "USD", "JPY"])
+        processor.process_refund("a", 5)
+        processor.transactions["b"].amount = 7
+        del processor.transactions["d"]
+        expected = _contents(processor)
+
+    with PaymentProcessor(store=TransactionStore(tmp_path)) as processor:
+        assert _contents(processor) == expected
+        assert processor.store.recovery["rows"] == 3
+        processor.snapshot()
+        processor.add_transaction("e", 1, "JPY")
+        processor.transactions["c"].status = "FAILED"
+        expected = _contents(processor)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["journal-000001.log", "snapshot-000001.snap"]
+
+    with PaymentProcessor(store=TransactionStore(tmp_path)) as processor:
+        assert _contents(processor) == expected
+        assert processor.find_transactions("REFUNDED") == ["a"]
+        assert processor.totals_by_currency() == {"USD": 7.0, "EUR": 10.0, "JPY": 4.0}
+        processor.add_transaction("f", 2)
+        assert "f" in processor.transactions
+
+
+def test_store_drops_torn_journal_tail(tmp_path):
+    with PaymentProcessor(store=TransactionStore(tmp_path, sync="always")) as processor:
+        processor.add_transaction("a", 10)
+        processor.add_transaction("b", 20)
+    journal = tmp_path / "journal-000000.log"
+    intact = journal.stat().st_size
+    with open(journal, "ab") as f:
+        f.write(b"\x40\x00\x00\x00partial")
+
+    with PaymentProcessor(store=TransactionStore(tmp_path)) as processor:
+        assert sorted(processor.transactions) == ["a", "b"]
+        assert journal.stat().st_size == intact
+        processor.add_transaction("c", 30)
+    with PaymentProcessor(store=TransactionStore(tmp_path)) as processor:
+        assert sorted(processor.transactions) == ["a", "b", "c"]
+
+
+def test_store_snapshots_automatically_and_keeps_bulk_loads(tmp_path):
+    ids = [f"tx{n}" for n in range(5000)]
+    store = TransactionStore(tmp_path, snapshot_bytes=64 * 1024)
+    with PaymentProcessor(store=store) as processor:
+        for n in range(0, 5000, 500):
+            processor.add_transactions(ids[n:n + 500], np.arange(n, n + 500, dtype=np.float64), "EUR")
+        for t_id in ids[::50]:
+            processor.process_refund(t_id, 0.5)
+        expected = _contents(processor)
+    # Снимок по порогу пишется в фоне; close() его дожидается
+    assert store.generation > 0
+    with PaymentProcessor(store=TransactionStore(tmp_path)) as processor:
+        assert _contents(processor) == expected
+        assert processor.count_transactions("REFUNDED") == 99
+
+
+def test_store_accepts_writes_while_snapshot_is_written(tmp_path, monkeypatch):
+    from src.project_to_modify import transaction_store
+
+    writing, release = threading.Event(), threading.Event()
+    write_snapshot = transaction_store.write_snapshot
+
+    def slow_write(path, meta, arrays):
+        writing.set()
+        release.wait(10)
+        write_snapshot(path, meta, arrays)
+
+    monkeypatch.setattr(transaction_store, "write_snapshot", slow_write)
+    with PaymentProcessor(store=TransactionStore(tmp_path)) as processor:
+        processor.add_transaction("a", 10)
+        snapshot = threading.Thread(target=processor.snapshot)
+        snapshot.start()
+        assert writing.wait(5)
+
+        def write():
+            processor.add_transaction("b", 20)
+            processor.transactions["a"].amount = 5
+
+        # Секции свободны, пока снимок пишется на диск
+        writer = threading.Thread(target=write)
+        writer.start()
+        writer.join(2)
+        blocked = writer.is_alive()
+        release.set()
+        writer.join()
+        snapshot.join()
+        assert not blocked
+        expected = _contents(processor)
+
+    with PaymentProcessor(store=TransactionStore(tmp_path)) as processor:
+        assert _contents(processor) == expected
+
+
+def test_bulk_overwrites_keep_status_and_currency_indexes_consistent():
+    rng = random.Random(3)
+    table = TransactionTable(capacity=8)
+    statuses, currencies = ["PENDING", "COMPLETED", "FAILED", "REFUNDED"], ["USD", "EUR", "GBP"]
+    for n in range(60):
+        ids = [f"id{rng.randint(0, 300)}" for _ in range(rng.randint(1, 200))]
+        table.extend(ids, np.ones(len(ids)), [rng.choice(currencies) for _ in ids],
+                     [rng.choice(statuses) for _ in ids], datetime(2026, 1, 1))
+        if n % 5 == 0:
+            table.remove(table.id_of(rng.randrange(len(table))))
+        for index, column in ((table.status_index, "statuses"), (table.currency_index, "currencies")):
+            for code in range(4):
+                rows = index.rows(code)
+                assert sorted(rows.tolist()) == np.flatnonzero(table.column(column) == code).tolist()
+                assert (index.positions[rows] == np.arange(len(rows))).all()
+
+
+@pytest.mark.parametrize("shards", [1, 4])
+def test_process_refunds_matches_process_refund(shards):
+    rng = random.Random(11)
+    ids = [f"tx{n}" for n in range(60)]
+    amounts = [0.0 if n % 13 == 0 else float(rng.randint(1, 100)) for n in range(60)]
+    batch, scalar = PaymentProcessor(shards=shards), PaymentProcessor()
+    for processor in (batch, scalar):
+        processor.add_transactions(ids, amounts, timestamps=[datetime(2026, 5, 1)] * len(ids))
+        processor.process_refund("tx5", 1)
+    requests = [(rng.choice(ids + ["missing"]), rng.choice([-1, 0, 1, 50, 150])) for _ in range(300)]
+
+    results = batch.process_refunds([t_id for t_id, _ in requests], [amount for _, amount in requests])
+    assert results == [scalar.process_refund(t_id, amount) for t_id, amount in requests]
+    assert _contents(batch) == _contents(scalar)
+    assert batch.counts_by_status() == scalar.counts_by_status()
+    assert batch.process_refunds(["tx1", "tx2"], 1.0)[0].startswith(("SUCCESS", "ERROR: Transaction already"))
+    batch.close()
+
+
+def test_concurrent_refunds_are_neither_lost_nor_doubled():
+    processor = PaymentProcessor(shards=8)
+    ids = [f"tx{n}" for n in range(4000)]
+    processor.add_transactions(ids, np.full(len(ids), 100.0))
+    successes = {t_id: 0 for t_id in ids}
+    counted = threading.Lock()
+
+    def record(batch, results):
+        with counted:
+            for t_id, result in zip(batch, results, strict=True):
+                successes[t_id] += result.startswith("SUCCESS")
+
+    def refunder(seed):
+        rng = random.Random(seed)
+        order = ids[:]
+        rng.shuffle(order)
+        for start in range(0, len(order), 500):
+            batch = order[start:start + 500]
+            if seed % 2:
+                record(batch, processor.process_refunds(batch, 10.0))
+            else:
+                record(batch, [processor.process_refund(t_id, 10.0) for t_id in batch])
+
+    def writer(seed):
+        # Новые транзакции в тех же секциях: таблицы растут и перестраивают индексы во время возвратов
+        for n in range(1500):
+            processor.add_transaction(f"new{seed}-{n}", 1.0)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=refunder, args=(seed,)) for seed in range(6)]
+        threads += [threading.Thread(target=writer, args=(seed,)) for seed in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+        processor.close()
+
+    assert set(successes.values()) == {1}
+    assert processor.counts_by_status() == {"REFUNDED": 4000, "PENDING": 3000}
+    assert sorted(processor.find_transactions("REFUNDED")) == sorted(ids)
+
+
+def test_sharded_store_reopens_with_another_shard_count(tmp_path):
+    ids = [f"tx{n}" for n in range(300)]
+    with PaymentProcessor(store=TransactionStore(tmp_path), shards=4) as processor:
+        processor.add_transactions(ids, np.arange(300, dtype=np.float64), ["USD", "EUR", "GBP"] * 100)
+        processor.process_refunds(ids[::3], 1.0)
+        processor.snapshot()
+        processor.process_refunds(ids[1::3], 1.0)
+        del processor.transactions["tx2"]
+        expected = _contents(processor)
+
+    for shards in (4, 3, 1):
+        with PaymentProcessor(store=TransactionStore(tmp_path), shards=shards) as processor:
+            assert len(processor.storage.tables) == shards
+            assert _contents(processor) == expected
+            assert processor.counts_by_status() == {"REFUNDED": 199, "PENDING": 100}
+            assert processor.totals_by_currency("REFUNDED") == {"USD": sum(range(0, 300, 3)), "EUR": sum(range(1, 300, 3))}
+
+
+def test_batch_lookup_compares_ids_with_equal_hashes():
+    first, second = "xs4ibwwl", "adwoqc8j"  # одинаковый crc32
+    table = TransactionTable()
+    table.put(first, 1.0, "USD", "PENDING", datetime(2026, 1, 1))
+    assert table.rows_of([second, first, second]).tolist() == [-1, 0, -1]
+    table.extend([second, first], [2.0, 3.0], "USD", "PENDING", datetime(2026, 1, 1))
+    assert table.rows_of([first, second]).tolist() == [0, 1]
+    assert table.column("amounts").tolist() == [3.0, 2.0]